@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Agent cold-start benchmark.
+
+Imports the entry module in fresh interpreters with ``-X importtime`` and
+reports the wall time, the slowest imports, and whether any heavy dependency
+that should be loaded lazily was pulled in at import time.
+
+    python benchmarks/startup.py                 # import mini, 5 runs
+    python benchmarks/startup.py --module brain --runs 10 --top 15
+    python benchmarks/startup.py --max-ms 800    # exit 1 if the median is slower
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# 这些依赖必须推迟到第一次使用时再导入
+DEFAULT_LAZY = ("litellm", "mcp", "openai", "pptx")
+
+_IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def _run_once(module: str) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """ 返回(总耗时秒, {模块: (自身微秒, 累计微秒)}) """
+    env = dict(os.environ, PYTHONPATH=str(ROOT))
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+
+    modules: Dict[str, Tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return elapsed, modules
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="mini", help="module to import (default: mini)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail if the median wall time exceeds this")
+    parser.add_argument(
+        "--lazy",
+        default=",".join(DEFAULT_LAZY),
+        help="comma-separated packages that must not be imported at startup ('' to disable)",
+    )
+    args = parser.parse_args(argv)
+
+    # 首次运行会生成工具集清单等缓存，不计入统计
+    _run_once(args.module)
+    timings: List[float] = []
+    modules: Dict[str, Tuple[int, int]] = {}
+    for _ in range(max(1, args.runs)):
+        elapsed, modules = _run_once(args.module)
+        timings.append(elapsed)
+
+    median_ms = statistics.median(timings) * 1000
+    print(f"import {args.module}: median {median_ms:.0f} ms, "
+          f"min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms over {len(timings)} runs")
+
+    print(f"\nslowest imports (cumulative, last run):")
+    slowest = sorted(modules.items(), key=lambda item: -item[1][1])
+    top_level = [(name, t) for name, t in slowest if "." not in name or name.startswith("src.")]
+    for name, (self_us, cumulative_us) in top_level[:args.top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {name}  (self {self_us / 1000:.1f} ms)")
+
+    failed = False
+    lazy = [name for name in args.lazy.split(",") if name]
+    eager = [name for name in lazy if name in modules]
+    if eager:
+        print(f"\nFAIL: imported at startup but should be lazy: {', '.join(eager)}")
+        failed = True
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"\nFAIL: median {median_ms:.0f} ms exceeds budget of {args.max_ms:.0f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Token cost of the tool definitions sent in mini's tool-selection prompt.
+
+Renders every registered toolset in each definition mode and reports the
+estimated token count and the time for a cold render versus a cached render.
+
+    python benchmarks/tool_definitions.py
+    python benchmarks/tool_definitions.py --toolset pptx --show compact
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from src.models.tokens import estimate_tokens  # noqa: E402
+from src.tools.registry import DEFINITION_MODES, registry, render_tool_definitions  # noqa: E402
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--toolset", action="append", help="limit to these toolsets (repeatable)")
+    parser.add_argument("--show", choices=DEFINITION_MODES, help="print the rendered text in this mode")
+    args = parser.parse_args(argv)
+
+    names = args.toolset or [entry.name for entry in registry.summaries()]
+    totals = dict.fromkeys(DEFINITION_MODES, 0)
+    print(f"{'toolset':<12}" + "".join(f"{mode:>10}" for mode in DEFINITION_MODES) + f"{'saved':>8}{'cold ms':>9}{'cached ms':>11}")
+    for name in names:
+        toolset = registry.create(name)
+        if toolset is None:
+            continue
+        tools, references = toolset.get_tools(), toolset.references()
+        tokens = {mode: estimate_tokens(render_tool_definitions(tools, references, mode)) for mode in DEFINITION_MODES}
+        for mode, count in tokens.items():
+            totals[mode] += count
+
+        registry.reset(name)
+        toolset = registry.create(name)
+        started = time.perf_counter()
+        registry.formatted_tool_definitions(toolset)
+        cold = time.perf_counter() - started
+        started = time.perf_counter()
+        for _ in range(100):
+            registry.formatted_tool_definitions(toolset)
+        cached = (time.perf_counter() - started) / 100
+
+        saved = 1 - tokens["compact"] / tokens["pretty"] if tokens["pretty"] else 0.0
+        print(f"{name:<12}" + "".join(f"{tokens[mode]:>10}" for mode in DEFINITION_MODES)
+              + f"{saved:>8.0%}{cold * 1000:>9.2f}{cached * 1000:>11.4f}")
+        if args.show:
+            print(registry.formatted_tool_definitions(toolset, args.show), end="\n\n")
+
+    saved = 1 - totals["compact"] / totals["pretty"] if totals["pretty"] else 0.0
+    print(f"{'total':<12}" + "".join(f"{totals[mode]:>10}" for mode in DEFINITION_MODES) + f"{saved:>8.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,16 @@
+import asyncio
+import inspect
 import json
 import os
-import yaml
-from typing import Any, Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
 
 from dotenv import load_dotenv
 
+from src.config import load_agent_config
 from src.tools.registry import registry, ToolSetSummary
 from src.models.litellm_model import LitellmModel
-from src.memory.core import memory  
+from src.models.response_cache import build_response_cache
+from src.memory.core import Memory, memory
 load_dotenv()
 
 
@@ -16,6 +19,8 @@ BRAIN_MODEL_NAME = os.getenv("BRAIN_MODEL_NAME", "default-model")
 BRAIN_API_KEY = os.getenv("BRAIN_API_KEY", "default-key")
 BRAIN_API_URL = os.getenv("BRAIN_API_URL", "default-url")
 BRAIN_CONFIGURED = os.getenv("BRAIN_CONFIGURED", "false").lower() == "true"
+# 工具集数量超过该值时，系统提示中只列出与请求最相关的工具集
+BRAIN_TOOLSET_LIMIT = int(os.getenv("BRAIN_TOOLSET_LIMIT", "20"))
 
 
 def _initialise_brain_model() -> Optional[LitellmModel]:
@@ -26,6 +31,7 @@ def _initialise_brain_model() -> Optional[LitellmModel]:
         model_name=BRAIN_MODEL_NAME,
         api_base=BRAIN_API_URL,
         custom_llm_provider=BRAIN_PROVIDER,
+        cache=build_response_cache(),
     )
 
 
@@ -33,21 +39,29 @@ brain_model = _initialise_brain_model()
 
 
 def _load_system_prompt_template() -> str:
-    config_path = os.path.join(os.path.dirname(__file__), "agent.yaml")
-    with open(config_path, "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    return config["brain"]["system_prompt_template"].strip()
+    return load_agent_config("brain")["system_prompt_template"].strip()
 
 
 SYSTEM_PROMPT_TEMPLATE = _load_system_prompt_template()
 
 
-def _build_system_prompt() -> str:
-    # 可使用memory获得格式化的历史记录
-    history_str = memory.get_context()
+def _select_toolsets(user_request: str, history_str: str) -> Optional[List[ToolSetSummary]]:
+    """ 工具集过多时按相关度裁剪；返回None表示列出全部 """
+    if BRAIN_TOOLSET_LIMIT <= 0 or len(registry.summaries()) <= BRAIN_TOOLSET_LIMIT:
+        return None
+    # 结合历史记录排序，避免"确认计划"这类简短回复丢失之前涉及的工具集
+    ranked = registry.rank(f"{user_request}\n{history_str}", k=BRAIN_TOOLSET_LIMIT)
+    return [entry for entry, _ in ranked] or None
+
+
+def _build_system_prompt(user_request: str = "", session_memory: Optional[Memory] = None) -> str:
+    # 可使用memory获得格式化的历史记录；多会话服务为每个会话传入各自的Memory
+    history_str = (session_memory or memory).get_context()
+    selected = _select_toolsets(user_request, history_str)
     
     return SYSTEM_PROMPT_TEMPLATE.format(
-        toolsets=registry.formatted_summaries(),
+        toolsets=registry.formatted_summaries(selected),
+        tool_schemas=registry.formatted_tool_schemas(selected),
         history=history_str
     )
 
@@ -61,21 +75,7 @@ def _fallback_response(user_request: str, reason: str) -> Dict[str, str]:
     return {"type": "question", "content": f"Brain fallback: {reason}. I'm not sure what to do. Can you clarify?"}
 
 
-def get_brain_response(user_request: str) -> Dict[str, str]:
-    if not user_request.strip():
-        return {"type": "question", "content": "Please provide a request."}
-
-    if brain_model is None:
-        return _fallback_response(user_request, "Brain model not configured")
-
-    print(f"Thinking with brain model ({BRAIN_MODEL_NAME})...")
-    try:
-        # 将最新的用户请求作为“任务”传递，提示中包含了内存中的完整历史记录
-        system_prompt = _build_system_prompt()
-        raw = brain_model.generate_response(user_request, system_prompt)
-    except Exception as exc:
-        return _fallback_response(user_request, f"Brain model failed: {exc}")
-
+def _parse_brain_output(user_request: str, raw: str) -> Dict[str, str]:
     # Parse JSON
     try:
         # 可清理markdown json块
@@ -92,4 +92,58 @@ def get_brain_response(user_request: str) -> Dict[str, str]:
         return _fallback_response(user_request, "Invalid JSON from Brain")
 
 
-__all__ = ["get_brain_response"]
+def get_brain_response(
+    user_request: str,
+    on_chunk: Optional[Callable[[str], None]] = None,
+    session_memory: Optional[Memory] = None,
+) -> Dict[str, str]:
+    if not user_request.strip():
+        return {"type": "question", "content": "Please provide a request."}
+
+    if brain_model is None:
+        return _fallback_response(user_request, "Brain model not configured")
+
+    print(f"Thinking with brain model ({BRAIN_MODEL_NAME})...")
+    try:
+        # 将最新的用户请求作为“任务”传递，提示中包含了内存中的完整历史记录
+        system_prompt = _build_system_prompt(user_request, session_memory)
+        raw = brain_model.generate_response(user_request, system_prompt, on_chunk=on_chunk)
+    except Exception as exc:
+        return _fallback_response(user_request, f"Brain model failed: {exc}")
+
+    return _parse_brain_output(user_request, raw)
+
+
+async def aget_brain_response(
+    user_request: str,
+    on_chunk: Optional[Callable[[str], Union[None, Awaitable[None]]]] = None,
+    session_memory: Optional[Memory] = None,
+) -> Dict[str, str]:
+    """
+    get_brain_response的异步版本，供多会话服务在事件循环中使用；
+    on_chunk可以是协程函数，等待它即可把下游的背压传递到模型流上。
+    """
+    if not user_request.strip():
+        return {"type": "question", "content": "Please provide a request."}
+
+    if brain_model is None:
+        return _fallback_response(user_request, "Brain model not configured")
+
+    try:
+        # 首次构建会启动各工具集以取得工具定义，放到线程中以免阻塞事件循环上的其他会话
+        system_prompt = await asyncio.to_thread(_build_system_prompt, user_request, session_memory)
+        parts = []
+        async for text in brain_model.astream_response(user_request, system_prompt):
+            parts.append(text)
+            if on_chunk is not None:
+                result = on_chunk(text)
+                if inspect.isawaitable(result):
+                    await result
+        raw = "".join(parts).strip()
+    except Exception as exc:
+        return _fallback_response(user_request, f"Brain model failed: {exc}")
+
+    return _parse_brain_output(user_request, raw)
+
+
+__all__ = ["get_brain_response", "aget_brain_response"]
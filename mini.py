@@ -1,26 +1,34 @@
 #!/usr/bin/env python3
 
+import argparse
 import json
 import os
-import yaml
-import inspect
-import re
-from typing import Any, Dict, List, Optional
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 
-from brain import get_brain_response
-from src.models.litellm_model import LitellmModel
+from brain import brain_model, get_brain_response
+from src.config import load_agent_config
+from src.environments.sandbox import caller_frame, code_sandbox, interpolate_instruction
+from src.models.litellm_model import LitellmModel, preload_litellm
+from src.models.response_cache import build_response_cache
+from src.tools.plan import ToolPlan, ToolPlanError
 from src.tools.protocol import Tool, ToolSet
 from src.tools.registry import registry
+from src.tools.schema import validate_arguments
+from src.tools.script_utils import ArrayFieldScanner, CodeTool
+from src.tools.warmup import toolset_warmer
 from src.memory.core import memory  
 
 load_dotenv()
 
-# Load agent.yaml
-with open(os.path.join(os.path.dirname(__file__), "agent.yaml"), "r", encoding="utf-8") as f:
-    AGENT_CONFIG = yaml.safe_load(f)
-    MINI_CONFIG = AGENT_CONFIG.get("mini", {})
+# agent.yaml与brain共享同一份解析结果
+MINI_CONFIG = load_agent_config("mini")
 
 
 MINI_PROVIDER = os.getenv("MINI_PROVIDER", "default-provider")
@@ -28,8 +36,28 @@ MINI_MODEL_NAME = os.getenv("MINI_MODEL_NAME", "default-model")
 MINI_API_KEY = os.getenv("MINI_API_KEY", "default-key")
 MINI_API_URL = os.getenv("MINI_API_URL", "default-url")
 MINI_CONFIGURED = os.getenv("MINI_CONFIGURED", "false").lower() == "true"
+# 流式显示brain的输出，避免长代码生成时控制台长时间无响应
+BRAIN_STREAM = os.getenv("BRAIN_STREAM", "false").lower() == "true"
+# 启动时从会话日志恢复：'last' 表示最近的会话，也可填写具体的会话id
+MEMORY_RESUME = os.getenv("MEMORY_RESUME", "")
+MEMORY_RESUME_TURNS = int(os.getenv("MEMORY_RESUME_TURNS", "0")) or None
+
+# run_toolset_async / run_toolsets_parallel 的并发上限
+TOOLSET_CONCURRENCY = max(1, int(os.getenv("TOOLSET_CONCURRENCY", "4")))
+
+# brain思考期间按用户输入预热最可能用到的工具集
+SPECULATIVE_WARMUP = os.getenv("SPECULATIVE_WARMUP", "true").lower() == "true"
+SPECULATIVE_WARMUP_TOOLSETS = max(1, int(os.getenv("SPECULATIVE_WARMUP_TOOLSETS", "2")))
+# 工具选择流式返回：可流式传参的工具（如幻灯片）在模型仍在输出时就开始逐条处理参数
+MINI_STREAM_TOOLS = os.getenv("MINI_STREAM_TOOLS", "true").lower() == "true"
+# 工具选择提示中工具定义的渲染方式：compact | minified | pretty
+MINI_TOOL_DEFINITIONS = os.getenv("MINI_TOOL_DEFINITIONS", "compact").lower()
+# --warmup 启动阶段等待全部工具集就绪的上限（秒，0表示不限）
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "60")) or None
 
 MINI_LLM: Optional[LitellmModel] = None
+_TOOLSET_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_TOOLSET_EXECUTOR_LOCK = threading.Lock()
 
 
 def _initialise_mini_model() -> Optional[LitellmModel]:
@@ -41,21 +69,29 @@ def _initialise_mini_model() -> Optional[LitellmModel]:
         model_name=MINI_MODEL_NAME,
         api_base=MINI_API_URL,
         custom_llm_provider=MINI_PROVIDER,
+        cache=build_response_cache(),
     )
 
 
-def _format_tool_definitions(tools: List[Tool]) -> str:
-    return json.dumps([tool.get_definition() for tool in tools], indent=2, ensure_ascii=False)
+def _format_tool_definitions(toolset: ToolSet) -> str:
+    return registry.formatted_tool_definitions(toolset, MINI_TOOL_DEFINITIONS)
 
 
-def _select_tool_and_args(user_request: str, tools: List[Tool], llm: LitellmModel) -> Optional[Dict[str, Any]]:
-    prompt = MINI_CONFIG["tool_selection_user_template"].format(
+def _tool_selection_prompt(user_request: str, toolset: ToolSet) -> str:
+    return MINI_CONFIG["tool_selection_user_template"].format(
         user_request=user_request,
-        tool_definitions=_format_tool_definitions(tools)
+        tool_definitions=_format_tool_definitions(toolset)
     )
+
+
+def _select_tool_and_args(user_request: str, toolset: ToolSet, llm: LitellmModel) -> Optional[Any]:
+    prompt = _tool_selection_prompt(user_request, toolset)
     template = MINI_CONFIG["tool_selection_system_prompt"]
     response = llm.generate_response(task=prompt, template=template)
+    return _parse_selection(response)
+
 
+def _parse_selection(response: str) -> Optional[Any]:
     try:
         json_str = response.strip()
         if "```json" in json_str:
@@ -72,13 +108,156 @@ def _select_tool_and_args(user_request: str, tools: List[Tool], llm: LitellmMode
         return None
 
 
+class _StreamedCall:
+    """
+    工具选择仍在生成时就已开始的流式工具调用：流式参数的元素一到达就经execute_stream交给脚本。
+    模型输出结束后，只有最终选择与已流式发送的内容完全一致才采用其结果，否则中止（脚本不会保存文件）。
+    """
+
+    _END = object()
+
+    def __init__(self, tool: CodeTool, arguments: Dict[str, Any]):
+        self.tool = tool
+        self.arguments = arguments
+        self.items: List[Any] = []
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._result: "Future[Any]" = Future()
+        threading.Thread(target=self._run, name=f"stream-{tool.name}", daemon=True).start()
+
+    def _iter_items(self):
+        while True:
+            item = self._queue.get()
+            if item is self._END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def _run(self) -> None:
+        try:
+            self._result.set_result(self.tool.execute_stream(self._iter_items(), **self.arguments))
+        except BaseException as e:
+            self._result.set_exception(e)
+
+    def put(self, item: Any) -> None:
+        self.items.append(item)
+        self._queue.put(item)
+
+    def abort(self, reason: str) -> None:
+        self._queue.put(RuntimeError(reason))
+        try:
+            self._result.result()
+        except Exception:
+            pass
+
+    def complete(self, plan: Optional[ToolPlan]) -> Optional[str]:
+        """ 最终选择与流式内容一致时结束流并返回工具输出；否则中止并返回None，交由常规路径执行 """
+        field = self.tool.stream_field
+        call = plan.calls[0] if plan is not None and len(plan.calls) == 1 else None
+        if (
+            call is None
+            or call.tool != self.tool.name
+            or {k: v for k, v in call.arguments.items() if k != field} != self.arguments
+            or call.arguments.get(field) != self.items
+        ):
+            self.abort("final tool selection differs from the streamed call")
+            return None
+        self._queue.put(self._END)
+        try:
+            return str(self._result.result())
+        except Exception as e:
+            return f"Error executing script: {e}"
+
+
+def _select_tool_streaming(
+    user_request: str,
+    toolset: ToolSet,
+    llm: LitellmModel,
+    streamable: Dict[str, CodeTool],
+) -> Tuple[Optional[Any], Optional[_StreamedCall]]:
+    """
+    流式请求工具选择：若选择是对可流式工具的单个调用，在其流式参数的数组开始时就启动工具，
+    之后每个元素完整到达即发送，文件随模型输出同步构建。
+    """
+    prompt = _tool_selection_prompt(user_request, toolset)
+    template = MINI_CONFIG["tool_selection_system_prompt"]
+    scanners = {field: ArrayFieldScanner(field) for field in {tool.stream_field for tool in streamable.values()}}
+    streamed: Optional[_StreamedCall] = None
+    active: Optional[ArrayFieldScanner] = None
+    parts: List[str] = []
+    started = False
+    try:
+        for text in llm.stream_response(prompt, template):
+            parts.append(text)
+            if not started:
+                # 跳过JSON之前的内容（如markdown代码围栏）
+                start = min((i for i in (text.find("{"), text.find("[")) if i >= 0), default=-1)
+                if start < 0:
+                    continue
+                started, text = True, text[start:]
+            if streamed is None and scanners:
+                for field, scanner in list(scanners.items()):
+                    try:
+                        items = scanner.feed(text)
+                    except ValueError:
+                        del scanners[field]
+                        continue
+                    if scanner.head is not None:
+                        streamed = _start_streamed_call(scanner.head, field, streamable)
+                        if streamed is None:
+                            scanners.clear()
+                            break
+                        active = scanner
+                        for item in items:
+                            streamed.put(item)
+                        break
+            elif active is not None and not active.closed:
+                for item in active.feed(text):
+                    streamed.put(item)
+    except BaseException:
+        if streamed is not None:
+            streamed.abort("tool selection stream failed")
+        raise
+    return _parse_selection("".join(parts).strip()), streamed
+
+
+def _start_streamed_call(head: Any, field: str, streamable: Dict[str, CodeTool]) -> Optional[_StreamedCall]:
+    """ head为流式数组开始前的选择；只有第一个调用且其流式字段正是该数组时才开始流式执行 """
+    try:
+        plan = ToolPlan.parse(head)
+    except ToolPlanError:
+        return None
+    if plan is None or len(plan.calls) != 1:
+        return None
+    call = plan.calls[0]
+    tool = streamable.get(call.tool)
+    if tool is None or tool.stream_field != field or call.arguments.get(field) != [] or call.depends_on:
+        return None
+    arguments = {k: v for k, v in call.arguments.items() if k != field}
+    if "return_bytes" in arguments:
+        return None
+    print(f"正在流式执行工具: {call.tool}，参数: {arguments}")
+    return _StreamedCall(tool, arguments)
+
+
 def _execute_tool(toolset: ToolSet, user_request: str, llm: LitellmModel) -> str:
     tools = toolset.get_tools()
     if not tools:
         return f"工具集 '{toolset.name}' 未提供任何工具。"
 
-    selection = _select_tool_and_args(user_request, tools, llm)
-    if not selection or "tool" not in selection:
+    streamable = {t.name: t for t in tools if isinstance(t, CodeTool) and t.stream_field} if MINI_STREAM_TOOLS else {}
+    if streamable:
+        selection, streamed = _select_tool_streaming(user_request, toolset, llm, streamable)
+    else:
+        selection, streamed = _select_tool_and_args(user_request, toolset, llm), None
+    try:
+        plan = ToolPlan.parse(selection)
+    except ToolPlanError as e:
+        print(f"工具调用计划无效: {e}")
+        plan = None
+    streamed_output = streamed.complete(plan) if streamed is not None else None
+
+    if plan is None:
         # 回退机制
         print(f"未找到匹配工具，尝试使用 LLM 直接回答: {user_request}")
         fallback_prompt = MINI_CONFIG["generic_request_template"].format(
@@ -89,16 +268,29 @@ def _execute_tool(toolset: ToolSet, user_request: str, llm: LitellmModel) -> str
         fallback_response = llm.generate_response(task=full_fallback_prompt, template="You are a helpful assistant.")
         return fallback_response
 
-    tool_name = selection["tool"]
-    arguments = selection.get("arguments", {})
-    
-    chosen_tool: Optional[Tool] = next((t for t in tools if t.name == tool_name), None)
-    if not chosen_tool:
-        return f"选择的工具 '{tool_name}' 在工具集 '{toolset.name}' 中不存在。"
+    tools_by_name = {t.name: t for t in tools}
+    missing = [call.tool for call in plan.calls if call.tool not in tools_by_name]
+    if missing:
+        return f"选择的工具 '{missing[0]}' 在工具集 '{toolset.name}' 中不存在。"
 
+    tool_name = ", ".join(dict.fromkeys(call.tool for call in plan.calls))
     try:
-        print(f"正在执行工具: {tool_name}，参数: {arguments}")
-        tool_output = chosen_tool.execute(**arguments)
+        if streamed_output is not None:
+            # 已在模型输出期间流式执行完毕
+            results = {plan.calls[0].id: streamed_output}
+        else:
+            results = plan.execute(
+                tools_by_name,
+                on_call=lambda call, arguments: print(f"正在执行工具: {call.tool}，参数: {arguments}"),
+            )
+        if len(plan.calls) == 1:
+            tool_output = results[plan.calls[0].id]
+        else:
+            # 多步计划：逐条列出结果，最后一行是最终步骤的输出
+            tool_output = "\n".join(
+                f"{call.tool}({', '.join(f'{k}={v}' for k, v in call.arguments.items())}) = {results[call.id]}"
+                for call in plan.calls
+            )
         print(f"工具输出: {tool_output}")
 
         # 稳健性要求：如果工具返回了原始数据，请用LLM对其进行格式化
@@ -121,33 +313,22 @@ def _execute_tool(toolset: ToolSet, user_request: str, llm: LitellmModel) -> str
         return f"执行工具 '{tool_name}' 时出错: {e}"
 
 
-def run_toolset(name: str, instruction: str) -> str:
-    """
-    Exposed API for the generated script to call a toolset.
-    """
-    # 稳健性修复：如果f-string失败，则自动插值变量
-    # #如果指令包含{var_name}并且该var存在于调用者的作用域中，则替换它。
-    try:
-    #我们通过确保括号后面没有引号来避免匹配像{“key”：…}这样的JSON结构。
-    #像{content}这样的简单变量将被匹配。
-        if re.search(r'\{[a-zA-Z_]\w*\}', instruction):
-            frame = inspect.currentframe()
-            if frame and frame.f_back:
-                caller_locals = frame.f_back.f_locals
-                
-                def replacer(match):
-                    var_name = match.group(0)[1:-1] # remove braces
-                    if var_name in caller_locals:
-                        val = caller_locals[var_name]
-                        return str(val)
-                    return match.group(0)
-                
-                new_instruction = re.sub(r'\{([a-zA-Z_]\w*)\}', replacer, instruction)
-                if new_instruction != instruction:
-                    instruction = new_instruction
-    except Exception as e:
-        print(f"DEBUG: Auto-interpolation failed: {e}")
+def _print_stream_chunk(text: str) -> None:
+    print(text, end="", flush=True)
+
 
+def _print_generation_metrics(model: Optional[LitellmModel]) -> None:
+    metrics = model.last_metrics if model else None
+    if metrics is None or metrics.time_to_first_token is None:
+        return
+    if metrics.cached:
+        print("\n(命中响应缓存)")
+        return
+    throughput = f"{metrics.tokens_per_second:.1f} tok/s" if metrics.tokens_per_second else "N/A"
+    print(f"\n(首token {metrics.time_to_first_token:.2f}s | 总耗时 {metrics.total_time:.2f}s | {throughput})")
+
+
+def _run_toolset(name: str, instruction: str) -> str:
     print(f"\n>>> 调用工具集: {name} | 指令: {instruction}")
     
     if MINI_LLM is None:
@@ -156,6 +337,7 @@ def run_toolset(name: str, instruction: str) -> str:
     toolset_instance = registry.create(name)
     if not toolset_instance:
         return f"Error: Toolset '{name}' not found."
+    toolset_warmer.mark_used(name)
 
     try:
         result = _execute_tool(toolset_instance, instruction, MINI_LLM)
@@ -166,11 +348,168 @@ def run_toolset(name: str, instruction: str) -> str:
         raise  
 
 
-def main() -> None:
+def run_toolset(name: str, instruction: str) -> str:
+    """
+    Exposed API for the generated script to call a toolset.
+    """
+    return _run_toolset(name, interpolate_instruction(instruction, caller_frame()))
+
+
+def call_tool(toolset: str, tool: str, /, **arguments: Any) -> str:
+    """
+    Exposed API: call one tool directly with structured arguments, skipping the
+    mini LLM's tool selection. Arguments are validated against the tool schema.
+    """
+    print(f"\n>>> 直接调用工具: {toolset}.{tool} | 参数: {arguments}")
+
+    toolset_instance = registry.create(toolset)
+    if not toolset_instance:
+        return f"Error: Toolset '{toolset}' not found."
+    toolset_warmer.mark_used(toolset)
+
+    chosen_tool: Optional[Tool] = next((t for t in toolset_instance.get_tools() if t.name == tool), None)
+    if not chosen_tool:
+        return f"Error: Tool '{tool}' not found in toolset '{toolset}'."
+
+    errors = validate_arguments(chosen_tool.get_definition().get("parameters") or {}, arguments)
+    if errors:
+        return f"Error: Invalid arguments for '{toolset}.{tool}': " + "; ".join(errors)
+
+    try:
+        result = str(chosen_tool.execute(**arguments))
+    except Exception as e:
+        return f"执行工具 '{tool}' 时出错: {e}"
+    print(f"<<< 工具返回: {result}\n")
+    return result
+
+
+def _toolset_executor() -> ThreadPoolExecutor:
+    global _TOOLSET_EXECUTOR
+    with _TOOLSET_EXECUTOR_LOCK:
+        if _TOOLSET_EXECUTOR is None:
+            _TOOLSET_EXECUTOR = ThreadPoolExecutor(
+                max_workers=TOOLSET_CONCURRENCY,
+                thread_name_prefix="run-toolset",
+            )
+        return _TOOLSET_EXECUTOR
+
+
+def run_toolset_async(name: str, instruction: str) -> Future:
+    """
+    Exposed API: start a toolset call in the background and return a Future.
+    Call .result() on it to get the same string run_toolset would return.
+    """
+    instruction = interpolate_instruction(instruction, caller_frame())
+    return _toolset_executor().submit(_run_toolset, name, instruction)
+
+
+def run_toolsets_parallel(calls: List[Tuple[str, str]]) -> List[str]:
+    """
+    Exposed API: run independent (name, instruction) toolset calls concurrently,
+    at most TOOLSET_CONCURRENCY at a time. Results keep the order of `calls`.
+    """
+    frame = caller_frame()
+    executor = _toolset_executor()
+    futures = [
+        executor.submit(_run_toolset, name, interpolate_instruction(instruction, frame))
+        for name, instruction in calls
+    ]
+    return [future.result() for future in futures]
+
+
+def _run_toolset_limited(name: str, instruction: str) -> str:
+    # 沙箱中发起的工具集调用同样受TOOLSET_CONCURRENCY限制
+    return _toolset_executor().submit(_run_toolset, name, instruction).result()
+
+
+# 沙箱代码中的run_toolset*/call_tool经IPC在agent进程中执行（指令已在沙箱中完成插值）
+_SANDBOX_HANDLERS = {"run_toolset": _run_toolset_limited, "call_tool": call_tool}
+
+
+@lru_cache(maxsize=1)
+def _optional_pptx() -> Dict[str, Any]:
+    """ pptx为可选依赖，只尝试导入一次 """
+    try:
+        from pptx import Presentation
+        from io import BytesIO
+    except ImportError:
+        return {"Presentation": None, "BytesIO": None}
+    return {"Presentation": Presentation, "BytesIO": BytesIO}
+
+
+def _execution_context() -> Dict[str, Any]:
+    """ 进程内执行（SANDBOX_WORKERS=0）时生成代码可用的名称 """
+    return {
+        "run_toolset": run_toolset,
+        "run_toolset_async": run_toolset_async,
+        "run_toolsets_parallel": run_toolsets_parallel,
+        "call_tool": call_tool,
+        "print": print,
+        "range": range,
+        "len": len,
+        "str": str,
+        "int": int,
+        "list": list,
+        "dict": dict,
+        **_optional_pptx(),
+    }
+
+
+def _warm_up_toolsets() -> None:
+    """ 启动时并发拉起全部已注册工具集，使第一个真实请求就能用上热连接 """
+    print("正在预热工具集...")
+    started = time.perf_counter()
+    results = toolset_warmer.warm_all(timeout=WARMUP_TIMEOUT)
+    for result in results:
+        if result.ready:
+            print(f"  [ok]   {result.name}: {result.seconds * 1000:.0f} ms")
+        else:
+            print(f"  [fail] {result.name}: {result.error}")
+    ready = sum(result.ready for result in results)
+    print(f"工具集预热完成：{ready}/{len(results)} 就绪，用时 {time.perf_counter() - started:.2f} s")
+
+
+def _print_warmup_stats() -> None:
+    """ 退出时汇报推测预热的效果：命中（推测的工具集被用到）、未命中与白白预热的次数 """
+    stats = toolset_warmer.stats()
+    if not stats["speculations"]:
+        return
+    print(
+        f"推测预热：{stats['speculations']} 轮，命中 {stats['speculation_hits']}，"
+        f"未命中 {stats['speculation_misses']}，浪费 {stats['speculation_wasted']}"
+        f"（取消 {stats['cancelled']}），命中率 {stats['speculation_hit_rate']:.0%}"
+    )
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mini agent")
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="start every registered toolset concurrently before accepting requests",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+
     global MINI_LLM
     MINI_LLM = _initialise_mini_model()
     if not MINI_LLM:
         return
+    # 在等待用户输入时于后台导入litellm、启动沙箱worker
+    preload_litellm()
+    if code_sandbox.enabled:
+        threading.Thread(target=code_sandbox.warm, name="sandbox-warmup", daemon=True).start()
+
+    if args.warmup:
+        _warm_up_toolsets()
+
+    if MEMORY_RESUME:
+        session_id = None if MEMORY_RESUME.lower() == "last" else MEMORY_RESUME
+        restored = memory.resume(session_id, last_n=MEMORY_RESUME_TURNS)
+        print(f"已恢复会话 {memory.session_id}，共 {restored} 条消息。")
     
     print("Agent 已启动。请输入你的需求 (输入 'exit' 退出)。")
 
@@ -192,11 +531,18 @@ def main() -> None:
             break
 
         memory.add_message("user", user_input)
+        if SPECULATIVE_WARMUP:
+            toolset_warmer.speculate(user_input, SPECULATIVE_WARMUP_TOOLSETS)
 
         try:
-            response = get_brain_response(user_input)
+            if BRAIN_STREAM:
+                response = get_brain_response(user_input, on_chunk=_print_stream_chunk)
+                _print_generation_metrics(brain_model)
+            else:
+                response = get_brain_response(user_input)
         except KeyboardInterrupt:
             print("\n[用户中断了思考]")
+            toolset_warmer.finish()
             continue  
         
         resp_type = response.get("type", "question")
@@ -213,29 +559,12 @@ def main() -> None:
             
         elif resp_type == "code":
             print("\nAgent: 正在执行任务...")
-            execution_context = {
-                "run_toolset": run_toolset,
-                "print": print,
-                "range": range,
-                "len": len,
-                "str": str,
-                "int": int,
-                "list": list,
-                "dict": dict,
-                "Presentation": None, 
-                "BytesIO": None     
-            }
-            
-            try:
-                from pptx import Presentation
-                from io import BytesIO
-                execution_context["Presentation"] = Presentation
-                execution_context["BytesIO"] = BytesIO
-            except ImportError:
-                pass
-
             try:
-                exec(content, execution_context)
+                if code_sandbox.enabled:
+                    # 在预热的沙箱worker中执行，受CPU/内存/时间限制；Ctrl+C会取消执行
+                    code_sandbox.run(content, handlers=_SANDBOX_HANDLERS)
+                else:
+                    exec(content, _execution_context())
                 # 回退后要保留历史记录以便后续解答用户问题
                 memory.add_message("assistant", "Task executed successfully.")
             except KeyboardInterrupt:
@@ -248,5 +577,9 @@ def main() -> None:
         else:
             print(f"Unknown response type: {resp_type}")
 
+        toolset_warmer.finish()
+
+    _print_warmup_stats()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+多会话agent服务：python server.py [--host 127.0.0.1] [--port 8080] [--warmup]
+
+每个会话有独立的Memory；模型客户端、工具集注册表、MCP会话池与代码沙箱在所有会话间共享。
+HTTP/1.1 接口（请求与响应均为JSON）：
+  POST   /sessions                 新建会话；body可带本服务签发的 {"session_id": ...} 从会话日志恢复
+  GET    /sessions/{id}            会话历史
+  DELETE /sessions/{id}            结束会话
+  POST   /sessions/{id}/messages   body {"text": ...}；响应以分块传输的NDJSON逐条推送进度事件，
+                                   以 {"event": "done"} 结束
+  GET    /health                   会话数、排队情况与工具集预热统计
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+import mini
+from brain import aget_brain_response
+from src.environments.sandbox import code_sandbox
+from src.memory.core import Memory, create_memory
+from src.models.litellm_model import preload_litellm
+from src.tools.warmup import toolset_warmer
+
+load_dotenv()
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8080"))
+# 内存中最多保留的会话数；超出时淘汰最久未活动的空闲会话
+SERVER_MAX_SESSIONS = int(os.getenv("SERVER_MAX_SESSIONS", "1000"))
+SERVER_SESSION_IDLE_TIMEOUT = float(os.getenv("SERVER_SESSION_IDLE_TIMEOUT", "3600"))
+# 全局同时处理的对话轮次上限，以及允许排队等待的轮次数（超出返回503）
+SERVER_MAX_CONCURRENT_TURNS = max(1, int(os.getenv("SERVER_MAX_CONCURRENT_TURNS", "64")))
+SERVER_MAX_QUEUED_TURNS = int(os.getenv("SERVER_MAX_QUEUED_TURNS", "256"))
+# 单个会话同时处理的轮次，以及处理中加排队的上限（超出返回429）
+SERVER_SESSION_CONCURRENCY = max(1, int(os.getenv("SERVER_SESSION_CONCURRENCY", "1")))
+SERVER_SESSION_MAX_PENDING = max(1, int(os.getenv("SERVER_SESSION_MAX_PENDING", "4")))
+# 每个响应流缓冲的事件数；客户端读取变慢时生产方在此等待
+SERVER_EVENT_BUFFER = max(1, int(os.getenv("SERVER_EVENT_BUFFER", "64")))
+SERVER_MAX_BODY_BYTES = int(os.getenv("SERVER_MAX_BODY_BYTES", str(1024 * 1024)))
+SERVER_READ_TIMEOUT = float(os.getenv("SERVER_READ_TIMEOUT", "30"))
+
+# 服务签发的会话id带不可猜测的随机token，持有id即可访问会话；
+# 只允许恢复这种id，REPL等其他来源写入日志的会话无法经由服务读取
+_SESSION_ID_PREFIX = "srv-"
+_SESSION_ID_PATTERN = re.compile(r"srv-[A-Za-z0-9_-]{32}")
+
+_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    408: "Request Timeout", 411: "Length Required", 413: "Payload Too Large",
+    429: "Too Many Requests", 503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class Session:
+    """ 一个对话会话：独立的Memory与轮次并发限制 """
+
+    def __init__(self, session_id: str, memory: Memory):
+        self.id = session_id
+        self.memory = memory
+        self.semaphore = asyncio.Semaphore(SERVER_SESSION_CONCURRENCY)
+        self.pending = 0
+        self.last_active = time.monotonic()
+
+
+# 客户端断开时放入事件队列的标记
+_DISCONNECTED: Dict[str, Any] = {"event": "disconnected"}
+
+
+class EventStream:
+    """
+    一个轮次的进度事件：有界队列，写满时生产方等待，背压从客户端连接一直传到模型流与沙箱输出。
+    客户端断开后关闭，之后的事件直接丢弃。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self._loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize)
+        self.closed = False
+
+    async def emit(self, event: str, **fields: Any) -> None:
+        if not self.closed:
+            await self.queue.put({"event": event, **fields})
+
+    def emit_threadsafe(self, event: str, **fields: Any) -> None:
+        """ 供沙箱输出与工具调用线程使用：阻塞到事件进入队列 """
+        if self.closed:
+            return
+        future = asyncio.run_coroutine_threadsafe(self.emit(event, **fields), self._loop)
+        with contextlib.suppress(Exception):
+            future.result()
+
+    def close(self) -> None:
+        # 清空队列，唤醒正在等待的生产方
+        self.closed = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+    def disconnect(self) -> None:
+        """ 客户端已断开：丢弃未发送的事件，并唤醒等待事件的响应方 """
+        self.close()
+        self.queue.put_nowait(_DISCONNECTED)
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers: Dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        if len(headers) >= 100:
+            raise HttpError(400, "Too many headers")
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "transfer-encoding" in headers:
+        raise HttpError(411, "Chunked request bodies are not supported; send Content-Length")
+    try:
+        length = int(headers.get("content-length", "0"))
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > SERVER_MAX_BODY_BYTES:
+        raise HttpError(413, f"Request body is larger than {SERVER_MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target.split("?", 1)[0], headers, body
+
+
+async def _wait_disconnect(reader: asyncio.StreamReader, pipelined: List[bytes]) -> None:
+    """ 读到EOF（客户端关闭或断开连接）时返回；期间到达的数据记录在pipelined中 """
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            return
+        pipelined.append(data)
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {_REASONS.get(status, 'OK')}"]
+    lines += [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool = True) -> None:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(_head(status, {
+        "Content-Type": "application/json; charset=utf-8",
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }) + body)
+    await writer.drain()
+
+
+def _json_body(body: bytes) -> Dict[str, Any]:
+    if not body:
+        return {}
+    try:
+        data = json.loads(body)
+    except json.JSONDecodeError:
+        raise HttpError(400, "Body is not valid JSON")
+    if not isinstance(data, dict):
+        raise HttpError(400, "Body must be a JSON object")
+    return data
+
+
+class AgentServer:
+    """ 在一个进程、一个事件循环中服务多个并发会话 """
+
+    def __init__(self):
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.turn_slots = asyncio.Semaphore(SERVER_MAX_CONCURRENT_TURNS)
+        self.active_turns = 0
+        self.queued_turns = 0
+
+    # ---- 会话 ----
+
+    def _evict(self) -> None:
+        """ 淘汰超时的空闲会话；会话数仍超限时按最久未活动淘汰空闲会话 """
+        now = time.monotonic()
+        for session in list(self.sessions.values()):
+            if session.pending == 0 and now - session.last_active > SERVER_SESSION_IDLE_TIMEOUT:
+                del self.sessions[session.id]
+        idle = [session for session in self.sessions.values() if session.pending == 0]
+        while len(self.sessions) >= SERVER_MAX_SESSIONS and idle:
+            del self.sessions[idle.pop(0).id]
+
+    async def create_session(self, session_id: Optional[str] = None) -> Tuple[Session, int]:
+        session_id = session_id or None
+        if session_id is not None and (
+            not isinstance(session_id, str) or not _SESSION_ID_PATTERN.fullmatch(session_id)
+        ):
+            raise HttpError(404, "Only sessions issued by this server can be resumed")
+        if session_id in self.sessions:
+            return self.sessions[session_id], len(self.sessions[session_id].memory.get_history())
+        self._evict()
+        if len(self.sessions) >= SERVER_MAX_SESSIONS:
+            raise HttpError(503, "Too many active sessions")
+
+        def load() -> Tuple[Memory, int]:
+            # 恢复需要扫描日志索引并解析整段会话，放到线程中避免阻塞其他会话的流
+            memory = create_memory(session_id or _SESSION_ID_PREFIX + secrets.token_urlsafe(24))
+            restored = memory.resume(session_id, last_n=mini.MEMORY_RESUME_TURNS) if session_id else 0
+            return memory, restored
+
+        memory, restored = await asyncio.to_thread(load)
+        if session_id in self.sessions:
+            # 等待期间同一会话已被另一请求恢复
+            return self.sessions[session_id], len(self.sessions[session_id].memory.get_history())
+        if session_id and not restored:
+            raise HttpError(404, f"Session '{session_id}' not found")
+        session = Session(memory.session_id, memory)
+        self.sessions[session.id] = session
+        return session, restored
+
+    def get_session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, f"Session '{session_id}' not found")
+        session.last_active = time.monotonic()
+        self.sessions.move_to_end(session_id)
+        return session
+
+    # ---- 对话轮次 ----
+
+    def _handlers(self, events: EventStream) -> Dict[str, Callable[..., str]]:
+        """ 沙箱代码中run_toolset/call_tool的实现：执行前后各推送一个进度事件 """
+
+        def run_toolset(name: str, instruction: str) -> str:
+            events.emit_threadsafe("tool_call", toolset=name, instruction=instruction)
+            result = mini._run_toolset_limited(name, instruction)
+            events.emit_threadsafe("tool_result", toolset=name, result=result)
+            return result
+
+        def call_tool(toolset: str, tool: str, /, **arguments: Any) -> str:
+            events.emit_threadsafe("tool_call", toolset=toolset, tool=tool, arguments=arguments)
+            result = mini.call_tool(toolset, tool, **arguments)
+            events.emit_threadsafe("tool_result", toolset=toolset, tool=tool, result=result)
+            return result
+
+        return {"run_toolset": run_toolset, "call_tool": call_tool}
+
+    async def _execute_code(self, content: str, events: EventStream) -> None:
+        output = lambda text: events.emit_threadsafe("stdout", text=text)
+        if not code_sandbox.enabled:
+            # SANDBOX_WORKERS=0：在线程中执行，只转发print输出（无法中途取消）
+            context = {**mini._execution_context(), "print": lambda *args, sep=" ", end="\n", **_: output(sep.join(map(str, args)) + end)}
+            await asyncio.to_thread(exec, content, context)
+            return
+        job = code_sandbox.submit(content, handlers=self._handlers(events), output=output)
+        try:
+            await asyncio.wrap_future(job.as_future())
+        except asyncio.CancelledError:
+            job.cancel()
+            raise
+
+    async def run_turn(self, session: Session, text: str, events: EventStream) -> None:
+        memory = session.memory
+        try:
+            # 写入会话日志时可能fsync：Memory的写入都放到线程中，不阻塞其他会话
+            await asyncio.to_thread(memory.add_message, "user", text)
+            await events.emit("thinking")
+            response = await aget_brain_response(
+                text,
+                on_chunk=lambda chunk: events.emit("token", text=chunk),
+                session_memory=memory,
+            )
+            resp_type = response.get("type", "question")
+            content = response.get("content", "")
+
+            if resp_type in ("question", "plan"):
+                await asyncio.to_thread(memory.add_message, "assistant", content)
+                await events.emit(resp_type, content=content)
+            elif resp_type == "code":
+                await events.emit("code", content=content)
+                try:
+                    await self._execute_code(content, events)
+                    await asyncio.to_thread(memory.add_message, "assistant", "Task executed successfully.")
+                    await events.emit("done", status="ok")
+                except Exception as e:
+                    await asyncio.to_thread(memory.add_message, "assistant", f"Execution failed: {e}")
+                    await events.emit("done", status="error", error=str(e))
+                return
+            else:
+                await events.emit("error", error=f"Unknown response type: {resp_type}")
+            await events.emit("done", status="ok")
+        except asyncio.CancelledError:
+            # 客户端断开：与REPL中的Ctrl+C一样记录中断
+            await asyncio.to_thread(memory.add_message, "assistant", "Task interrupted by user.")
+            raise
+        except Exception as e:
+            await events.emit("done", status="error", error=str(e))
+
+    async def handle_message(
+        self,
+        session: Session,
+        body: Dict[str, Any],
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        text = str(body.get("text", "")).strip()
+        if not text:
+            raise HttpError(400, "Field 'text' is required")
+        if session.pending >= SERVER_SESSION_MAX_PENDING:
+            raise HttpError(429, f"Session already has {session.pending} requests in progress")
+        if self.active_turns >= SERVER_MAX_CONCURRENT_TURNS and self.queued_turns >= SERVER_MAX_QUEUED_TURNS:
+            raise HttpError(503, "Server is busy; retry later")
+
+        writer.write(_head(200, {
+            "Content-Type": "application/x-ndjson; charset=utf-8",
+            "Transfer-Encoding": "chunked",
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }))
+        events = EventStream(asyncio.get_running_loop(), SERVER_EVENT_BUFFER)
+        session.pending += 1
+        turn = asyncio.create_task(self._queued_turn(session, text, events))
+        # 轮次可能长时间不产生事件（如不打印输出的沙箱代码）：并发监视连接，客户端断开时立即取消
+        pipelined: List[bytes] = []
+        watcher = asyncio.create_task(_wait_disconnect(reader, pipelined))
+        watcher.add_done_callback(lambda task: task.cancelled() or events.disconnect())
+        try:
+            while True:
+                event = await events.queue.get()
+                if event is _DISCONNECTED:
+                    raise ConnectionResetError("Client disconnected")
+                data = (json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8")
+                writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+                # 客户端读取慢时在此等待，队列随之写满，生产方也随之等待
+                await writer.drain()
+                if event["event"] == "done":
+                    break
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+            await turn
+            # 响应期间客户端已发来后续请求：监视时读走的数据无法放回，关闭连接由客户端重试
+            return not pipelined
+        except (ConnectionError, asyncio.CancelledError):
+            events.close()
+            turn.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await turn
+            raise
+        finally:
+            watcher.cancel()
+            with contextlib.suppress(asyncio.CancelledError, Exception):
+                await watcher
+            session.pending -= 1
+            session.last_active = time.monotonic()
+
+    async def _queued_turn(self, session: Session, text: str, events: EventStream) -> None:
+        # 先取得会话内的名额再占用全局名额，避免单个会话的排队请求占满全局并发
+        async with session.semaphore:
+            self.queued_turns += 1
+            try:
+                if self.turn_slots.locked():
+                    await events.emit("queued", position=self.queued_turns)
+                await self.turn_slots.acquire()
+            finally:
+                self.queued_turns -= 1
+            self.active_turns += 1
+            try:
+                await self.run_turn(session, text, events)
+            finally:
+                self.active_turns -= 1
+                self.turn_slots.release()
+
+    # ---- HTTP ----
+
+    async def dispatch(
+        self,
+        method: str,
+        path: str,
+        body: bytes,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> bool:
+        parts = [part for part in path.split("/") if part]
+        if parts == ["health"] and method == "GET":
+            await _send_json(writer, 200, {
+                "status": "ok",
+                "sessions": len(self.sessions),
+                "active_turns": self.active_turns,
+                "queued_turns": self.queued_turns,
+                "sandbox_workers": code_sandbox.enabled,
+                "toolsets": toolset_warmer.stats(),
+            })
+            return True
+        if parts == ["sessions"] and method == "POST":
+            session, restored = await self.create_session(_json_body(body).get("session_id"))
+            await _send_json(writer, 201, {"session_id": session.id, "restored": restored})
+            return True
+        if len(parts) == 2 and parts[0] == "sessions":
+            if method == "GET":
+                session = self.get_session(parts[1])
+                await _send_json(writer, 200, {"session_id": session.id, "history": session.memory.get_history()})
+                return True
+            if method == "DELETE":
+                session = self.get_session(parts[1])
+                if session.pending:
+                    raise HttpError(429, "Session has requests in progress")
+                del self.sessions[session.id]
+                await _send_json(writer, 200, {"session_id": session.id, "deleted": True})
+                return True
+            raise HttpError(405, f"{method} is not allowed here")
+        if len(parts) == 3 and parts[0] == "sessions" and parts[2] == "messages":
+            if method != "POST":
+                raise HttpError(405, f"{method} is not allowed here")
+            return await self.handle_message(self.get_session(parts[1]), _json_body(body), reader, writer)
+        raise HttpError(404, f"No route for {method} {path}")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), SERVER_READ_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if request is None:
+                    break
+                method, path, headers, body = request
+                try:
+                    keep_alive = await self.dispatch(method, path, body, reader, writer)
+                except HttpError as e:
+                    await _send_json(writer, e.status, {"error": e.message})
+                    keep_alive = True
+                if not keep_alive or headers.get("connection", "").lower() == "close":
+                    break
+        except HttpError as e:
+            with contextlib.suppress(ConnectionError):
+                await _send_json(writer, e.status, {"error": e.message}, keep_alive=False)
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Multi-session agent server")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument(
+        "--warmup",
+        action="store_true",
+        help="start every registered toolset concurrently before accepting connections",
+    )
+    return parser.parse_args(argv)
+
+
+async def serve(host: str, port: int) -> None:
+    server = AgentServer()
+    listener = await asyncio.start_server(server.handle_connection, host, port, backlog=1024)
+    print(f"Agent server listening on http://{host}:{port}")
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    args = _parse_args(argv)
+
+    # 模型客户端、工具集与沙箱在所有会话间共享
+    mini.MINI_LLM = mini._initialise_mini_model()
+    preload_litellm()
+    if code_sandbox.enabled:
+        threading.Thread(target=code_sandbox.warm, name="sandbox-warmup", daemon=True).start()
+    if args.warmup:
+        mini._warm_up_toolsets()
+
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("\nExiting...")
+
+
+if __name__ == "__main__":
+    main()
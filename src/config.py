@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+AGENT_CONFIG_PATH = Path(__file__).resolve().parent.parent / "agent.yaml"
+
+_lock = threading.Lock()
+_cache: Dict[Path, Tuple[int, Dict[str, Any]]] = {}
+
+
+def _parse_yaml(text: str) -> Any:
+    # yaml仅在缓存未命中时导入
+    import yaml
+
+    return yaml.safe_load(text)
+
+
+def load_yaml(path: Path) -> Dict[str, Any]:
+    """ 读取并缓存YAML文件，文件mtime变化后重新解析；多个模块共享同一份解析结果 """
+    path = Path(path).resolve()
+    mtime_ns = path.stat().st_mtime_ns
+    with _lock:
+        cached = _cache.get(path)
+        if cached is not None and cached[0] == mtime_ns:
+            return cached[1]
+    data = _parse_yaml(path.read_text(encoding="utf-8")) or {}
+    with _lock:
+        _cache[path] = (mtime_ns, data)
+    return data
+
+
+def load_agent_config(section: Optional[str] = None) -> Dict[str, Any]:
+    """ agent.yaml的共享加载入口，可只取其中的brain/mini等段落 """
+    config = load_yaml(AGENT_CONFIG_PATH)
+    return config.get(section, {}) if section else config
+
+
+def parse_front_matter(text: str) -> Optional[Dict[str, Any]]:
+    """ 解析Markdown头部 --- 包裹的YAML front matter，没有时返回None """
+    if not text.startswith("---"):
+        return None
+    parts = text.split("---", 2)
+    if len(parts) < 3:
+        return None
+    return _parse_yaml(parts[1]) or {}
+
+
+__all__ = ["AGENT_CONFIG_PATH", "load_agent_config", "load_yaml", "parse_front_matter"]
@@ -0,0 +1,201 @@
+"""
+沙箱worker进程入口：python _sandbox_worker.py <options_json>
+
+启动时设置内存上限并导入常用模块，然后从stdin逐行读取JSON请求：
+  {"run": code, "cpu_seconds": n}      执行一段生成代码，结束后回复 {"done": true, "error": ...}
+  {"reply": id, "result"/"error": ...}  run_toolset/call_tool在agent进程中的执行结果
+代码的print输出以 {"stdout": text} 转发；run_toolset/call_tool以 {"call": id, ...} 请求agent进程执行。
+"""
+import importlib
+import io
+import itertools
+import json
+import os
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+class _Channel:
+    """ 与agent进程之间的JSON行协议；可被生成代码中的多个线程同时使用 """
+
+    def __init__(self, out):
+        self._out = out
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self.jobs = queue.Queue()
+
+    def send(self, payload):
+        with self._lock:
+            self._out.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            self._out.flush()
+
+    def call(self, name, *args, **kwargs):
+        """ 请求agent进程执行name，返回Future """
+        future = Future()
+        call_id = next(self._ids)
+        self._pending[call_id] = future
+        self.send({"call": call_id, "name": name, "args": list(args), "kwargs": kwargs})
+        return future
+
+    def read(self, lines):
+        for line in lines:
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if "run" in message:
+                self.jobs.put(message)
+            elif "reply" in message:
+                future = self._pending.pop(message["reply"], None)
+                if future is None:
+                    continue
+                if "error" in message:
+                    future.set_exception(RuntimeError(message["error"]))
+                else:
+                    future.set_result(message.get("result"))
+        self.jobs.put(None)
+
+
+class _ForwardedOutput:
+    """ 替代sys.stdout：按行把生成代码的输出转发给agent进程 """
+
+    def __init__(self, channel):
+        self._channel = channel
+        self._buffer = ""
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        with self._lock:
+            self._buffer += text
+            if "\n" not in self._buffer:
+                return len(text)
+            head, _, self._buffer = self._buffer.rpartition("\n")
+        self._channel.send({"stdout": head + "\n"})
+        return len(text)
+
+    def flush(self):
+        with self._lock:
+            text, self._buffer = self._buffer, ""
+        if text:
+            self._channel.send({"stdout": text})
+
+    def isatty(self):
+        return False
+
+
+def _limit_memory(memory_mb):
+    if resource is None or not memory_mb:
+        return
+    limit = int(memory_mb) * 1024 * 1024
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _limit_cpu(cpu_seconds):
+    """ RLIMIT_CPU按进程累计CPU时间计算：每次执行前把软限制设为已用时间加上本次额度 """
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if not cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    soft = int(usage.ru_utime + usage.ru_stime + cpu_seconds) + 1
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _execution_context(channel, preloaded):
+    from src.environments.sandbox import caller_frame, interpolate_instruction
+
+    def run_toolset(name, instruction):
+        """ Exposed API for the generated script to call a toolset. """
+        return channel.call("run_toolset", name, interpolate_instruction(instruction, caller_frame())).result()
+
+    def run_toolset_async(name, instruction):
+        """ Exposed API: start a toolset call in the background and return a Future. """
+        return channel.call("run_toolset", name, interpolate_instruction(instruction, caller_frame()))
+
+    def run_toolsets_parallel(calls):
+        """ Exposed API: run independent (name, instruction) toolset calls concurrently. """
+        frame = caller_frame()
+        futures = [channel.call("run_toolset", name, interpolate_instruction(instruction, frame)) for name, instruction in calls]
+        return [future.result() for future in futures]
+
+    def call_tool(toolset, tool, /, **arguments):
+        """ Exposed API: call one tool directly with structured arguments. """
+        return channel.call("call_tool", toolset, tool, **arguments).result()
+
+    pptx = preloaded.get("pptx")
+    return {
+        "run_toolset": run_toolset,
+        "run_toolset_async": run_toolset_async,
+        "run_toolsets_parallel": run_toolsets_parallel,
+        "call_tool": call_tool,
+        "print": print,
+        "range": range,
+        "len": len,
+        "str": str,
+        "int": int,
+        "list": list,
+        "dict": dict,
+        "Presentation": pptx.Presentation if pptx else None,
+        "BytesIO": io.BytesIO if pptx else None,
+    }
+
+
+def main():
+    options = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    if options.get("root") and options["root"] not in sys.path:
+        sys.path.insert(0, options["root"])
+
+    # 协议使用原始stdout；fd 1被重定向到stderr，生成代码启动的子进程输出不会污染协议
+    channel = _Channel(os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8"))
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    output = _ForwardedOutput(channel)
+    sys.stdout = output
+
+    # 常用模块只在worker启动时导入一次
+    preloaded = {}
+    for name in options.get("preload", []):
+        try:
+            preloaded[name] = importlib.import_module(name)
+        except ImportError:
+            pass
+    _limit_memory(options.get("memory_mb"))
+
+    threading.Thread(target=channel.read, args=(sys.stdin,), name="sandbox-channel", daemon=True).start()
+    channel.send({"ready": True})
+
+    while True:
+        job = channel.jobs.get()
+        if job is None:
+            return 0
+        error, fatal = None, False
+        try:
+            _limit_cpu(job.get("cpu_seconds"))
+            exec(job["run"], _execution_context(channel, preloaded))
+        except MemoryError:
+            error, fatal = f"MemoryError: memory limit of {options.get('memory_mb')} MB exceeded", True
+        except SystemExit as e:
+            error = f"SystemExit: {e.code}" if e.code not in (None, 0) else None
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            _limit_cpu(None)
+        output.flush()
+        channel.send({"done": True, "error": error, "fatal": fatal})
+
+
+if __name__ == "__main__":
+    sys.exit(main())
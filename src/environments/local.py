@@ -1,27 +1,361 @@
+import asyncio
+import codecs
 import os
+import select
+import shlex
+import signal
 import subprocess
+import threading
+import time
+import uuid
+from collections import deque
 from dataclasses import dataclass, field
+from typing import Callable, Dict, Generator, List, Optional
 
 @dataclass
 class LocalEnvironmentConfig:
     cwd: str = ""
     env: dict[str, str] = field(default_factory=dict)
     timeout: int = 30
+    # 在同一个常驻shell中依次执行命令，cd/export等状态在命令之间保留
+    persistent: bool = False
+    shell: str = "/bin/bash" if os.path.exists("/bin/bash") else "/bin/sh"
+    # 捕获的输出最多保留的字符数，超出时只保留末尾部分
+    output_limit: int = 1_000_000
+
+
+# 等待输出时轮询进程状态的间隔：shell已退出但后台子进程仍占用管道时不必等到超时
+_POLL_INTERVAL = 0.5
+_READ_SIZE = 65536
+
+
+class _OutputBuffer:
+    """ 有界的输出捕获（环形缓冲）：只保留最后limit个字符 """
+
+    def __init__(self, limit: int):
+        self._limit = limit
+        self._chunks: deque[str] = deque()
+        self._size = 0
+        self.truncated = False
+
+    def append(self, chunk: str) -> None:
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        while self._size > self._limit and self._chunks:
+            excess = self._size - self._limit
+            head = self._chunks[0]
+            if len(head) <= excess:
+                self._chunks.popleft()
+                self._size -= len(head)
+            else:
+                self._chunks[0] = head[excess:]
+                self._size -= excess
+            self.truncated = True
+
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+
+def _kill_group(proc: subprocess.Popen) -> None:
+    """ 结束进程所在的整个进程组，连同shell启动的子孙进程 """
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    proc.wait()
+
+
+def _read_chunks(proc: subprocess.Popen, deadline: Optional[float]) -> Generator[bytes, None, None]:
+    """ 从进程的stdout逐块读取，直到EOF；超过deadline时抛出TimeoutError """
+    fd = proc.stdout.fileno()
+    while True:
+        wait = _POLL_INTERVAL
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError
+            wait = min(wait, remaining)
+        ready, _, _ = select.select([fd], [], [], wait)
+        if ready:
+            data = os.read(fd, _READ_SIZE)
+            if not data:
+                return
+            yield data
+        elif proc.poll() is not None:
+            return
+
+
+def _marker_prefix(data: bytes, marker: bytes) -> int:
+    """ data末尾与marker开头重合的最大长度 """
+    for size in range(min(len(data), len(marker) - 1), 0, -1):
+        if marker.startswith(data[-size:]):
+            return size
+    return 0
+
+
+class ShellSession:
+    """
+    常驻shell进程：命令通过eval在同一个shell中依次执行，工作目录与环境变量在命令之间保留。
+    每条命令之后输出一个随机标记行，携带退出码与当前目录，据此切分各命令的输出。
+    """
+
+    def __init__(self, shell: str, cwd: str, env: Dict[str, str]):
+        self.shell = shell
+        self.cwd = cwd
+        self._env = env
+        self._proc: Optional[subprocess.Popen] = None
+        self.lock = threading.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.poll() is None
+
+    def _start(self) -> subprocess.Popen:
+        # 新会话（进程组）：超时时可连同子孙进程一起结束
+        return subprocess.Popen(
+            [self.shell],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            cwd=self.cwd,
+            env=self._env,
+            start_new_session=True,
+        )
+
+    def run(self, command: str, deadline: Optional[float]) -> Generator[bytes, None, int]:
+        """ 执行一条命令，逐块产出其原始输出，返回退出码；需在持有lock时调用 """
+        if not self.alive:
+            # 首次使用，或上一条命令超时/执行了exit：在最后已知的目录中重新启动
+            self._proc = self._start()
+        proc = self._proc
+        marker = f"__MINI_DONE_{uuid.uuid4().hex}__".encode()
+        script = (
+            f"eval {shlex.quote(command)} < /dev/null\n"
+            f"printf '%s %s %s\\n' '{marker.decode()}' \"$?\" \"$PWD\"\n"
+        )
+        try:
+            proc.stdin.write(script.encode())
+            proc.stdin.flush()
+        except OSError:
+            self.kill()
+            raise
+
+        pending = b""
+        for data in _read_chunks(proc, deadline):
+            pending += data
+            index = pending.find(marker)
+            if index >= 0:
+                end = pending.find(b"\n", index)
+                if end < 0:
+                    continue
+                if index:
+                    yield pending[:index]
+                status, _, cwd = pending[index + len(marker):end].strip().partition(b" ")
+                self.cwd = cwd.decode(errors="replace") or self.cwd
+                return int(status)
+            # 只保留可能是标记开头的末尾部分，其余立即产出
+            keep = _marker_prefix(pending, marker)
+            if len(pending) > keep:
+                yield pending[:len(pending) - keep]
+                pending = pending[len(pending) - keep:]
+
+        # 命令中执行了exit：shell已退出，下次调用时重新启动
+        if pending:
+            yield pending
+        return proc.wait()
+
+    def kill(self) -> None:
+        if self._proc is not None:
+            _kill_group(self._proc)
+            self._proc = None
+
+    def close(self) -> None:
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+
+class CommandStream:
+    """
+    execute的异步流式版本：async for逐块得到输出，迭代结束后result与execute的返回值相同。
+    提前停止迭代时须调用aclose()（或使用async with），以便立即结束命令并释放常驻shell：
+
+        async with env.stream("make test") as stream:
+            async for chunk in stream:
+                ...
+    """
+
+    def __init__(self, start: Callable[[Callable[[Callable[[], None]], None]], Generator[str, None, dict]]):
+        # 生成器只持有这个列表而不持有self：未关闭就被丢弃的流能立即被回收（见__del__）
+        self._kill: List[Callable[[], None]] = [lambda: None]
+        kill = self._kill
+        self._chunks = start(lambda on_timeout: kill.__setitem__(0, on_timeout))
+        # 生成器在工作线程中推进；提前结束时需等当前这一步完成后才能关闭它
+        self._step = threading.Lock()
+        self._finished = False
+        self.result: Optional[dict] = None
+
+    def _next(self) -> Optional[str]:
+        with self._step:
+            if self._finished:
+                return None
+            try:
+                return next(self._chunks)
+            except BaseException as e:
+                self._finished = True
+                if isinstance(e, StopIteration):
+                    self.result = e.value
+                    return None
+                raise
+
+    def _close(self) -> None:
+        with self._step:
+            self._finished = True
+            self._chunks.close()
+
+    def __aiter__(self) -> "CommandStream":
+        return self
+
+    async def __anext__(self) -> str:
+        try:
+            chunk = await asyncio.to_thread(self._next)
+        except asyncio.CancelledError:
+            await self.aclose()
+            raise
+        if chunk is None:
+            raise StopAsyncIteration
+        return chunk
+
+    async def aclose(self) -> None:
+        """ 结束仍在运行的命令并释放常驻shell；命令已结束时不做任何事 """
+        if self._finished:
+            return
+        # 先结束进程，使工作线程中阻塞的读取返回，再关闭生成器
+        self._kill[0]()
+        await asyncio.to_thread(self._close)
+
+    def __del__(self) -> None:
+        # 未调用aclose就被丢弃（如对临时对象async for后break）：此时没有进行中的读取，可同步清理
+        if not self._finished:
+            self._kill[0]()
+            self._close()
+
+    async def __aenter__(self) -> "CommandStream":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def wait(self) -> dict:
+        """ 读完全部输出并返回结果 """
+        async with self:
+            async for _ in self:
+                pass
+        return self.result
+
 
 class LocalEnvironment:
     def __init__(self, config: LocalEnvironmentConfig = LocalEnvironmentConfig()):
         self.config = config
+        # 合并后的环境变量只计算一次
+        self._env = os.environ | self.config.env
+        self._session: Optional[ShellSession] = None
+
+    @property
+    def session(self) -> ShellSession:
+        if self._session is None:
+            self._session = ShellSession(self.config.shell, self.config.cwd or os.getcwd(), self._env)
+        return self._session
 
-    def execute(self, command: str):
+    def execute(self, command: str, timeout: Optional[float] = None):
         """执行命令并返回结果"""
-        result = subprocess.run(
-            command,
-            shell=True,
-            text=True,
-            cwd=self.config.cwd or os.getcwd(),
-            env=os.environ | self.config.env,
-            timeout=self.config.timeout,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-        )
-        return {"output": result.stdout, "returncode": result.returncode}
\ No newline at end of file
+        chunks = self._run(command, timeout)
+        try:
+            while True:
+                next(chunks)
+        except StopIteration as stop:
+            return stop.value
+
+    def stream(self, command: str, timeout: Optional[float] = None) -> CommandStream:
+        """ 异步流式执行：输出一到达就产出，便于在长时间的构建/测试命令结束前做出反应 """
+        return CommandStream(lambda on_start: self._run(command, timeout, on_start))
+
+    def _run(
+        self,
+        command: str,
+        timeout: Optional[float],
+        on_start: Optional[Callable[[Callable[[], None]], None]] = None,
+    ) -> Generator[str, None, dict]:
+        timeout = self.config.timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        buffer = _OutputBuffer(self.config.output_limit)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+        if self.config.persistent:
+            session = self.session
+            session.lock.acquire()
+            raw = session.run(command, deadline)
+            on_timeout = session.kill
+            release = session.lock.release
+        else:
+            proc = subprocess.Popen(
+                command,
+                shell=True,
+                cwd=self.config.cwd or os.getcwd(),
+                env=self._env,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+            raw = self._oneshot(proc, deadline)
+            on_timeout = lambda: _kill_group(proc)
+            release = proc.stdout.close
+
+        if on_start is not None:
+            on_start(on_timeout)
+        try:
+            while True:
+                try:
+                    data = next(raw)
+                except StopIteration as stop:
+                    returncode = stop.value
+                    break
+                chunk = decoder.decode(data)
+                if chunk:
+                    buffer.append(chunk)
+                    yield chunk
+            chunk = decoder.decode(b"", final=True)
+            if chunk:
+                buffer.append(chunk)
+                yield chunk
+        except TimeoutError:
+            on_timeout()
+            raise subprocess.TimeoutExpired(command, timeout, output=buffer.text())
+        except BaseException:
+            # 调用方中途放弃（GeneratorExit）或读取出错：不留下仍在运行的命令
+            on_timeout()
+            raise
+        finally:
+            release()
+        return {"output": buffer.text(), "returncode": returncode, "truncated": buffer.truncated}
+
+    @staticmethod
+    def _oneshot(proc: subprocess.Popen, deadline: Optional[float]) -> Generator[bytes, None, int]:
+        # 读到EOF，或shell已退出而后台进程仍占用输出管道（不等待后台进程）
+        yield from _read_chunks(proc, deadline)
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            return proc.wait(timeout=remaining)
+        except subprocess.TimeoutExpired:
+            raise TimeoutError
+
+    def close(self) -> None:
+        """ 关闭常驻shell会话 """
+        if self._session is not None:
+            self._session.close()
@@ -0,0 +1,405 @@
+"""
+brain生成代码的沙箱执行：代码在预热好的worker子进程中运行（见_sandbox_worker.py），
+受CPU时间、内存与墙钟时间限制，可被取消；run_toolset/call_tool经IPC回到agent进程执行。
+"""
+import atexit
+import inspect
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+_WORKER_MAIN = str(Path(__file__).resolve().parent / "_sandbox_worker.py")
+_PROJECT_ROOT = str(Path(__file__).resolve().parents[2])
+
+
+def interpolate_instruction(instruction: str, caller_frame) -> str:
+    # 稳健性修复：如果f-string失败，则自动插值变量
+    # #如果指令包含{var_name}并且该var存在于调用者的作用域中，则替换它。
+    try:
+    #我们通过确保括号后面没有引号来避免匹配像{“key”：…}这样的JSON结构。
+    #像{content}这样的简单变量将被匹配。
+        if re.search(r'\{[a-zA-Z_]\w*\}', instruction):
+            if caller_frame:
+                caller_locals = caller_frame.f_locals
+
+                def replacer(match):
+                    var_name = match.group(0)[1:-1] # remove braces
+                    if var_name in caller_locals:
+                        val = caller_locals[var_name]
+                        return str(val)
+                    return match.group(0)
+
+                new_instruction = re.sub(r'\{([a-zA-Z_]\w*)\}', replacer, instruction)
+                if new_instruction != instruction:
+                    instruction = new_instruction
+    except Exception as e:
+        print(f"DEBUG: Auto-interpolation failed: {e}")
+    return instruction
+
+
+def caller_frame():
+    """ 返回调用暴露API的生成脚本所在的栈帧 """
+    frame = inspect.currentframe()
+    return frame.f_back.f_back if frame and frame.f_back else None
+
+
+class SandboxError(RuntimeError):
+    """ 生成代码在沙箱中执行失败（代码异常、超出资源限制或worker意外退出） """
+
+
+class SandboxTimeoutError(SandboxError):
+    """ 超过墙钟时间限制，worker已被强制结束 """
+
+
+class SandboxCancelledError(SandboxError):
+    """ 执行被调用方取消 """
+
+
+class SandboxJob:
+    """ 一次代码执行；result()等待完成，cancel()结束正在执行它的worker """
+
+    def __init__(self, code: str, handlers: Dict[str, Callable[..., Any]], output: Callable[[str], None], timeout: Optional[float]):
+        self.code = code
+        self.handlers = handlers
+        self.output = output
+        self.timeout = timeout
+        self.cancelled = False
+        self._future: "Future[None]" = Future()
+        self._worker: Optional["_SandboxWorker"] = None
+        self._lock = threading.Lock()
+
+    def done(self) -> bool:
+        return self._future.done()
+
+    def result(self, timeout: Optional[float] = None) -> None:
+        """ 等待执行结束；代码抛出的异常以SandboxError重新抛出 """
+        self._future.result(timeout)
+
+    def as_future(self) -> "Future[None]":
+        """ 底层的concurrent.futures.Future，可用asyncio.wrap_future在事件循环中等待 """
+        return self._future
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled = True
+            worker = self._worker
+        if worker is not None:
+            worker.kill()
+
+    def _attach(self, worker: "_SandboxWorker") -> bool:
+        with self._lock:
+            if self.cancelled:
+                return False
+            self._worker = worker
+            return True
+
+    def _finish(self, error: Optional[BaseException] = None) -> None:
+        if self._future.done():
+            return
+        if error is None:
+            self._future.set_result(None)
+        else:
+            self._future.set_exception(error)
+
+
+class _SandboxWorker:
+    """ 一个预先导入了常用模块的沙箱子进程，按行收发JSON """
+
+    def __init__(self, memory_mb: Optional[int], preload: Sequence[str], calls: ThreadPoolExecutor, start_timeout: float):
+        self.jobs = 0
+        self.fatal = False
+        self._calls = calls
+        self._job: Optional[SandboxJob] = None
+        self._send_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._replied = False
+        options = {"memory_mb": memory_mb, "preload": list(preload), "root": _PROJECT_ROOT}
+        # 新会话（进程组）：生成代码启动的子进程会随worker一起被结束，且不会收到终端的Ctrl+C
+        self._proc = subprocess.Popen(
+            [sys.executable, _WORKER_MAIN, json.dumps(options)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            start_new_session=True,
+        )
+        self._reader = threading.Thread(target=self._read_messages, name="sandbox-worker-reader", daemon=True)
+        self._reader.start()
+        if not self._ready.wait(start_timeout) or not self.alive:
+            self.kill()
+            raise SandboxError("sandbox worker failed to start")
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def _send(self, payload: Dict[str, Any]) -> None:
+        with self._send_lock:
+            self._proc.stdin.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            self._proc.stdin.flush()
+
+    def _read_messages(self) -> None:
+        for line in self._proc.stdout:
+            message = json.loads(line)
+            job = self._job
+            if "ready" in message:
+                self._ready.set()
+            elif "stdout" in message:
+                if job is not None:
+                    job.output(message["stdout"])
+            elif "call" in message:
+                self._calls.submit(self._handle_call, job, message)
+            elif "done" in message:
+                error = message.get("error")
+                self.fatal = bool(message.get("fatal"))
+                self._error = SandboxError(error) if error else None
+                self._replied = True
+                self._done.set()
+        self._ready.set()
+        self._done.set()
+
+    def _handle_call(self, job: Optional[SandboxJob], message: Dict[str, Any]) -> None:
+        """ 在agent进程中执行生成代码发起的run_toolset/call_tool，并把结果发回worker """
+        reply: Dict[str, Any] = {"reply": message["call"]}
+        handler = job.handlers.get(message.get("name")) if job is not None else None
+        try:
+            if handler is None:
+                raise NameError(f"'{message.get('name')}' is not available in the sandbox")
+            reply["result"] = handler(*message.get("args", []), **message.get("kwargs", {}))
+        except Exception as e:
+            reply["error"] = f"{type(e).__name__}: {e}"
+        try:
+            self._send(reply)
+        except (OSError, ValueError):
+            pass  # worker已被结束
+
+    def run(self, job: SandboxJob, cpu_seconds: Optional[float]) -> None:
+        """ 执行一次代码，直到完成、超时或worker退出 """
+        self._job = job
+        self._done.clear()
+        self._error = None
+        self._replied = False
+        try:
+            self._send({"run": job.code, "cpu_seconds": cpu_seconds})
+        except OSError:
+            self.kill()
+            raise SandboxError("sandbox worker is not running")
+
+        if not self._done.wait(job.timeout):
+            self.kill()
+            raise SandboxTimeoutError(f"Code execution timed out after {job.timeout}s")
+        self.jobs += 1
+        if job.cancelled:
+            raise SandboxCancelledError("Code execution was cancelled")
+        if not self._replied:
+            # worker在执行中退出：被资源限制结束或代码自行退出了进程
+            code = self._proc.wait()
+            if code == -signal.SIGXCPU:
+                raise SandboxError(f"CPU time limit exceeded ({cpu_seconds}s)")
+            raise SandboxError(f"Sandbox worker exited unexpectedly (code {code})")
+        if self._error is not None:
+            raise self._error
+
+    def kill(self) -> None:
+        # 结束整个进程组，包括生成代码启动的子进程
+        try:
+            os.killpg(self._proc.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            pass
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def close(self) -> None:
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+
+class SandboxPool:
+    """
+    生成代码的预热worker池：最多size段代码同时在各自的worker中执行，其余排队。
+    worker在执行max_jobs次或出现内存耗尽后被回收重建；超时或取消时worker被结束并在后台补充。
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_jobs: int = 50,
+        timeout: Optional[float] = 600.0,
+        cpu_seconds: Optional[float] = 300.0,
+        memory_mb: Optional[int] = 2048,
+        preload: Sequence[str] = ("pptx",),
+        start_timeout: float = 30.0,
+    ):
+        self._size = size
+        self._max_jobs = max_jobs
+        self._timeout = timeout
+        self._cpu_seconds = cpu_seconds
+        self._memory_mb = memory_mb
+        self._preload = tuple(preload)
+        self._start_timeout = start_timeout
+        self._lock = threading.Lock()
+        self._idle: List[_SandboxWorker] = []
+        self._jobs: Optional[ThreadPoolExecutor] = None
+        self._calls: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0
+
+    def _executors(self):
+        with self._lock:
+            if self._jobs is None:
+                # 每个执行线程同一时刻负责一个job，因此最多size个job并行
+                self._jobs = ThreadPoolExecutor(max_workers=self._size, thread_name_prefix="sandbox-job")
+                self._calls = ThreadPoolExecutor(max_workers=max(8, self._size * 4), thread_name_prefix="sandbox-call")
+            return self._jobs, self._calls
+
+    def _spawn(self) -> _SandboxWorker:
+        _, calls = self._executors()
+        return _SandboxWorker(self._memory_mb, self._preload, calls, self._start_timeout)
+
+    def _acquire(self) -> _SandboxWorker:
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    return worker
+        return self._spawn()
+
+    def _release(self, worker: _SandboxWorker) -> None:
+        if worker.alive and not worker.fatal and worker.jobs < self._max_jobs:
+            with self._lock:
+                self._idle.append(worker)
+            return
+        worker.close()
+        # 在后台补充一个预热好的worker，下一段代码无需等待启动
+        threading.Thread(target=self.warm, args=(1,), name="sandbox-refill", daemon=True).start()
+
+    def _execute(self, job: SandboxJob) -> None:
+        if job.cancelled:
+            job._finish(SandboxCancelledError("Code execution was cancelled"))
+            return
+        try:
+            worker = self._acquire()
+        except SandboxError as e:
+            job._finish(e)
+            return
+        if not job._attach(worker):
+            self._release(worker)
+            job._finish(SandboxCancelledError("Code execution was cancelled"))
+            return
+        try:
+            worker.run(job, self._cpu_seconds)
+            job._finish()
+        except SandboxError as e:
+            job._finish(e)
+        except BaseException as e:
+            job._finish(SandboxError(f"{type(e).__name__}: {e}"))
+        finally:
+            self._release(worker)
+
+    def submit(
+        self,
+        code: str,
+        handlers: Dict[str, Callable[..., Any]],
+        output: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> SandboxJob:
+        """
+        提交一段代码，立即返回SandboxJob。handlers为代码中run_toolset/call_tool在agent进程中的实现，
+        output接收代码打印的文本（默认写到当前进程的stdout）。
+        """
+        job = SandboxJob(code, handlers, output or _write_stdout, self._timeout if timeout is None else timeout)
+        jobs, _ = self._executors()
+        jobs.submit(self._execute, job)
+        return job
+
+    def run(
+        self,
+        code: str,
+        handlers: Dict[str, Callable[..., Any]],
+        output: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> None:
+        """ 执行代码并等待完成；等待期间按Ctrl+C会取消执行 """
+        job = self.submit(code, handlers, output, timeout)
+        try:
+            job.result()
+        except KeyboardInterrupt:
+            job.cancel()
+            raise
+
+    def warm(self, count: Optional[int] = None) -> int:
+        """ 预先启动worker，使空闲worker达到count个（默认size个），返回新启动的数量 """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            missing = min(count or self._size, self._size) - len(self._idle)
+        started = 0
+        for _ in range(max(0, missing)):
+            try:
+                worker = self._spawn()
+            except SandboxError:
+                break
+            with self._lock:
+                self._idle.append(worker)
+            started += 1
+        return started
+
+    def shutdown(self) -> None:
+        with self._lock:
+            workers, self._idle = self._idle, []
+            executors = (self._jobs, self._calls)
+        for worker in workers:
+            worker.close()
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False)
+
+
+def _write_stdout(text: str) -> None:
+    sys.stdout.write(text)
+    sys.stdout.flush()
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Global sandbox pool; SANDBOX_WORKERS=0 runs generated code in-process with exec()
+code_sandbox = SandboxPool(
+    size=int(_env_number("SANDBOX_WORKERS", 2)),
+    max_jobs=int(_env_number("SANDBOX_MAX_JOBS", 50)),
+    timeout=_env_number("SANDBOX_TIMEOUT", 600.0) or None,
+    cpu_seconds=_env_number("SANDBOX_CPU_SECONDS", 300.0) or None,
+    memory_mb=int(_env_number("SANDBOX_MAX_MEMORY_MB", 2048)) or None,
+)
+atexit.register(code_sandbox.shutdown)
+
+__all__ = [
+    "SandboxError",
+    "SandboxTimeoutError",
+    "SandboxCancelledError",
+    "SandboxJob",
+    "SandboxPool",
+    "code_sandbox",
+    "caller_frame",
+    "interpolate_instruction",
+]
@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from src.models.tokens import estimate_tokens
+
+
+class ContextWindow:
+    """
+    增量维护的对话上下文：最近若干条消息原样保留（滑动窗口），
+    更早的消息压缩为滚动摘要；整体token数（含摘要标题行）不超过预算，
+    单条消息本身超出预算时截断其原文。渲染结果缓存到历史变化为止。
+    """
+
+    _SUMMARY_HEADER = "Summary of earlier conversation:\n"
+    _RECENT_HEADER = "Recent conversation:\n"
+    _TRUNCATED = "…[truncated]\n"
+
+    def __init__(self, token_budget: Optional[int] = 4000, recent_turns: int = 20, summary_chars: int = 160, summary_ratio: float = 0.25):
+        self.token_budget = token_budget
+        self.recent_turns = recent_turns
+        self.summary_chars = summary_chars
+        self.summary_ratio = summary_ratio
+        self.clear()
+
+    def clear(self) -> None:
+        self._window: Deque[Tuple[str, int]] = deque()
+        self._window_tokens = 0
+        self._summary: Deque[Tuple[str, int]] = deque()
+        self._summary_tokens = 0
+        self._omitted = 0
+        self._rendered: Optional[str] = ""
+
+    @staticmethod
+    def render_message(msg: Dict[str, str]) -> str:
+        role = msg.get("role", "user").upper()
+        content = msg.get("content", "")
+        return f"{role}: {content}\n"
+
+    def _summarize(self, line: str) -> str:
+        role, _, content = line.partition(": ")
+        content = " ".join(content.split())
+        if len(content) > self.summary_chars:
+            content = content[: self.summary_chars] + "…"
+        return f"- {role}: {content}\n"
+
+    def _summary_budget(self) -> Optional[int]:
+        if self.token_budget is None:
+            return None
+        return int(self.token_budget * self.summary_ratio)
+
+    def _evict_oldest(self) -> None:
+        line, tokens = self._window.popleft()
+        self._window_tokens -= tokens
+        summary_line = self._summarize(line)
+        summary_tokens = estimate_tokens(summary_line)
+        self._summary.append((summary_line, summary_tokens))
+        self._summary_tokens += summary_tokens
+
+        summary_budget = self._summary_budget()
+        while summary_budget is not None and self._summary and self._summary_tokens > summary_budget:
+            _, dropped = self._summary.popleft()
+            self._summary_tokens -= dropped
+            self._omitted += 1
+
+    def _omitted_line(self) -> str:
+        return f"- ({self._omitted} earlier messages omitted)\n"
+
+    def _header_tokens(self) -> int:
+        if not self._summary and not self._omitted:
+            return 0
+        tokens = estimate_tokens(self._SUMMARY_HEADER) + estimate_tokens(self._RECENT_HEADER)
+        if self._omitted:
+            tokens += estimate_tokens(self._omitted_line())
+        return tokens
+
+    def _truncate(self, line: str, budget: int) -> str:
+        """ 截断为不超过budget个token的前缀并加截断标记（估算值随前缀长度单调增加，二分查找长度） """
+        budget -= estimate_tokens(self._TRUNCATED)
+        low, high = 0, len(line)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if estimate_tokens(line[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return line[:low] + self._TRUNCATED
+
+    def _fit_newest(self) -> None:
+        """ 只剩最新一条消息仍超预算时，先让出摘要，再截断它的原文 """
+        line, tokens = self._window[-1]
+        minimum = estimate_tokens(self._TRUNCATED) + 8
+        while self._summary and self.token_budget - (self.tokens - tokens) < minimum:
+            _, dropped = self._summary.popleft()
+            self._summary_tokens -= dropped
+            self._omitted += 1
+        truncated = self._truncate(line, self.token_budget - (self.tokens - tokens))
+        truncated_tokens = estimate_tokens(truncated)
+        self._window[-1] = (truncated, truncated_tokens)
+        self._window_tokens += truncated_tokens - tokens
+
+    def append(self, msg: Dict[str, str]) -> None:
+        line = self.render_message(msg)
+        tokens = estimate_tokens(line)
+        self._window.append((line, tokens))
+        self._window_tokens += tokens
+
+        # 窗口超出条数或token预算时，把最旧的消息移入摘要（至少保留最新一条）
+        while len(self._window) > 1 and (
+            len(self._window) > self.recent_turns
+            or (self.token_budget is not None and self.tokens > self.token_budget)
+        ):
+            self._evict_oldest()
+        if self.token_budget is not None and self.tokens > self.token_budget:
+            self._fit_newest()
+        self._rendered = None
+
+    @property
+    def tokens(self) -> int:
+        return self._window_tokens + self._summary_tokens + self._header_tokens()
+
+    def render(self) -> str:
+        if self._rendered is None:
+            parts = []
+            if self._summary or self._omitted:
+                parts.append(self._SUMMARY_HEADER)
+                if self._omitted:
+                    parts.append(self._omitted_line())
+                parts.extend(line for line, _ in self._summary)
+                parts.append(self._RECENT_HEADER)
+            parts.extend(line for line, _ in self._window)
+            self._rendered = "".join(parts)
+        return self._rendered
+
+
+__all__ = ["ContextWindow"]
@@ -1,12 +1,23 @@
+import atexit
 import json
 import os
+import uuid
 from datetime import datetime
+from pathlib import Path
 from typing import Dict, List, Optional
 
+from src.memory.context import ContextWindow
+from src.memory.journal import ConversationJournal
+
 class Memory:
-    def __init__(self):
+    def __init__(self, token_budget: Optional[int] = 4000, recent_turns: int = 20, journal: Optional[ConversationJournal] = None):
         self.history: List[Dict[str, str]] = []
         self.user_preferences: List[str] = []  
+        # 增量维护、受token预算约束的上下文
+        self.context = ContextWindow(token_budget=token_budget, recent_turns=recent_turns)
+        # 追加写入的会话日志，用于重启后恢复
+        self.journal = journal
+        self.session_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
         
         # 创建一个字典来进行记忆存储
         self.memory_data_dir = os.path.join(os.path.dirname(__file__), "data")
@@ -14,7 +25,30 @@ class Memory:
 
     def add_message(self, role: str, content: str):
         """ 在对话历史中更新消息 """
-        self.history.append({"role": role, "content": content})
+        self._append({"role": role, "content": content})
+        if self.journal is not None:
+            self.journal.append(self.session_id, role, content)
+
+    def _append(self, msg: Dict[str, str]):
+        self.history.append(msg)
+        self.context.append(msg)
+
+    def resume(self, session_id: Optional[str] = None, last_n: Optional[int] = None) -> int:
+        """
+        从会话日志恢复历史（默认恢复最近的会话），last_n限制只加载最后N条消息。
+        恢复后新消息继续追加到同一会话，返回恢复的消息条数。
+        """
+        if self.journal is None:
+            return 0
+        session_id = session_id or self.journal.last_session_id()
+        if not session_id:
+            return 0
+        records = self.journal.tail(last_n, session_id=session_id)
+        self.clear_history()
+        for record in records:
+            self._append({"role": record["role"], "content": record["content"]})
+        self.session_id = session_id
+        return len(records)
 
     def get_history(self) -> List[Dict[str, str]]:
         return self.history
@@ -22,6 +56,7 @@ class Memory:
     def clear_history(self):
         """ 清空消息 """
         self.history = []
+        self.context.clear()
 
     def add_preference(self, preference: str):
         """ 可记录用户偏好 """
@@ -30,25 +65,58 @@ class Memory:
 
     def get_context(self) -> str:
         """
-        把历史记录化为字符串以适应于LLM的上下文形式
+        把历史记录化为字符串以适应于LLM的上下文形式：
+        最近的消息保留原文，更早的消息压缩为摘要，总长度受token预算约束
         """
-        context_str = ""
-        for msg in self.history:
-            role = msg.get("role", "user").upper()
-            content = msg.get("content", "")
-            context_str += f"{role}: {content}\n"
-        return context_str
+        return self.context.render()
+
+    def get_full_context(self) -> str:
+        """ 不做裁剪的完整历史记录 """
+        return "".join(ContextWindow.render_message(msg) for msg in self.history)
 
     def save_conversation(self, filename: str = "chat_log.txt"):
         """ 存储记录 """
         filepath = os.path.join(self.memory_data_dir, filename)
         try:
             with open(filepath, "w", encoding="utf-8") as f:
-                f.write(self.get_context())
+                f.write(self.get_full_context())
             return filepath
         except Exception as e:
             print(f"Failed to save conversation: {e}")
             return None
 
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _build_journal() -> Optional[ConversationJournal]:
+    if os.getenv("MEMORY_JOURNAL", "true").lower() != "true":
+        return None
+    journal = ConversationJournal(
+        Path(__file__).resolve().parent / "data" / "journal.jsonl",
+        fsync_every=_env_int("MEMORY_JOURNAL_FSYNC_EVERY", 16),
+    )
+    atexit.register(journal.close)
+    return journal
+
+
+# 所有Memory实例共用同一个会话日志
+_journal = _build_journal()
+
+
+def create_memory(session_id: Optional[str] = None) -> Memory:
+    """ 按环境变量配置新建一个Memory（多会话服务为每个会话各建一个） """
+    instance = Memory(
+        # MEMORY_TOKEN_BUDGET=0 disables the budget
+        token_budget=_env_int("MEMORY_TOKEN_BUDGET", 4000) or None,
+        recent_turns=_env_int("MEMORY_RECENT_TURNS", 20),
+        journal=_journal,
+    )
+    if session_id:
+        instance.session_id = session_id
+    return instance
+
+
 # Global memory instance
-memory = Memory()
+memory = create_memory()
@@ -0,0 +1,164 @@
+from __future__ import annotations
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# 索引记录：消息在日志中的偏移(u64)、长度(u32)、会话id的crc32(u32)
+_INDEX_RECORD = struct.Struct("<QII")
+
+
+def _session_crc(session_id: str) -> int:
+    return zlib.crc32(session_id.encode("utf-8"))
+
+
+class ConversationJournal:
+    """
+    追加写入的JSONL会话日志，每条消息到达即写入操作系统（进程被杀也不丢），
+    fsync按条数批量进行，未满批的消息由定时器在fsync_interval秒后落盘。
+    旁路的定长索引文件记录每条消息的偏移，读取最近N条或恢复某个会话时
+    只需从索引尾部回扫并通过mmap切片解析对应行，无需解析整个日志。
+    """
+
+    def __init__(self, path: Path, fsync_every: int = 16, fsync_interval: float = 1.0):
+        self.path = Path(path)
+        self.index_path = self.path.with_suffix(self.path.suffix + ".idx")
+        self._fsync_every = fsync_every
+        self._fsync_interval = fsync_interval
+        self._lock = threading.Lock()
+        self._log = None
+        self._index = None
+        self._pending = 0
+        self._timer: Optional[threading.Timer] = None
+
+    # ---- 写入 ----
+
+    def _open(self) -> None:
+        if self._log is not None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._log = open(self.path, "ab")
+        self._index = open(self.index_path, "ab")
+        self._repair_index()
+
+    def _repair_index(self) -> None:
+        """ 进程崩溃可能导致索引落后于日志，从最后一条已索引消息之后补齐 """
+        log_size = self.path.stat().st_size
+        index_size = self.index_path.stat().st_size
+        index_size -= index_size % _INDEX_RECORD.size
+        indexed_end = 0
+        if index_size:
+            with open(self.index_path, "rb") as f:
+                f.seek(index_size - _INDEX_RECORD.size)
+                offset, length, _ = _INDEX_RECORD.unpack(f.read(_INDEX_RECORD.size))
+                indexed_end = offset + length
+        if indexed_end >= log_size:
+            return
+
+        self._index.truncate(index_size)
+        with open(self.path, "rb") as f:
+            f.seek(indexed_end)
+            offset = indexed_end
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # 未写完整的最后一行
+                try:
+                    session_id = json.loads(line)["sid"]
+                except (ValueError, KeyError):
+                    session_id = ""
+                self._index.write(_INDEX_RECORD.pack(offset, len(line), _session_crc(session_id)))
+                offset += len(line)
+        self._index.flush()
+
+    def append(self, session_id: str, role: str, content: str) -> None:
+        record = {"sid": session_id, "ts": time.time(), "role": role, "content": content}
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8", "surrogatepass")
+        with self._lock:
+            self._open()
+            offset = self._log.tell()
+            self._log.write(line)
+            self._index.write(_INDEX_RECORD.pack(offset, len(line), _session_crc(session_id)))
+            self._log.flush()
+            self._index.flush()
+            self._pending += 1
+            if self._pending >= self._fsync_every:
+                self._sync()
+            elif self._timer is None:
+                self._timer = threading.Timer(self._fsync_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _sync(self) -> None:
+        for f in (self._log, self._index):
+            f.flush()
+            os.fsync(f.fileno())
+        self._pending = 0
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._log is not None and self._pending:
+                self._sync()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._log is None:
+                return
+            self._sync()
+            self._log.close()
+            self._index.close()
+            self._log = None
+            self._index = None
+
+    # ---- 读取 ----
+
+    def tail(self, n: Optional[int] = None, session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """ 返回最近n条消息（可限定会话），n为None时返回该会话全部消息 """
+        with self._lock:
+            if not self.path.exists():
+                return []
+            self._open()
+            self._log.flush()
+            self._index.flush()
+            log_size = self.path.stat().st_size
+            if log_size == 0 or self.index_path.stat().st_size < _INDEX_RECORD.size:
+                return []
+
+            crc = _session_crc(session_id) if session_id is not None else None
+            with open(self.index_path, "rb") as index_file, open(self.path, "rb") as log_file:
+                index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+                log_map = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    records = []
+                    position = len(index_map) - len(index_map) % _INDEX_RECORD.size
+                    while position > 0 and (n is None or len(records) < n):
+                        position -= _INDEX_RECORD.size
+                        offset, length, record_crc = _INDEX_RECORD.unpack_from(index_map, position)
+                        if crc is not None and record_crc != crc:
+                            continue
+                        if offset + length > log_size:
+                            continue
+                        record = json.loads(log_map[offset:offset + length])
+                        if session_id is not None and record.get("sid") != session_id:
+                            continue
+                        records.append(record)
+                finally:
+                    index_map.close()
+                    log_map.close()
+        records.reverse()
+        return records
+
+    def last_session_id(self) -> Optional[str]:
+        last = self.tail(1)
+        return last[0]["sid"] if last else None
+
+
+__all__ = ["ConversationJournal"]
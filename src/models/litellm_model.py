@@ -1,17 +1,92 @@
 from __future__ import annotations
 
-import litellm
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, List, Optional
+
+from src.models.response_cache import ResponseCache
 
 
 _SURROGATE_FILTER = dict.fromkeys(range(0xD800, 0xE000), "")
 
 
+def _litellm() -> Any:
+    """ litellm导入需要数秒，推迟到第一次真正请求模型时；之后由sys.modules直接返回 """
+    import litellm
+
+    return litellm
+
+
+def preload_litellm() -> None:
+    """ 在后台线程中提前导入litellm，交互式启动时可与用户输入重叠 """
+    threading.Thread(target=_litellm, name="litellm-preload", daemon=True).start()
+
+
+@dataclass
+class GenerationMetrics:
+    """ 单次生成的时延统计 """
+
+    model: str
+    streamed: bool
+    time_to_first_token: Optional[float] = None
+    total_time: float = 0.0
+    output_tokens: int = 0
+    tokens_per_second: Optional[float] = None
+    cached: bool = False
+
+
+class _StreamAssembler:
+    """ 增量拼接流式输出，并记录首token时间与吞吐 """
+
+    def __init__(self, model: str):
+        self._started = time.perf_counter()
+        self._parts: List[str] = []
+        self._chunks = 0
+        self._usage_tokens: Optional[int] = None
+        self.metrics = GenerationMetrics(model=model, streamed=True)
+
+    @staticmethod
+    def _delta_text(chunk: Any) -> str:
+        try:
+            return chunk.choices[0].delta.content or ""
+        except (AttributeError, IndexError):
+            return ""
+
+    def feed(self, chunk: Any) -> str:
+        usage = getattr(chunk, "usage", None)
+        if usage is not None and getattr(usage, "completion_tokens", None):
+            self._usage_tokens = usage.completion_tokens
+
+        text = self._delta_text(chunk)
+        if text:
+            if self.metrics.time_to_first_token is None:
+                self.metrics.time_to_first_token = time.perf_counter() - self._started
+            self._parts.append(text)
+            self._chunks += 1
+        return text
+
+    def finish(self) -> str:
+        metrics = self.metrics
+        metrics.total_time = time.perf_counter() - self._started
+        # 提供商未返回usage时，以内容chunk数近似token数
+        metrics.output_tokens = self._usage_tokens or self._chunks
+        generation_time = metrics.total_time - (metrics.time_to_first_token or 0.0)
+        if metrics.output_tokens and generation_time > 0:
+            metrics.tokens_per_second = metrics.output_tokens / generation_time
+        return "".join(self._parts).strip()
+
+
 class LitellmModel:
-    def __init__(self, api_key: str, model_name: str, api_base: str = None, custom_llm_provider: str = None):
+    def __init__(self, api_key: str, model_name: str, api_base: str = None, custom_llm_provider: str = None, cache: Optional[ResponseCache] = None):
         self.api_key = api_key
         self.model_name = model_name
         self.api_base = api_base
         self.custom_llm_provider = custom_llm_provider
+        self.cache = cache
+        self.last_metrics: Optional[GenerationMetrics] = None
+        self.metrics_history: Deque[GenerationMetrics] = deque(maxlen=100)
 
     @staticmethod
     def _sanitize(text: str) -> str:
@@ -19,14 +94,14 @@ class LitellmModel:
             return ""
         return text.translate(_SURROGATE_FILTER)
 
-    def generate_response(self, task: str, template: str) -> str:
+    def _completion_kwargs(self, task: str, template: str, stream: bool = False) -> Dict[str, Any]:
         system_prompt = self._sanitize(template)
         user_prompt = self._sanitize(task)
         messages = [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ]
-        
+
         completion_kwargs = {
             "model": self.model_name,
             "messages": messages,
@@ -36,6 +111,100 @@ class LitellmModel:
             completion_kwargs["api_base"] = self.api_base
         if self.custom_llm_provider:
             completion_kwargs["custom_llm_provider"] = self.custom_llm_provider
-            
-        response = litellm.completion(**completion_kwargs)
-        return response["choices"][0]["message"]["content"].strip()
\ No newline at end of file
+        if stream:
+            completion_kwargs["stream"] = True
+            completion_kwargs["stream_options"] = {"include_usage": True}
+        return completion_kwargs
+
+    def _record(self, metrics: GenerationMetrics) -> None:
+        self.last_metrics = metrics
+        self.metrics_history.append(metrics)
+
+    def _cache_lookup(self, task: str, template: str, use_cache: bool) -> Optional[str]:
+        if self.cache is None:
+            return None
+        if not use_cache:
+            self.cache.record_bypass()
+            return None
+        cached = self.cache.get(self.model_name, self._sanitize(template), self._sanitize(task))
+        if cached is not None:
+            self._record(GenerationMetrics(model=self.model_name, streamed=False, time_to_first_token=0.0, cached=True))
+        return cached
+
+    def _cache_store(self, task: str, template: str, content: str, use_cache: bool) -> None:
+        if self.cache is not None and use_cache and content:
+            self.cache.put(self.model_name, self._sanitize(template), self._sanitize(task), content)
+
+    def generate_response(self, task: str, template: str, on_chunk: Optional[Callable[[str], None]] = None, use_cache: bool = True) -> str:
+        """
+        阻塞生成完整回复；提供on_chunk时改为流式请求，每收到一段文本回调一次。
+        use_cache=False时跳过响应缓存（例如需要重新采样时）。
+        """
+        if on_chunk is not None:
+            parts = []
+            for text in self.stream_response(task, template, use_cache=use_cache):
+                on_chunk(text)
+                parts.append(text)
+            return "".join(parts).strip()
+
+        cached = self._cache_lookup(task, template, use_cache)
+        if cached is not None:
+            return cached
+
+        started = time.perf_counter()
+        response = _litellm().completion(**self._completion_kwargs(task, template))
+        content = response["choices"][0]["message"]["content"].strip()
+        self._cache_store(task, template, content, use_cache)
+
+        elapsed = time.perf_counter() - started
+        usage = response.get("usage") or {}
+        tokens = usage.get("completion_tokens") or 0
+        self._record(GenerationMetrics(
+            model=self.model_name,
+            streamed=False,
+            time_to_first_token=elapsed,
+            total_time=elapsed,
+            output_tokens=tokens,
+            tokens_per_second=tokens / elapsed if tokens and elapsed > 0 else None,
+        ))
+        return content
+
+    def stream_response(self, task: str, template: str, use_cache: bool = True) -> Iterator[str]:
+        """ 同步流式接口：逐段产出文本，结束后在last_metrics中记录首token时间与吞吐 """
+        cached = self._cache_lookup(task, template, use_cache)
+        if cached is not None:
+            yield cached
+            return
+
+        assembler = _StreamAssembler(self.model_name)
+        for chunk in _litellm().completion(**self._completion_kwargs(task, template, stream=True)):
+            text = assembler.feed(chunk)
+            if text:
+                yield text
+        self._cache_store(task, template, assembler.finish(), use_cache)
+        self._record(assembler.metrics)
+
+    async def astream_response(self, task: str, template: str, use_cache: bool = True) -> AsyncIterator[str]:
+        """ 基于litellm.acompletion(stream=True)的异步流式接口 """
+        cached = self._cache_lookup(task, template, use_cache)
+        if cached is not None:
+            yield cached
+            return
+
+        assembler = _StreamAssembler(self.model_name)
+        response = await _litellm().acompletion(**self._completion_kwargs(task, template, stream=True))
+        async for chunk in response:
+            text = assembler.feed(chunk)
+            if text:
+                yield text
+        self._cache_store(task, template, assembler.finish(), use_cache)
+        self._record(assembler.metrics)
+
+    async def agenerate_response(self, task: str, template: str, on_chunk: Optional[Callable[[str], None]] = None, use_cache: bool = True) -> str:
+        """ 异步生成完整回复，内部始终走流式请求以记录首token时间 """
+        parts = []
+        async for text in self.astream_response(task, template, use_cache=use_cache):
+            if on_chunk is not None:
+                on_chunk(text)
+            parts.append(text)
+        return "".join(parts).strip()
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _digest(*parts: str) -> str:
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+def _normalize(text: str, whitespace: bool = True, casefold: bool = False) -> str:
+    if whitespace:
+        text = _WHITESPACE.sub(" ", text).strip()
+    return text.casefold() if casefold else text
+
+
+class ResponseCache:
+    """
+    LLM回复缓存：内存LRU层 + 可选SQLite磁盘层。
+    键由模型名、系统提示与用户提示组成；开启规范化时，精确键未命中再尝试规范化键。
+    空白（缩进、换行分隔的条目、粘贴的代码）和大小写（标题、名称、标识符）的差异往往改变提示的含义，
+    因此折叠空白(normalized_keys)与忽略大小写(casefold_keys)都须显式开启。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 512,
+        ttl: Optional[float] = 3600.0,
+        db_path: Optional[Path] = None,
+        max_db_bytes: int = 64 * 1024 * 1024,
+        normalized_keys: bool = False,
+        casefold_keys: bool = False,
+    ):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._db_path = db_path
+        self._max_db_bytes = max_db_bytes
+        self._normalized_keys = normalized_keys
+        self._casefold_keys = casefold_keys
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._stats: Dict[str, int] = {
+            "hits": 0,
+            "normalized_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0,
+            "bypasses": 0,
+        }
+
+    def keys(self, model: str, system_prompt: str, user_prompt: str) -> Tuple[str, Optional[str]]:
+        exact = "x:" + _digest(model, system_prompt, user_prompt)
+        if not self._normalized_keys and not self._casefold_keys:
+            return exact, None
+        # 各种规范化使用不同前缀，切换设置后不会命中另一种方式写入的条目
+        prefix = {(True, False): "w:", (True, True): "c:", (False, True): "f:"}[
+            (self._normalized_keys, self._casefold_keys)
+        ]
+        return exact, prefix + _digest(
+            model,
+            _normalize(system_prompt, self._normalized_keys, self._casefold_keys),
+            _normalize(user_prompt, self._normalized_keys, self._casefold_keys),
+        )
+
+    # ---- 磁盘层 ----
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db_path is None:
+            return None
+        if self._db is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self._db_path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, expires REAL, "
+                "last_access REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses(last_access)")
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[str, Optional[float]]]:
+        db = self._connection()
+        if db is None:
+            return None
+        row = db.execute("SELECT response, expires FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= now:
+            db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def _disk_put(self, keys, response: str, expires: Optional[float], now: float) -> None:
+        db = self._connection()
+        if db is None:
+            return
+        size = len(response.encode("utf-8", "surrogatepass"))
+        db.executemany(
+            "INSERT OR REPLACE INTO responses (key, response, expires, last_access, size) VALUES (?, ?, ?, ?, ?)",
+            [(key, response, expires, now, size) for key in keys],
+        )
+        # 超出容量时按最近访问时间淘汰
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total > self._max_db_bytes:
+            db.execute("DELETE FROM responses WHERE expires IS NOT NULL AND expires <= ?", (now,))
+            total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            for key, row_size in db.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                if total <= self._max_db_bytes:
+                    break
+                db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                total -= row_size
+                self._stats["evictions"] += 1
+
+    # ---- 内存层 ----
+
+    def _memory_get(self, key: str, now: float) -> Optional[str]:
+        item = self._memory.get(key)
+        if item is None:
+            return None
+        response, expires = item
+        if expires is not None and expires <= now:
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return response
+
+    def _memory_put(self, key: str, response: str, expires: Optional[float]) -> None:
+        self._memory[key] = (response, expires)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self._max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    # ---- 公共接口 ----
+
+    def get(self, model: str, system_prompt: str, user_prompt: str) -> Optional[str]:
+        exact, normalized = self.keys(model, system_prompt, user_prompt)
+        now = time.time()
+        with self._lock:
+            for key in (exact, normalized):
+                if key is None:
+                    continue
+                response = self._memory_get(key, now)
+                if response is None:
+                    disk_item = self._disk_get(key, now)
+                    if disk_item is not None:
+                        response = disk_item[0]
+                        self._memory_put(key, response, disk_item[1])
+                        self._stats["disk_hits"] += 1
+                if response is not None:
+                    self._stats["hits"] += 1
+                    if key is normalized:
+                        self._stats["normalized_hits"] += 1
+                    return response
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, model: str, system_prompt: str, user_prompt: str, response: str, ttl: Optional[float] = None) -> None:
+        keys = [key for key in self.keys(model, system_prompt, user_prompt) if key is not None]
+        now = time.time()
+        ttl = self._ttl if ttl is None else ttl
+        expires = now + ttl if ttl else None
+        with self._lock:
+            for key in keys:
+                self._memory_put(key, response, expires)
+            self._disk_put(keys, response, expires, now)
+            self._stats["writes"] += 1
+
+    def record_bypass(self) -> None:
+        with self._lock:
+            self._stats["bypasses"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "memory_entries": len(self._memory),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM responses")
+
+
+def build_response_cache() -> Optional[ResponseCache]:
+    """
+    根据环境变量构造缓存：LLM_CACHE=off|memory|disk（默认memory），
+    LLM_CACHE_TTL秒数（0表示不过期），LLM_CACHE_PATH为disk模式的SQLite文件路径，
+    LLM_CACHE_NORMALIZE=true时规范化键折叠空白，LLM_CACHE_CASEFOLD=true时忽略大小写。
+    """
+    mode = os.getenv("LLM_CACHE", "memory").lower()
+    if mode in ("off", "false", "0", "none"):
+        return None
+    ttl = float(os.getenv("LLM_CACHE_TTL", "3600"))
+    db_path = None
+    if mode == "disk":
+        default_path = Path(__file__).resolve().parent / "data" / "llm_cache.sqlite3"
+        db_path = Path(os.getenv("LLM_CACHE_PATH", str(default_path)))
+    return ResponseCache(
+        max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "512")),
+        ttl=ttl or None,
+        db_path=db_path,
+        max_db_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024),
+        normalized_keys=os.getenv("LLM_CACHE_NORMALIZE", "false").lower() == "true",
+        casefold_keys=os.getenv("LLM_CACHE_CASEFOLD", "false").lower() == "true",
+    )
+
+
+__all__ = ["ResponseCache", "build_response_cache"]
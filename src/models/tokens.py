@@ -0,0 +1,21 @@
+from __future__ import annotations
+
+import math
+import re
+
+# CJK统一表意文字、假名、谚文与全角标点：通常每个字符约占一个token
+_CJK = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    不依赖具体分词器的token数估算：CJK字符按1个token计，其余字符按约4个字符1个token计。
+    用于预算控制与前后对比，不追求与提供商计费完全一致。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    return cjk + math.ceil((len(text) - cjk) / 4)
+
+
+__all__ = ["estimate_tokens"]
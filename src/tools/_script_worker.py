@@ -0,0 +1,139 @@
+"""
+CodeTool常驻worker进程入口：python _script_worker.py <script_path>
+
+导入脚本模块（不执行其__main__分支）后，从stdin逐行读取JSON请求，
+调用脚本的run(args)并把结果以JSON行写回。脚本的print输出被捕获并作为结果返回。
+
+流式请求：{"__stream__": header} 之后逐行发送 {"item": ...}，以 {"end": true}
+（或 {"abort": 原因}）结束；worker边接收边调用run_stream(header, items)。
+返回bytes的结果以base64放在output_b64中。
+"""
+import ast
+import base64
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import sys
+import traceback
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+
+def _rss_kb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _load_entry(script_path):
+    # 先静态检查run入口，避免为不支持常驻模式的脚本执行其顶层代码
+    with open(script_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), script_path)
+    if not any(isinstance(node, ast.FunctionDef) and node.name == "run" for node in tree.body):
+        raise AttributeError(f"{script_path} does not define run(args)")
+
+    script_dir = os.path.dirname(os.path.abspath(script_path))
+    if script_dir not in sys.path:
+        sys.path.insert(0, script_dir)
+    spec = importlib.util.spec_from_file_location("_codetool_script", script_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    entry = getattr(module, "run", None)
+    if not callable(entry):
+        raise AttributeError(f"{script_path} does not define run(args)")
+    stream_entry = getattr(module, "run_stream", None)
+    return entry, stream_entry if callable(stream_entry) else None
+
+
+class _ItemStream:
+    """ 把流式请求的后续行转换为条目迭代器；脚本提前返回时由drain读完剩余行，保持协议同步 """
+
+    def __init__(self, lines):
+        self._lines = lines
+        self.done = False
+
+    def __iter__(self):
+        while not self.done:
+            line = next(self._lines, None)
+            if line is None:
+                self.done = True
+                raise EOFError("stream closed before end marker")
+            if not line.strip():
+                continue
+            message = json.loads(line)
+            if "item" in message:
+                yield message["item"]
+            elif "abort" in message:
+                self.done = True
+                raise RuntimeError(f"stream aborted by caller: {message['abort']}")
+            else:
+                self.done = True
+
+    def drain(self):
+        try:
+            for _ in self:
+                pass
+        except (RuntimeError, EOFError, ValueError):
+            pass
+
+
+def main():
+    # 协议使用原始stdout，脚本内对fd 1的直接写入被重定向到stderr，避免污染协议
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+    def reply(payload):
+        protocol.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    try:
+        entry, stream_entry = _load_entry(sys.argv[1])
+    except BaseException as e:
+        reply({"ready": False, "error": f"{type(e).__name__}: {e}"})
+        return 1
+    reply({"ready": True, "stream": stream_entry is not None, "rss_kb": _rss_kb()})
+
+    lines = iter(sys.stdin)
+    for line in lines:
+        if not line.strip():
+            continue
+        captured = io.StringIO()
+        items = None
+        try:
+            args = json.loads(line)
+            with contextlib.redirect_stdout(captured):
+                if isinstance(args, dict) and "__stream__" in args:
+                    items = _ItemStream(lines)
+                    if stream_entry is None:
+                        raise AttributeError("script does not define run_stream(header, items)")
+                    result = stream_entry(args["__stream__"], iter(items))
+                else:
+                    result = entry(args)
+            if items is not None:
+                items.drain()
+            if isinstance(result, (bytes, bytearray)):
+                reply({"ok": True, "output_b64": base64.b64encode(result).decode("ascii"), "rss_kb": _rss_kb()})
+                continue
+            output = captured.getvalue()
+            if result is not None:
+                output += str(result)
+            reply({"ok": True, "output": output.strip(), "rss_kb": _rss_kb()})
+        except SystemExit as e:
+            if items is not None:
+                items.drain()
+            reply({"ok": False, "error": (captured.getvalue() + str(e.code or "")).strip(), "rss_kb": _rss_kb()})
+        except Exception:
+            error = traceback.format_exc()
+            if items is not None:
+                items.drain()
+            reply({"ok": False, "error": error, "rss_kb": _rss_kb()})
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+class ToolCatalogCache:
+    """
+    工具目录缓存：进程内memo + 磁盘持久化。
+    以服务器脚本的绝对路径为键，并记录脚本mtime，脚本被修改后缓存自动失效。
+    """
+
+    def __init__(self, cache_path: Path):
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    @staticmethod
+    def _key(script_path: Path) -> str:
+        return str(Path(script_path).resolve())
+
+    @staticmethod
+    def _mtime_ns(script_path: Path) -> Optional[int]:
+        try:
+            return Path(script_path).stat().st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self._cache_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _flush(self) -> None:
+        try:
+            self._cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._cache_path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self._entries, ensure_ascii=False), encoding="utf-8")
+            os.replace(tmp_path, self._cache_path)
+        except OSError as e:
+            print(f"Warning: Could not persist tool catalog cache: {e}")
+
+    def get(self, script_path: Path) -> Optional[List[Dict[str, Any]]]:
+        mtime_ns = self._mtime_ns(script_path)
+        if mtime_ns is None:
+            return None
+        with self._lock:
+            entry = self._load().get(self._key(script_path))
+        if not entry or entry.get("mtime_ns") != mtime_ns:
+            return None
+        return entry.get("tools")
+
+    def put(self, script_path: Path, tools: List[Dict[str, Any]]) -> None:
+        mtime_ns = self._mtime_ns(script_path)
+        if mtime_ns is None:
+            return
+        with self._lock:
+            self._load()[self._key(script_path)] = {"mtime_ns": mtime_ns, "tools": tools}
+            self._flush()
+
+    def invalidate(self, script_path: Optional[Path] = None) -> None:
+        with self._lock:
+            entries = self._load()
+            if script_path is None:
+                entries.clear()
+            else:
+                entries.pop(self._key(script_path), None)
+            self._flush()
+
+
+# Global catalog cache instance
+tool_catalog_cache = ToolCatalogCache(Path(__file__).resolve().parent / "data" / "tool_catalog.json")
+
+__all__ = ["ToolCatalogCache", "tool_catalog_cache"]
@@ -1,26 +1,353 @@
 import asyncio
+import atexit
+import concurrent.futures
+import os
 import sys
-from typing import Any, Dict, Optional
+import threading
+import time
+from dataclasses import dataclass
+from importlib import import_module
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Hashable, List, Optional, Sequence, Union
 
-from mcp import ClientSession, StdioServerParameters
-from mcp.client.stdio import stdio_client
+from src.tools.catalog import tool_catalog_cache
+from src.tools.protocol import Tool, ToolFailure
 
-from src.tools.protocol import Tool
+# mcp客户端栈导入较慢（约1秒），只在真正需要连接服务器时导入；
+# 命中工具目录缓存的工具集无需导入mcp即可列出工具
+if TYPE_CHECKING:
+    from mcp import ClientSession, StdioServerParameters
+
+
+@dataclass(frozen=True)
+class InProcessServerParameters:
+    """ 进程内MCP服务器：导入module中的FastMCP实例，经内存传输调用，免去子进程与管道开销 """
+
+    module: str
+    attr: str = "mcp"
+
+    def load_server(self) -> Any:
+        return getattr(import_module(self.module), self.attr)
+
+
+ServerParameters = Union["StdioServerParameters", InProcessServerParameters]
+
+TRANSPORTS = ("stdio", "inprocess")
+
+
+def build_server_params(
+    server_script: Path,
+    module: str,
+    transport: str = "stdio",
+    env_prefixes: Sequence[str] = (),
+) -> ServerParameters:
+    """
+    根据TOOL.md中声明的transport构造服务器参数，默认stdio以保持进程隔离。
+    stdio子进程只继承mcp默认的少量环境变量，env_prefixes指定的变量（如WEATHER_）会额外传给它。
+    """
+    if transport == "stdio":
+        from mcp import StdioServerParameters
+
+        prefixes = tuple(env_prefixes)
+        env = {key: value for key, value in os.environ.items() if prefixes and key.startswith(prefixes)}
+        return StdioServerParameters(
+            command=sys.executable,
+            args=[str(server_script)],
+            env=env or None
+        )
+    if transport == "inprocess":
+        return InProcessServerParameters(module=module)
+    raise ValueError(f"Unknown MCP transport '{transport}', expected one of {TRANSPORTS}")
+
+
+def _describe_params(server_params: ServerParameters) -> str:
+    if isinstance(server_params, InProcessServerParameters):
+        return f"inprocess:{server_params.module}.{server_params.attr}"
+    return " ".join([server_params.command, *server_params.args])
+
+
+def _params_key(server_params: ServerParameters) -> Hashable:
+    """ StdioServerParameters不可哈希，转换为会话池的键 """
+    if isinstance(server_params, InProcessServerParameters):
+        return server_params
+    env = tuple(sorted(server_params.env.items())) if server_params.env else None
+    cwd = str(server_params.cwd) if server_params.cwd else None
+    return (server_params.command, tuple(server_params.args), env, cwd)
+
+
+class _PooledSession:
+    """ 单个MCP服务器的长连接会话，由专属task持有其上下文 """
+
+    def __init__(self, server_params: ServerParameters):
+        self.server_params = server_params
+        self.session: Optional["ClientSession"] = None
+        self.error: Optional[BaseException] = None
+        self.ready = asyncio.Event()
+        self.closed = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.started_at = time.monotonic()
+        self.last_used = self.started_at
+        self.in_flight = 0
+        self.calls = 0
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        # stdio_client基于anyio的task group，进入与退出必须在同一个task中完成
+        try:
+            from mcp import ClientSession
+            from mcp.client.stdio import stdio_client
+            from mcp.shared.memory import create_connected_server_and_client_session
+
+            if isinstance(self.server_params, InProcessServerParameters):
+                server = self.server_params.load_server()
+                async with create_connected_server_and_client_session(server) as session:
+                    await self._hold(session)
+            else:
+                async with stdio_client(self.server_params) as (read, write):
+                    async with ClientSession(read, write) as session:
+                        await session.initialize()
+                        await self._hold(session)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.session = None
+            self.ready.set()
+            self.closed.set()
+
+    async def _hold(self, session: "ClientSession") -> None:
+        self.session = session
+        self.ready.set()
+        await self._stop.wait()
+
+    async def wait_ready(self) -> "ClientSession":
+        await self.ready.wait()
+        if self.session is None:
+            raise ConnectionError(f"MCP server failed to start: {self.error}")
+        return self.session
+
+    async def close(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._task is None:
+            return
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        if not done:
+            self._task.cancel()
+
+
+class MCPSessionPool:
+    """
+    按服务器参数（stdio或进程内）复用MCP会话的连接池。
+    所有会话运行在一个后台事件循环线程中，同步代码通过run_coroutine_threadsafe提交请求。
+    """
+
+    def __init__(self, idle_timeout: Optional[float] = 300.0, call_timeout: Optional[float] = 120.0, max_restarts: int = 1):
+        self._idle_timeout = idle_timeout
+        self._call_timeout = call_timeout
+        self._max_restarts = max_restarts
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._reaper: Optional[concurrent.futures.Future] = None
+        self._lock = threading.Lock()
+        self._sessions: Dict[Hashable, _PooledSession] = {}
+        self._stats: Dict[str, int] = {
+            "calls": 0,
+            "errors": 0,
+            "sessions_started": 0,
+            "sessions_reused": 0,
+            "restarts": 0,
+            "idle_closed": 0,
+        }
+
+    # ---- 后台事件循环 ----
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name="mcp-session-pool", daemon=True)
+                thread.start()
+                self._loop = loop
+                self._thread = thread
+                if self._idle_timeout:
+                    self._reaper = asyncio.run_coroutine_threadsafe(self._reap_idle(), loop)
+            return self._loop
+
+    def submit(self, coro_factory: Callable[[], Awaitable[Any]], timeout: Optional[float] = None) -> Any:
+        """ 在后台事件循环上执行协程并阻塞等待结果 """
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(coro_factory(), loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    # ---- 会话管理（仅在后台循环中调用） ----
+
+    async def _acquire(self, server_params: ServerParameters) -> _PooledSession:
+        key = _params_key(server_params)
+        entry = self._sessions.get(key)
+        if entry is not None and entry.closed.is_set():
+            # 服务器已退出（崩溃或被关闭），重新拉起
+            self._sessions.pop(key, None)
+            self._stats["restarts"] += 1
+            entry = None
+
+        if entry is None:
+            entry = _PooledSession(server_params)
+            self._sessions[key] = entry
+            entry.start()
+            self._stats["sessions_started"] += 1
+        else:
+            self._stats["sessions_reused"] += 1
+
+        try:
+            await entry.wait_ready()
+        except ConnectionError:
+            if self._sessions.get(key) is entry:
+                self._sessions.pop(key, None)
+            raise
+        return entry
+
+    async def _discard(self, entry: _PooledSession) -> None:
+        key = _params_key(entry.server_params)
+        if self._sessions.get(key) is entry:
+            self._sessions.pop(key, None)
+        await entry.close()
+
+    async def _request(self, server_params: ServerParameters, method: str, *args, **kwargs) -> Any:
+        self._stats["calls"] += 1
+        for attempt in range(self._max_restarts + 1):
+            entry = await self._acquire(server_params)
+            entry.in_flight += 1
+            try:
+                coro = getattr(entry.session, method)(*args, **kwargs)
+                result = await asyncio.wait_for(coro, self._call_timeout)
+                entry.calls += 1
+                return result
+            except asyncio.TimeoutError:
+                # 服务器无响应，丢弃会话以便下次重启，但不重试可能很慢的调用
+                self._stats["errors"] += 1
+                await self._discard(entry)
+                raise
+            except Exception:
+                # 工具本身的错误以isError结果返回，走到这里说明传输层已损坏
+                self._stats["errors"] += 1
+                await self._discard(entry)
+                if attempt >= self._max_restarts:
+                    raise
+                self._stats["restarts"] += 1
+            finally:
+                entry.in_flight -= 1
+                entry.last_used = time.monotonic()
+
+    async def _reap_idle(self) -> None:
+        interval = max(1.0, min(self._idle_timeout, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for entry in list(self._sessions.values()):
+                if entry.in_flight == 0 and now - entry.last_used > self._idle_timeout:
+                    await self._discard(entry)
+                    self._stats["idle_closed"] += 1
+
+    async def _close_all(self) -> None:
+        entries = list(self._sessions.values())
+        self._sessions.clear()
+        await asyncio.gather(*(entry.close() for entry in entries), return_exceptions=True)
+
+    # ---- 同步API ----
+
+    def call_tool(self, server_params: ServerParameters, name: str, arguments: Dict[str, Any]) -> Any:
+        return self.submit(lambda: self._request(server_params, "call_tool", name, arguments=arguments))
+
+    def list_tools(self, server_params: ServerParameters) -> Any:
+        return self.submit(lambda: self._request(server_params, "list_tools"))
+
+    def warm(self, server_params: ServerParameters) -> None:
+        """ 启动（或复用）服务器会话并完成initialize握手，不发起任何请求 """
+        self.submit(lambda: self._acquire(server_params))
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        sessions = [
+            {
+                "command": _describe_params(entry.server_params),
+                "calls": entry.calls,
+                "in_flight": entry.in_flight,
+                "uptime": round(now - entry.started_at, 3),
+                "idle": round(now - entry.last_used, 3),
+            }
+            for entry in list(self._sessions.values())
+            if entry.session is not None
+        ]
+        return {**self._stats, "active_sessions": len(sessions), "sessions": sessions}
+
+    def shutdown(self) -> None:
+        with self._lock:
+            loop, thread, reaper = self._loop, self._thread, self._reaper
+            self._loop = None
+            self._thread = None
+            self._reaper = None
+        if loop is None or loop.is_closed():
+            return
+        if reaper is not None:
+            reaper.cancel()
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_all(), loop).result(10)
+        except Exception:
+            pass
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
+        loop.close()
+
+
+def _env_float(name: str, default: Optional[float]) -> Optional[float]:
+    value = os.getenv(name)
+    if not value:
+        return default
+    parsed = float(value)
+    return parsed if parsed > 0 else None
+
+
+# Global session pool instance
+mcp_session_pool = MCPSessionPool(
+    idle_timeout=_env_float("MCP_POOL_IDLE_TIMEOUT", 300.0),
+    call_timeout=_env_float("MCP_POOL_CALL_TIMEOUT", 120.0),
+)
+atexit.register(mcp_session_pool.shutdown)
 
 
 class MCPTool(Tool):
     """ 以MCP的形式进行TOOL的执行 """
 
-    def __init__(self, name: str, description: str, input_schema: Dict[str, Any], server_params: StdioServerParameters):
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        input_schema: Dict[str, Any],
+        server_params: ServerParameters,
+        annotations: Optional[Dict[str, Any]] = None,
+    ):
         self._name = name
         self._description = description
         self._input_schema = input_schema
         self._server_params = server_params
+        self._annotations = annotations or {}
 
     @property
     def name(self) -> str:
         return self._name
 
+    @property
+    def annotations(self) -> Dict[str, Any]:
+        """ 服务器声明的MCP工具注解（readOnlyHint、idempotentHint等） """
+        return self._annotations
+
     def get_definition(self) -> Dict[str, Any]:
         return {
             "name": self.name,
@@ -28,31 +355,51 @@ class MCPTool(Tool):
             "parameters": self._input_schema,
         }
 
-    def execute(self, **kwargs) -> str:
-        async def _run():
-            async with stdio_client(self._server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    result = await session.call_tool(self.name, arguments=kwargs)
-                    return result
-
+    def warm_up(self) -> bool:
         try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
+            mcp_session_pool.warm(self._server_params)
+            return True
+        except Exception:
+            return False
 
+    def execute(self, **kwargs) -> str:
         try:
-            result = loop.run_until_complete(_run())
-            
+            result = mcp_session_pool.call_tool(self._server_params, self.name, kwargs)
+
             text_content = []
             for item in result.content:
                 if hasattr(item, 'text'):
                     text_content.append(item.text)
                 else:
                     text_content.append(str(item))
-            return ", ".join(text_content)
+            text = ", ".join(text_content)
+            # 服务器以isError报告的工具错误：原文返回，但标记为失败
+            return ToolFailure(text) if result.isError else text
         except Exception as e:
-            return f"Error executing MCP tool {self.name}: {e}"
+            return ToolFailure(f"Error executing MCP tool {self.name}: {e}")
+
 
+def load_mcp_tools(server_params: ServerParameters, server_script: Optional[Path] = None) -> List[Tool]:
+    """
+    通过会话池发现MCP服务器提供的工具，发现所用的会话会被后续调用复用。
+    提供server_script时，目录按脚本路径与mtime缓存到磁盘，热启动可跳过发现。
+    """
+    catalog = tool_catalog_cache.get(server_script) if server_script else None
+    if catalog is None:
+        tools_result = mcp_session_pool.list_tools(server_params)
+        catalog = [
+            {
+                "name": t.name,
+                "description": t.description,
+                "input_schema": t.inputSchema,
+                "annotations": t.annotations.model_dump(exclude_none=True) if t.annotations else None,
+            }
+            for t in tools_result.tools
+        ]
+        if server_script:
+            tool_catalog_cache.put(server_script, catalog)
 
+    return [
+        MCPTool(t["name"], t["description"], t["input_schema"], server_params, t.get("annotations"))
+        for t in catalog
+    ]
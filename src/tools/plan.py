@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from src.tools.protocol import Tool, ToolFailure
+from src.tools.schema import validate_arguments
+
+# "$c1" 整体引用前一步的结果；"${c1}" 可嵌入更长的字符串中
+_WHOLE_REF = re.compile(r"^\$\{?([A-Za-z_][\w-]*)\}?$")
+_INLINE_REF = re.compile(r"\$\{([A-Za-z_][\w-]*)\}")
+_NUMBER = re.compile(r"^-?\d+(\.\d+)?$")
+
+_PLAN_EXECUTOR = ThreadPoolExecutor(
+    max_workers=max(1, int(os.getenv("TOOL_PLAN_CONCURRENCY", "4"))),
+    thread_name_prefix="tool-plan",
+)
+
+
+class ToolPlanError(ValueError):
+    """ 选择结果不是合法的调用计划（未知工具、重复id或循环引用等） """
+
+
+@dataclass
+class ToolCall:
+    id: str
+    tool: str
+    arguments: Dict[str, Any]
+    depends_on: Set[str] = field(default_factory=set)
+
+
+def _collect_refs(value: Any, refs: Set[str]) -> None:
+    if isinstance(value, str):
+        match = _WHOLE_REF.match(value)
+        if match:
+            refs.add(match.group(1))
+        refs.update(_INLINE_REF.findall(value))
+    elif isinstance(value, list):
+        for item in value:
+            _collect_refs(item, refs)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_refs(item, refs)
+
+
+def _coerce_output(output: str) -> Any:
+    """ 数字形式的工具输出按数字代入，便于下一步作为integer/number参数 """
+    text = output.strip()
+    if _NUMBER.match(text):
+        return float(text) if "." in text else int(text)
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _resolve(value: Any, results: Dict[str, str]) -> Any:
+    if isinstance(value, str):
+        match = _WHOLE_REF.match(value)
+        if match and match.group(1) in results:
+            return _coerce_output(results[match.group(1)])
+        return _INLINE_REF.sub(lambda m: results.get(m.group(1), m.group(0)), value)
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    return value
+
+
+class ToolPlan:
+    """
+    一次工具选择得到的有序调用计划。参数中可用 "$id" 引用之前调用的结果；
+    没有依赖关系的调用按批并发执行。
+    """
+
+    def __init__(self, calls: List[ToolCall]):
+        self.calls = calls
+
+    @classmethod
+    def parse(cls, selection: Any) -> Optional["ToolPlan"]:
+        """ 兼容单个 {"tool", "arguments"} 与 {"calls": [...]} 两种格式 """
+        if isinstance(selection, dict) and "calls" in selection:
+            raw_calls = selection["calls"]
+        elif isinstance(selection, list):
+            raw_calls = selection
+        elif isinstance(selection, dict) and "tool" in selection:
+            raw_calls = [selection]
+        else:
+            return None
+        if not isinstance(raw_calls, list) or not raw_calls:
+            return None
+
+        calls: List[ToolCall] = []
+        for i, raw in enumerate(raw_calls, start=1):
+            if not isinstance(raw, dict) or not raw.get("tool"):
+                raise ToolPlanError(f"call #{i} has no 'tool'")
+            arguments = raw.get("arguments") or {}
+            if not isinstance(arguments, dict):
+                raise ToolPlanError(f"call #{i} arguments must be an object")
+            refs: Set[str] = set()
+            _collect_refs(arguments, refs)
+            calls.append(ToolCall(id=str(raw.get("id") or f"c{i}"), tool=raw["tool"], arguments=arguments, depends_on=refs))
+
+        ids = {call.id for call in calls}
+        if len(ids) != len(calls):
+            raise ToolPlanError("duplicate call ids")
+        for call in calls:
+            # 不是调用id的 "$xxx" 按普通字符串对待
+            call.depends_on &= ids
+        return cls(calls)
+
+    def validate(self, tools: Dict[str, Tool]) -> None:
+        for call in self.calls:
+            if call.tool not in tools:
+                raise ToolPlanError(f"tool '{call.tool}' does not exist")
+
+    def _waves(self) -> List[List[ToolCall]]:
+        done: Set[str] = set()
+        pending = list(self.calls)
+        waves: List[List[ToolCall]] = []
+        while pending:
+            ready = [call for call in pending if call.depends_on <= done]
+            if not ready:
+                raise ToolPlanError("circular references between calls")
+            waves.append(ready)
+            done.update(call.id for call in ready)
+            pending = [call for call in pending if call.id not in done]
+        return waves
+
+    def execute(
+        self,
+        tools: Dict[str, Tool],
+        on_call: Optional[Callable[[ToolCall, Dict[str, Any]], None]] = None,
+        strict: bool = False,
+    ) -> Dict[str, str]:
+        """
+        执行计划，返回 {call_id: 工具输出}；同一批中相互独立的调用并发执行。
+        调用失败时，直接或间接依赖它的调用不再执行，输出为 "skipped: dependency <id> failed"。
+        strict=True时先按工具Schema校验参数（默认交给服务端做宽松的类型转换）。
+        """
+        self.validate(tools)
+        results: Dict[str, str] = {}
+        # 失败（或被跳过）的调用：其输出是错误信息，不能代入依赖它的调用
+        failed: Set[str] = set()
+
+        def run(call: ToolCall) -> Tuple[str, bool]:
+            broken = sorted(call.depends_on & failed)
+            if broken:
+                return f"skipped: dependency {broken[0]} failed", False
+            arguments = _resolve(call.arguments, results)
+            if on_call is not None:
+                on_call(call, arguments)
+            tool = tools[call.tool]
+            if strict:
+                errors = validate_arguments(tool.get_definition().get("parameters") or {}, arguments)
+                if errors:
+                    return f"Error: Invalid arguments for '{call.tool}': " + "; ".join(errors), False
+            try:
+                output = tool.execute(**arguments)
+            except Exception as e:
+                return f"执行工具 '{call.tool}' 时出错: {e}", False
+            ok = not isinstance(output, ToolFailure) and not str(output).startswith("Error")
+            return str(output), ok
+
+        def record(call_id: str, outcome: Tuple[str, bool]) -> None:
+            results[call_id] = outcome[0]
+            if not outcome[1]:
+                failed.add(call_id)
+
+        for wave in self._waves():
+            if len(wave) == 1:
+                record(wave[0].id, run(wave[0]))
+                continue
+            futures = {call.id: _PLAN_EXECUTOR.submit(run, call) for call in wave}
+            for call_id, future in futures.items():
+                record(call_id, future.result())
+        return results
+
+
+__all__ = ["ToolCall", "ToolPlan", "ToolPlanError"]
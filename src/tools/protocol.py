@@ -4,6 +4,10 @@ from abc import ABC, abstractmethod
 from typing import Any, Dict, List
 
 
+class ToolFailure(str):
+    """ 工具执行失败时返回的文本：仍可当作str使用，调用方与缓存可据此识别失败 """
+
+
 class Tool(ABC):
     """ Tool抽象基类 """
 
@@ -21,6 +25,10 @@ class Tool(ABC):
     def execute(self, **kwargs) -> str:
         pass
 
+    def warm_up(self) -> bool:
+        """ 预先启动执行后端（如MCP会话、常驻worker），返回是否已就绪 """
+        return True
+
 
 class ToolSet(ABC):
     """ Toolset抽象基类 """
@@ -45,3 +53,15 @@ class ToolSet(ABC):
     def get_tools(self) -> List[Tool]:
         """ 获取工具所对应的TOOL列表 """
         pass
+
+    def configure(self, options: Dict[str, Any]) -> None:
+        """ 接收TOOL.md front matter中声明的运行选项（如transport），默认忽略 """
+        pass
+
+    def references(self) -> Dict[str, str]:
+        """ 工具描述中按名称引用的长篇资料（如编写指南），渲染工具定义时只附带一次 """
+        return {}
+
+    def warm_up(self) -> bool:
+        """ 预热：发现工具并启动各工具的执行后端，使首次调用无需冷启动 """
+        return all([tool.warm_up() for tool in self.get_tools()])
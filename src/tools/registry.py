@@ -1,13 +1,17 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import json
+import os
+import threading
+from dataclasses import dataclass, field
 from importlib import import_module
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-import yaml
-
-from src.tools.protocol import ToolSet
+from src.config import parse_front_matter
+from src.tools.protocol import Tool, ToolSet
+from src.tools.router import ToolsetRouter
+from src.tools.schema import describe_parameters, prune_schema
 
 
 @dataclass(frozen=True)
@@ -19,64 +23,279 @@ class ToolSetSummary:
     keywords: List[str]
     module: str
     class_name: str
+    options: Dict[str, Any] = field(default_factory=dict)
 
 
 _TOOLSET_SPECS = ()
 
+# TOOL.md front matter中除这些字段外的内容，作为运行选项传给ToolSet.configure
+_SUMMARY_FIELDS = ("name", "description", "keywords", "license", "class_name")
+
+_TOOLSETS_DIR = Path(__file__).resolve().parent.parent.parent / "toolsets"
+
+# 预编译的工具集清单：各TOOL.md已解析的front matter
+_MANIFEST_PATH = Path(__file__).resolve().parent / "data" / "registry_manifest.json"
+# 渲染好的工具调用签名，按工具集目录的源文件指纹持久化，brain提示无需启动工具集即可列出
+_SCHEMAS_PATH = Path(__file__).resolve().parent / "data" / "tool_schemas.json"
+
+
+def _load_json(path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(path: Path, data: Dict[str, Dict[str, Any]], what: str) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Warning: Could not persist {what}: {e}")
+
+
+def _load_manifest() -> Dict[str, Dict[str, Any]]:
+    return _load_json(_MANIFEST_PATH)
+
+
+def _save_manifest(manifest: Dict[str, Dict[str, Any]]) -> None:
+    _save_json(_MANIFEST_PATH, manifest, "toolset manifest")
+
+
+def _source_stamp(directory: Path) -> List[int]:
+    """ 工具集目录下源文件的数量、最新mtime与总大小：任一文件被修改、增删都会改变它 """
+    stats = [
+        path.stat() for path in directory.rglob("*")
+        if path.is_file() and "__pycache__" not in path.parts and path.suffix != ".pyc"
+    ]
+    return [len(stats), max((stat.st_mtime_ns for stat in stats), default=0), sum(stat.st_size for stat in stats)]
+
+
+DEFINITION_MODES = ("compact", "minified", "pretty")
+
+
+def render_tool_definitions(tools: List[Tool], references: Optional[Dict[str, str]] = None, mode: str = "compact") -> str:
+    """ 把工具定义渲染为JSON，引用资料以 [name] 小节附在其后，只出现一次 """
+    definitions = [tool.get_definition() for tool in tools]
+    if mode == "pretty":
+        text = json.dumps(definitions, indent=2, ensure_ascii=False)
+    else:
+        if mode == "compact":
+            definitions = [
+                {**definition, "parameters": prune_schema(definition.get("parameters") or {})}
+                for definition in definitions
+            ]
+        text = json.dumps(definitions, ensure_ascii=False, separators=(",", ":"))
+    for name, content in (references or {}).items():
+        text += f"\n\n[{name}]\n{content.strip()}"
+    return text
+
 
 class ToolRegistry:
     """ 对服务进行注册 """
 
     def __init__(self) -> None:
         self._entries: List[ToolSetSummary] = self._load_entries()
+        # 关键词自动机与BM25索引随条目一次性构建
+        self._router: ToolsetRouter[ToolSetSummary] = ToolsetRouter(self._entries)
+        # 工具集实例按名称单例化，保留其已发现的工具列表
+        self._instances: Dict[str, ToolSet] = {}
+        self._schema_text: Dict[str, str] = {}
+        self._persisted_schemas: Optional[Dict[str, Dict[str, Any]]] = None
+        self._rendering: Set[str] = set()
+        # 工具选择提示中的工具定义：(工具集, 模式) -> (工具列表指纹, 渲染文本)
+        self._definition_text: Dict[Tuple[str, str], Tuple[Tuple[int, ...], str]] = {}
+        self._lock = threading.Lock()
 
     def _load_entries(self) -> List[ToolSetSummary]:
         entries: List[ToolSetSummary] = []
-        toolsets_dir = Path(__file__).resolve().parent.parent.parent / "toolsets"
-        
-        # 扫描TOOL
-        for tool_md in toolsets_dir.glob("*/TOOL.md"):
+        toolsets_dir = _TOOLSETS_DIR
+        manifest = _load_manifest()
+        compiled: Dict[str, Dict[str, Any]] = {}
+
+        # 扫描TOOL；front matter按文件mtime与大小缓存在清单中，未变化时无需导入yaml重新解析
+        for tool_md in sorted(toolsets_dir.glob("*/TOOL.md")):
             try:
-                content = tool_md.read_text(encoding="utf-8")
-                if content.startswith("---"):
-                    parts = content.split("---", 2)
-                    if len(parts) >= 3:
-                        front_matter = yaml.safe_load(parts[1])
-                        module_name = f"toolsets.{tool_md.parent.name}"
-                        
-                        entries.append(
-                            ToolSetSummary(
-                                name=front_matter.get("name", tool_md.parent.name),
-                                description=front_matter.get("description", ""),
-                                keywords=front_matter.get("keywords", []),
-                                module=module_name,
-                                class_name=front_matter.get("class_name", ""),
-                            )
-                        )
+                stat = tool_md.stat()
+                stamp = [stat.st_mtime_ns, stat.st_size]
+                record = manifest.get(tool_md.parent.name)
+                if record and record.get("stamp") == stamp:
+                    front_matter = record["front_matter"]
+                else:
+                    front_matter = parse_front_matter(tool_md.read_text(encoding="utf-8"))
+                if front_matter is None:
+                    continue
+                compiled[tool_md.parent.name] = {"stamp": stamp, "front_matter": front_matter}
+                module_name = f"toolsets.{tool_md.parent.name}"
+
+                entries.append(
+                    ToolSetSummary(
+                        name=front_matter.get("name", tool_md.parent.name),
+                        description=front_matter.get("description", ""),
+                        keywords=front_matter.get("keywords", []),
+                        module=module_name,
+                        class_name=front_matter.get("class_name", ""),
+                        options={
+                            key: value for key, value in front_matter.items()
+                            if key not in _SUMMARY_FIELDS
+                        },
+                    )
+                )
             except Exception as e:
                 print(f"Warning: Could not load metadata from {tool_md}: {e}")
-                
+
+        if compiled != manifest:
+            _save_manifest(compiled)
         return entries
 
     def summaries(self) -> List[ToolSetSummary]:
         return list(self._entries)
 
-    def formatted_summaries(self) -> str:
+    def formatted_summaries(self, entries: Optional[List[ToolSetSummary]] = None) -> str:
         lines: List[str] = []
-        for entry in self._entries:
+        for entry in self._entries if entries is None else entries:
             lines.append(f"- {entry.name}: {entry.description}")
         return "\n".join(lines)
 
+    def formatted_tool_schemas(self, entries: Optional[List[ToolSetSummary]] = None) -> str:
+        """
+        渲染各工具的调用签名，供brain生成call_tool直接调用。
+        只使用已缓存（内存或磁盘）的签名，不在调用方的关键路径上启动工具集：
+        尚无缓存的工具集在后台线程中渲染，本次提示中暂不列出。
+        """
+        blocks: List[str] = []
+        pending: List[ToolSetSummary] = []
+        for entry in self._entries if entries is None else entries:
+            text = self._schema_text.get(entry.name)
+            if text is None:
+                text = self._persisted_schema(entry)
+                if text is None:
+                    pending.append(entry)
+                    continue
+                self._schema_text[entry.name] = text
+            if text:
+                blocks.append(text)
+        if pending:
+            self._render_schemas_in_background(pending)
+        return "\n".join(blocks)
+
+    def _toolset_dir(self, entry: ToolSetSummary) -> Path:
+        return _TOOLSETS_DIR / entry.module.rsplit(".", 1)[-1]
+
+    def _persisted_schema(self, entry: ToolSetSummary) -> Optional[str]:
+        with self._lock:
+            if self._persisted_schemas is None:
+                self._persisted_schemas = _load_json(_SCHEMAS_PATH)
+            record = self._persisted_schemas.get(entry.name)
+        if record is None:
+            return None
+        try:
+            stamp = _source_stamp(self._toolset_dir(entry))
+        except OSError:
+            return None
+        return record.get("text") if record.get("stamp") == stamp else None
+
+    def _render_schemas_in_background(self, entries: List[ToolSetSummary]) -> None:
+        with self._lock:
+            entries = [entry for entry in entries if entry.name not in self._rendering]
+            self._rendering.update(entry.name for entry in entries)
+        if not entries:
+            return
+
+        def render() -> None:
+            try:
+                for entry in entries:
+                    self.render_tool_schema(entry)
+            finally:
+                with self._lock:
+                    self._rendering.difference_update(entry.name for entry in entries)
+
+        threading.Thread(target=render, name="tool-schema-render", daemon=True).start()
+
+    def render_tool_schema(self, entry: ToolSetSummary) -> Optional[str]:
+        """ 创建工具集并渲染其工具签名（可能启动MCP服务器），结果缓存在内存并持久化到磁盘 """
+        try:
+            stamp = _source_stamp(self._toolset_dir(entry))
+        except OSError:
+            stamp = None
+        toolset = self.create(entry.name)
+        if toolset is None:
+            return None
+        try:
+            tools = toolset.get_tools()
+        except Exception as e:
+            print(f"Warning: Could not list tools of toolset '{entry.name}': {e}")
+            return None
+        lines = []
+        for tool in tools:
+            definition = tool.get_definition()
+            summary = " ".join((definition.get("description") or "").split())
+            if len(summary) > 160:
+                summary = summary[:160] + "…"
+            params = describe_parameters(definition.get("parameters") or {})
+            lines.append(f"- {entry.name}.{tool.name}({params})" + (f": {summary}" if summary else ""))
+        text = "\n".join(lines)
+        self._schema_text[entry.name] = text
+        if stamp is not None:
+            with self._lock:
+                if self._persisted_schemas is None:
+                    self._persisted_schemas = _load_json(_SCHEMAS_PATH)
+                self._persisted_schemas[entry.name] = {"stamp": stamp, "text": text}
+                _save_json(_SCHEMAS_PATH, self._persisted_schemas, "tool schemas")
+        return text
+
+    def formatted_tool_definitions(self, toolset: ToolSet, mode: str = "compact") -> str:
+        """
+        渲染工具集的工具定义及其引用资料，按工具集缓存；工具列表变化（重新配置、reset）后重新渲染。
+        mode: compact（最小化JSON并裁剪自动生成的Schema字段）、minified（仅最小化）或pretty（缩进JSON）。
+        """
+        if mode not in DEFINITION_MODES:
+            raise ValueError(f"Unknown tool definition mode '{mode}', expected one of {DEFINITION_MODES}")
+        tools = toolset.get_tools()
+        fingerprint = tuple(id(tool) for tool in tools)
+        key = (toolset.name, mode)
+        cached = self._definition_text.get(key)
+        if cached is not None and cached[0] == fingerprint:
+            return cached[1]
+        text = render_tool_definitions(tools, toolset.references(), mode)
+        self._definition_text[key] = (fingerprint, text)
+        return text
+
     def create(self, name: str) -> Optional[ToolSet]:
         entry = self.resolve(name)
         if not entry:
             return None
-        try:
-            module = import_module(entry.module)
-            toolset_class = getattr(module, entry.class_name)
-            return toolset_class()
-        except (ImportError, AttributeError):
-            return None
+        with self._lock:
+            instance = self._instances.get(entry.name)
+            if instance is not None:
+                return instance
+            try:
+                module = import_module(entry.module)
+                toolset_class = getattr(module, entry.class_name)
+                instance = toolset_class()
+                instance.configure(entry.options)
+            except (ImportError, AttributeError, ValueError) as e:
+                print(f"Warning: Could not create toolset '{entry.name}': {e}")
+                return None
+            self._instances[entry.name] = instance
+            return instance
+
+    def reset(self, name: Optional[str] = None) -> None:
+        """ 丢弃缓存的工具集实例，下次create时重新构建 """
+        with self._lock:
+            if name is None:
+                self._instances.clear()
+                self._schema_text.clear()
+                self._definition_text.clear()
+            else:
+                entry = self.resolve(name)
+                if entry:
+                    self._instances.pop(entry.name, None)
+                    self._schema_text.pop(entry.name, None)
+                    for key in [key for key in self._definition_text if key[0] == entry.name]:
+                        del self._definition_text[key]
 
     def resolve(self, name: str) -> Optional[ToolSetSummary]:
         for entry in self._entries:
@@ -85,13 +304,15 @@ class ToolRegistry:
         return None
 
     def match_by_keyword(self, text: str) -> Optional[ToolSetSummary]:
-        lowered = text.lower()
-        for entry in self._entries:
-            if any(keyword in lowered for keyword in entry.keywords):
-                return entry
-        return None
+        """ 在命中关键词的工具集中返回得分最高者，不再依赖条目顺序 """
+        match = self._router.best_keyword_match(text)
+        return match[0] if match else None
+
+    def rank(self, text: str, k: int = 3) -> List[Tuple[ToolSetSummary, float]]:
+        """ 按关键词命中与BM25得分返回最相关的k个工具集 """
+        return self._router.rank(text, k)
 
 
 registry = ToolRegistry()
 
-__all__ = ["ToolRegistry", "ToolSetSummary", "registry"]
+__all__ = ["DEFINITION_MODES", "ToolRegistry", "ToolSetSummary", "registry", "render_tool_definitions"]
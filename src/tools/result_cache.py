@@ -0,0 +1,309 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from src.tools.protocol import Tool, ToolFailure
+
+
+@dataclass(frozen=True)
+class CachePolicy:
+    """ 工具结果的缓存策略：ttl为None表示纯函数（相同参数永远得到相同结果），否则为有效秒数 """
+
+    ttl: Optional[float] = None
+
+    @property
+    def pure(self) -> bool:
+        return self.ttl is None
+
+
+def parse_cache_policy(value: Any) -> Optional[CachePolicy]:
+    """ 解析TOOL.md中的单个策略：pure、none/false、秒数、"ttl:600" 或 {ttl: 600} """
+    if value is None or value is False:
+        return None
+    if isinstance(value, bool):
+        return CachePolicy()
+    if isinstance(value, (int, float)):
+        return CachePolicy(ttl=float(value)) if value > 0 else None
+    if isinstance(value, Mapping):
+        if value.get("pure"):
+            return CachePolicy()
+        if "ttl" in value:
+            return parse_cache_policy(float(value["ttl"]))
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text == "pure":
+            return CachePolicy()
+        if text in ("none", "off", "false", "no"):
+            return None
+        if text.startswith("ttl:"):
+            return parse_cache_policy(float(text[4:]))
+    raise ValueError(f"Invalid cache policy {value!r}, expected 'pure', 'none', seconds or {{ttl: seconds}}")
+
+
+def parse_cache_option(option: Any) -> Dict[str, Optional[CachePolicy]]:
+    """
+    解析TOOL.md front matter中的cache选项，返回 {工具名: 策略}；
+    可以是整个工具集共用的单个策略（键为"*"），也可以按工具名分别声明。
+    """
+    if option is None:
+        return {}
+    if isinstance(option, Mapping) and not {"ttl", "pure"} & set(option):
+        return {str(name): parse_cache_policy(value) for name, value in option.items()}
+    return {"*": parse_cache_policy(option)}
+
+
+def policy_from_annotations(annotations: Optional[Mapping[str, Any]]) -> Optional[CachePolicy]:
+    """ MCP工具注解声明只读、幂等且不访问外部世界时，视为纯函数 """
+    if not annotations:
+        return None
+    if annotations.get("readOnlyHint") and annotations.get("idempotentHint") and annotations.get("openWorldHint") is False:
+        return CachePolicy()
+    return None
+
+
+def _canonical(value: Any) -> Any:
+    """ 规范化参数：整数值的浮点数按整数处理，元组按列表处理，字典键排序交给json.dumps """
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, (list, tuple)):
+        return [_canonical(item) for item in value]
+    if isinstance(value, Mapping):
+        return {str(key): _canonical(item) for key, item in value.items()}
+    return value
+
+
+def canonical_key(namespace: str, tool: str, arguments: Mapping[str, Any], version: str = "") -> str:
+    payload = json.dumps(_canonical(arguments), sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    h = hashlib.sha256()
+    for part in (namespace, tool, version, payload):
+        h.update(part.encode("utf-8", "surrogatepass"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class ToolResultCache:
+    """
+    工具结果缓存：内存LRU层 + 可选SQLite磁盘层。
+    键为工具集、工具名、版本与规范化参数的摘要；TTL策略的条目过期后视为未命中。
+    """
+
+    def __init__(self, max_entries: int = 1024, db_path: Optional[Path] = None, max_db_entries: int = 10000):
+        self._max_entries = max_entries
+        self._db_path = db_path
+        self._max_db_entries = max_db_entries
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, Tuple[str, Optional[float]]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._stats: Dict[str, int] = {"hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0, "expired": 0}
+        self._tool_stats: Dict[str, Dict[str, int]] = {}
+
+    # ---- 磁盘层 ----
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self._db_path is None:
+            return None
+        if self._db is None:
+            self._db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(self._db_path), check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, expires REAL, last_access REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_last_access ON results(last_access)")
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[str, Optional[float]]]:
+        db = self._connection()
+        if db is None:
+            return None
+        row = db.execute("SELECT result, expires FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= now:
+            db.execute("DELETE FROM results WHERE key = ?", (key,))
+            return None
+        db.execute("UPDATE results SET last_access = ? WHERE key = ?", (now, key))
+        return row[0], row[1]
+
+    def _disk_put(self, key: str, result: str, expires: Optional[float], now: float) -> None:
+        db = self._connection()
+        if db is None:
+            return
+        db.execute(
+            "INSERT OR REPLACE INTO results (key, result, expires, last_access) VALUES (?, ?, ?, ?)",
+            (key, result, expires, now),
+        )
+        count = db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        if count > self._max_db_entries:
+            db.execute("DELETE FROM results WHERE expires IS NOT NULL AND expires <= ?", (now,))
+            db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_access LIMIT ?)",
+                (max(0, count - self._max_db_entries),),
+            )
+
+    # ---- 公共接口 ----
+
+    def _count(self, tool: str, outcome: str) -> None:
+        self._stats[outcome] += 1
+        per_tool = self._tool_stats.setdefault(tool, {"hits": 0, "misses": 0})
+        if outcome in per_tool:
+            per_tool[outcome] += 1
+
+    def get(self, key: str, tool: str = "") -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None and item[1] is not None and item[1] <= now:
+                del self._memory[key]
+                self._stats["expired"] += 1
+                item = None
+            if item is None:
+                item = self._disk_get(key, now)
+                if item is not None:
+                    self._stats["disk_hits"] += 1
+                    self._memory[key] = item
+            if item is None:
+                self._count(tool, "misses")
+                return None
+            self._memory.move_to_end(key)
+            self._count(tool, "hits")
+            return item[0]
+
+    def put(self, key: str, result: str, policy: CachePolicy) -> None:
+        now = time.time()
+        expires = now + policy.ttl if policy.ttl is not None else None
+        with self._lock:
+            self._memory[key] = (result, expires)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self._max_entries:
+                self._memory.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._disk_put(key, result, expires, now)
+            self._stats["writes"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "memory_entries": len(self._memory),
+                "hit_rate": self._stats["hits"] / lookups if lookups else 0.0,
+                "tools": {name: dict(counts) for name, counts in self._tool_stats.items()},
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            db = self._connection()
+            if db is not None:
+                db.execute("DELETE FROM results")
+
+
+class CachedTool(Tool):
+    """ 按策略缓存被包装工具的执行结果；失败结果（ToolFailure、以Error开头的输出）与异常不会被缓存 """
+
+    def __init__(self, tool: Tool, policy: CachePolicy, cache: "ToolResultCache", namespace: str = "", version: str = ""):
+        self._tool = tool
+        self._policy = policy
+        self._cache = cache
+        self._namespace = namespace
+        self._version = version
+
+    @property
+    def name(self) -> str:
+        return self._tool.name
+
+    @property
+    def wrapped(self) -> Tool:
+        return self._tool
+
+    @property
+    def policy(self) -> CachePolicy:
+        return self._policy
+
+    def get_definition(self) -> Dict[str, Any]:
+        return self._tool.get_definition()
+
+    def warm_up(self) -> bool:
+        return self._tool.warm_up()
+
+    def execute(self, **kwargs) -> str:
+        key = canonical_key(self._namespace, self.name, kwargs, self._version)
+        label = f"{self._namespace}.{self.name}" if self._namespace else self.name
+        cached = self._cache.get(key, label)
+        if cached is not None:
+            return cached
+        result = self._tool.execute(**kwargs)
+        if isinstance(result, str) and not isinstance(result, ToolFailure) and not result.startswith("Error"):
+            self._cache.put(key, result, self._policy)
+        return result
+
+
+def apply_cache_policies(
+    tools: List[Tool],
+    policies: Mapping[str, Optional[CachePolicy]],
+    namespace: str = "",
+    version: str = "",
+    cache: Optional["ToolResultCache"] = None,
+) -> List[Tool]:
+    """
+    按声明包装工具：TOOL.md中按工具名声明的策略优先，其次是"*"默认策略，最后是MCP注解。
+    显式声明为none的工具不缓存；缓存被禁用时原样返回。
+    """
+    cache = tool_result_cache if cache is None else cache
+    if cache is None:
+        return tools
+    wrapped: List[Tool] = []
+    for tool in tools:
+        if tool.name in policies:
+            policy = policies[tool.name]
+        elif "*" in policies:
+            policy = policies["*"]
+        else:
+            policy = policy_from_annotations(getattr(tool, "annotations", None))
+        wrapped.append(CachedTool(tool, policy, cache, namespace, version) if policy else tool)
+    return wrapped
+
+
+def build_tool_result_cache() -> Optional[ToolResultCache]:
+    """
+    根据环境变量构造缓存：TOOL_CACHE=off|memory|disk（默认memory），
+    TOOL_CACHE_PATH为disk模式的SQLite文件路径。
+    """
+    mode = os.getenv("TOOL_CACHE", "memory").lower()
+    if mode in ("off", "false", "0", "none"):
+        return None
+    db_path = None
+    if mode == "disk":
+        default_path = Path(__file__).resolve().parent / "data" / "tool_results.sqlite3"
+        db_path = Path(os.getenv("TOOL_CACHE_PATH", str(default_path)))
+    return ToolResultCache(
+        max_entries=int(os.getenv("TOOL_CACHE_MAX_ENTRIES", "1024")),
+        db_path=db_path,
+    )
+
+
+# Global result cache instance
+tool_result_cache = build_tool_result_cache()
+
+__all__ = [
+    "CachePolicy",
+    "CachedTool",
+    "ToolResultCache",
+    "apply_cache_policies",
+    "canonical_key",
+    "parse_cache_option",
+    "parse_cache_policy",
+    "policy_from_annotations",
+    "tool_result_cache",
+]
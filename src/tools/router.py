@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter, deque
+from typing import Dict, Generic, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_LATIN_WORD = re.compile(r"[a-z0-9]+")
+_CJK_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\u3040-\u30ff\uac00-\ud7af]+")
+_STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it",
+    "of", "on", "or", "that", "the", "this", "to", "use", "when", "with",
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """ 英文按单词切分（去停用词），中日韩文本按单字+相邻双字切分 """
+    lowered = text.lower()
+    tokens = [word for word in _LATIN_WORD.findall(lowered) if word not in _STOPWORDS]
+    for run in _CJK_RUN.findall(lowered):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class AhoCorasick(Generic[T]):
+    """ 多模式子串匹配自动机：一次扫描文本即可找出所有命中的关键词 """
+
+    def __init__(self, patterns: Iterable[Tuple[str, T]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[str, T]]] = [[]]
+
+        for pattern, payload in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = nxt
+            self._output[state].append((pattern, payload))
+
+        # 广度优先构造失败指针
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def find(self, text: str) -> Iterator[Tuple[str, T]]:
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            yield from self._output[state]
+
+
+class ToolsetRouter(Generic[T]):
+    """
+    工具集路由：关键词自动机 + BM25。
+    BM25在description与keywords上打分，命中声明的关键词额外加权；索引只在构造时建立一次。
+    """
+
+    def __init__(self, entries: Sequence[T], k1: float = 1.5, b: float = 0.75, keyword_weight: float = 2.0):
+        self._entries = list(entries)
+        self._k1 = k1
+        self._b = b
+        self._keyword_weight = keyword_weight
+
+        keyword_owners: Dict[str, Set[int]] = {}
+        for i, entry in enumerate(self._entries):
+            for keyword in entry.keywords:
+                keyword_owners.setdefault(str(keyword).lower(), set()).add(i)
+        self._matcher: AhoCorasick[int] = AhoCorasick(
+            (keyword, i) for keyword, owners in keyword_owners.items() for i in owners
+        )
+        # 被越少工具集声明的关键词区分度越高
+        n = max(len(self._entries), 1)
+        self._keyword_idf = {
+            keyword: math.log(1 + n / len(owners)) for keyword, owners in keyword_owners.items()
+        }
+
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._doc_len: List[int] = []
+        for i, entry in enumerate(self._entries):
+            tokens = tokenize(" ".join([entry.description, *map(str, entry.keywords)]))
+            self._doc_len.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                self._postings.setdefault(token, []).append((i, tf))
+        self._avg_len = sum(self._doc_len) / n if self._doc_len else 0.0
+        self._idf = {
+            token: math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            for token, postings in self._postings.items()
+        }
+
+    def keyword_hits(self, text: str) -> Dict[int, Set[str]]:
+        hits: Dict[int, Set[str]] = {}
+        for keyword, i in self._matcher.find(text.lower()):
+            hits.setdefault(i, set()).add(keyword)
+        return hits
+
+    def _scores(self, text: str) -> Tuple[Dict[int, float], Dict[int, Set[str]]]:
+        scores: Dict[int, float] = {}
+        for token in set(tokenize(text)):
+            idf = self._idf.get(token)
+            if idf is None:
+                continue
+            for i, tf in self._postings[token]:
+                norm = self._k1 * (1 - self._b + self._b * self._doc_len[i] / (self._avg_len or 1))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (self._k1 + 1) / (tf + norm)
+
+        hits = self.keyword_hits(text)
+        for i, keywords in hits.items():
+            boost = sum(self._keyword_idf[keyword] for keyword in keywords)
+            scores[i] = scores.get(i, 0.0) + self._keyword_weight * boost
+        return scores, hits
+
+    def rank(self, text: str, k: int = 3) -> List[Tuple[T, float]]:
+        """ 返回得分最高的k个工具集及其得分（仅包含得分大于0的项） """
+        scores, _ = self._scores(text)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(self._entries[i], score) for i, score in ranked if score > 0]
+
+    def best_keyword_match(self, text: str) -> Optional[Tuple[T, float]]:
+        """ 在命中了声明关键词的工具集中取得分最高者 """
+        scores, hits = self._scores(text)
+        if not hits:
+            return None
+        best = max(hits, key=lambda i: (scores[i], -i))
+        return self._entries[best], scores[best]
+
+
+__all__ = ["AhoCorasick", "ToolsetRouter", "tokenize"]
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+from typing import Any, Dict, List
+
+_TYPE_CHECKS = {
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "array": lambda v: isinstance(v, (list, tuple)),
+    "object": lambda v: isinstance(v, dict),
+    "null": lambda v: v is None,
+}
+
+
+def validate_arguments(schema: Dict[str, Any], value: Any, path: str = "arguments") -> List[str]:
+    """
+    按工具定义中的JSON Schema子集（type/required/properties/items/enum/anyOf/additionalProperties）
+    校验参数，返回错误描述列表，为空表示通过。
+    """
+    if not schema:
+        return []
+
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            branches = [validate_arguments(branch, value, path) for branch in schema[key]]
+            if all(branches):
+                return [f"{path}: does not match any allowed schema ({branches[0][0]})"]
+            return []
+
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPE_CHECKS.get(t, lambda v: True)(value) for t in types):
+            return [f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"]
+
+    if "enum" in schema and value not in schema["enum"]:
+        return [f"{path}: must be one of {schema['enum']}"]
+
+    errors: List[str] = []
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(f"{path}.{name}: is required")
+        for name, item in value.items():
+            if name in properties:
+                errors.extend(validate_arguments(properties[name], item, f"{path}.{name}"))
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}.{name}: unexpected argument")
+    elif isinstance(value, (list, tuple)) and isinstance(schema.get("items"), dict):
+        for i, item in enumerate(value):
+            errors.extend(validate_arguments(schema["items"], item, f"{path}[{i}]"))
+    return errors
+
+
+# 由pydantic等自动生成、对选择工具没有帮助的Schema字段
+_PRUNED_KEYS = frozenset({"title", "$schema"})
+
+
+def prune_schema(schema: Any) -> Any:
+    """ 去掉自动生成的title等字段，保留类型、约束与描述；properties下的参数名不受影响 """
+    if isinstance(schema, list):
+        return [prune_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    pruned = {}
+    for key, value in schema.items():
+        if key == "properties" and isinstance(value, dict):
+            pruned[key] = {name: prune_schema(prop) for name, prop in value.items()}
+        elif key not in _PRUNED_KEYS:
+            pruned[key] = prune_schema(value)
+    return pruned
+
+
+def describe_schema(schema: Dict[str, Any]) -> str:
+    """ 把参数Schema渲染为紧凑的类型签名，例如 array<object{title: string}> """
+    if not schema:
+        return "any"
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            return " | ".join(describe_schema(branch) for branch in schema[key])
+    if "enum" in schema:
+        return " | ".join(repr(v) for v in schema["enum"])
+
+    expected = schema.get("type", "any")
+    if isinstance(expected, list):
+        return " | ".join(expected)
+    if expected == "array":
+        return f"array<{describe_schema(schema.get('items', {}))}>"
+    if expected == "object" and schema.get("properties"):
+        return f"object{{{describe_parameters(schema)}}}"
+    return expected
+
+
+def describe_parameters(schema: Dict[str, Any]) -> str:
+    """ 渲染对象Schema的参数列表，可选参数带?后缀 """
+    required = set(schema.get("required", []))
+    return ", ".join(
+        f"{name}{'' if name in required else '?'}: {describe_schema(prop)}"
+        for name, prop in schema.get("properties", {}).items()
+    )
+
+
+__all__ = ["validate_arguments", "prune_schema", "describe_schema", "describe_parameters"]
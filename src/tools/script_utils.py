@@ -1,23 +1,109 @@
 import subprocess
 import sys
-from typing import Any, Dict, List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 import json
 from src.tools.protocol import Tool
+from src.tools.worker_pool import ScriptUnsupportedError, ScriptWorkerError, script_worker_pool
+
+
+class ArrayFieldScanner:
+    """
+    增量扫描逐段到达的JSON文本（如LLM流式输出的工具选择），找到键为field的数组后，
+    每当一个元素完整到达就返回它，便于在模型输出完成前就开始处理已到达的元素。
+    head为数组开始前的文本补全为合法JSON后的解析结果（该数组记为[]），可据此提前得知工具与其余参数。
+    """
+
+    def __init__(self, field: str):
+        self._field = field
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._pending_key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self.head: Any = None
+        self.closed = False
+
+    def feed(self, chunk: str) -> List[Any]:
+        """ 追加一段文本，返回其中新完成的数组元素；文本无法解析时抛出ValueError """
+        self._text += chunk
+        items: List[Any] = []
+        text = self._text
+        while self._pos < len(text) and not self.closed:
+            i, char = self._pos, text[self._pos]
+            self._pos += 1
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start:i]
+                continue
+            if char.isspace():
+                continue
+            if self._array_depth is not None and len(self._stack) == self._array_depth and self._item_start is None and char not in ",]":
+                self._item_start = i
+            if char == '"':
+                self._in_string = True
+                self._string_start = i + 1
+            elif char == ":":
+                self._pending_key = self._last_string
+                continue
+            elif char in "{[":
+                if char == "[" and self._array_depth is None and self._pending_key == self._field:
+                    self.head = json.loads(text[:i] + "[]" + "".join("}" if c == "{" else "]" for c in reversed(self._stack)))
+                    self._array_depth = len(self._stack) + 1
+                self._stack.append(char)
+            elif char in "}]":
+                if not self._stack or self._stack.pop() != ("{" if char == "}" else "["):
+                    raise ValueError(f"unbalanced '{char}' at offset {i}")
+            if self._array_depth is not None and char in ",]" and len(self._stack) == self._array_depth - (char == "]"):
+                if self._item_start is not None:
+                    items.append(json.loads(text[self._item_start:i]))
+                    self._item_start = None
+                if char == "]":
+                    self.closed = True
+            self._pending_key = None
+        return items
 
 
 class CodeTool(Tool):
     """ 以Code的形式进行TOOL的执行 """
 
-    def __init__(self, name: str, description: str, script_path: str, parameters: Dict[str, Any]):
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        script_path: str,
+        parameters: Dict[str, Any],
+        timeout: Optional[float] = None,
+        stream_field: Optional[str] = None,
+    ):
         self._name = name
         self._description = description
         self._script_path = script_path
         self._parameters = parameters
+        self._timeout = timeout
+        # 可按NDJSON逐条流式传入的数组参数（脚本需提供run_stream与--ndjson模式）
+        self._stream_field = stream_field
 
     @property
     def name(self) -> str:
         return self._name
 
+    @property
+    def stream_field(self) -> Optional[str]:
+        return self._stream_field
+
     def get_definition(self) -> Dict[str, Any]:
         return {
             "name": self.name,
@@ -25,18 +111,130 @@ class CodeTool(Tool):
             "parameters": self._parameters,
         }
 
+    def warm_up(self) -> bool:
+        """ 预先启动常驻worker，使首次调用免去解释器启动与模块导入 """
+        return script_worker_pool.warm(self._script_path)
+
     def execute(self, **kwargs) -> str:
+        # 优先在常驻worker中执行；脚本未提供run(args)或池被禁用时回退到一次性子进程
+        if script_worker_pool.supports(self._script_path):
+            try:
+                return script_worker_pool.run(self._script_path, kwargs, self._timeout)
+            except ScriptUnsupportedError:
+                pass
+            except ScriptWorkerError as e:
+                return f"Error executing script: {e}"
+
+        if self._stream_field and isinstance(kwargs.get(self._stream_field), list):
+            # 经stdin传递，不受命令行参数长度限制
+            header = {key: value for key, value in kwargs.items() if key != self._stream_field}
+            return self._execute_once_stream(header, kwargs[self._stream_field])
+        return self._execute_once(kwargs)
+
+    def execute_many(self, calls: List[Dict[str, Any]], max_workers: int = 4) -> List[Tuple[str, float]]:
+        """
+        并发执行多次调用，分发到多个常驻worker（池被禁用时为多个一次性子进程）。
+        按输入顺序返回 (结果, 耗时秒数)。
+        """
+        if not calls:
+            return []
+        workers = max(1, min(max_workers, len(calls)))
+        script_worker_pool.ensure_size(self._script_path, workers)
+
+        def timed(kwargs: Dict[str, Any]) -> Tuple[str, float]:
+            start = time.perf_counter()
+            result = self.execute(**kwargs)
+            return result, time.perf_counter() - start
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"codetool-{self.name}") as executor:
+            return list(executor.map(timed, calls))
+
+    def execute_stream(self, items: Iterable[Any], return_bytes: bool = False, **header: Any) -> Union[str, bytes]:
+        """
+        流式执行：items（如stream_field对应的幻灯片）一边产生一边以NDJSON发送给脚本，
+        脚本随到随处理。return_bytes=True时脚本直接返回生成的文件内容，不经过磁盘。
+        """
+        if not self._stream_field:
+            raise ValueError(f"Tool '{self.name}' does not support streaming arguments")
+        if return_bytes:
+            header = {**header, "return_bytes": True}
+
+        if script_worker_pool.supports(self._script_path):
+            try:
+                return script_worker_pool.run_stream(self._script_path, header, items, self._timeout)
+            except ScriptUnsupportedError:
+                pass
+            except ScriptWorkerError as e:
+                return f"Error executing script: {e}"
+        return self._execute_once_stream(header, items)
+
+    def _execute_once(self, kwargs: Dict[str, Any]) -> str:
         input_json = json.dumps(kwargs, ensure_ascii=False)
-        
+
         try:
             result = subprocess.run(
                 [sys.executable, self._script_path, input_json],
                 capture_output=True,
                 text=True,
-                check=True
+                check=True,
+                timeout=self._timeout,
             )
             return result.stdout.strip()
         except subprocess.CalledProcessError as e:
             return f"Error executing script: {e.stderr}"
+        except subprocess.TimeoutExpired:
+            return f"Error executing script: timed out after {self._timeout}s"
         except Exception as e:
             return f"Unexpected error: {e}"
+
+    def _execute_once_stream(self, header: Dict[str, Any], items: Iterable[Any]) -> Union[str, bytes]:
+        """ 一次性子进程的流式模式：首行为header，之后每行一个条目，EOF表示结束 """
+        proc = subprocess.Popen(
+            [sys.executable, self._script_path, "--ndjson"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # 超时覆盖整个交换过程：脚本不再读取stdin时写入会一直阻塞，到时结束进程使写入失败返回
+        expired = threading.Event()
+
+        def expire() -> None:
+            expired.set()
+            proc.kill()
+
+        watchdog = threading.Timer(self._timeout, expire) if self._timeout else None
+        if watchdog is not None:
+            watchdog.daemon = True
+            watchdog.start()
+        try:
+            try:
+                for payload in self._ndjson_lines(header, items):
+                    proc.stdin.write(payload)
+                    proc.stdin.flush()
+            except BrokenPipeError:
+                pass  # 脚本提前退出或已被结束，结果以退出状态为准
+            stdout, stderr = proc.communicate()
+        except BaseException:
+            proc.kill()
+            proc.communicate()
+            raise
+        finally:
+            if watchdog is not None:
+                watchdog.cancel()
+
+        if expired.is_set():
+            return f"Error executing script: timed out after {self._timeout}s"
+        if proc.returncode != 0:
+            return f"Error executing script: {stderr.decode('utf-8', 'replace') or stdout.decode('utf-8', 'replace')}"
+        if header.get("return_bytes"):
+            return stdout
+        return stdout.decode("utf-8", "replace").strip()
+
+    @staticmethod
+    def _ndjson_lines(header: Dict[str, Any], items: Iterable[Any]) -> Iterator[bytes]:
+        yield (json.dumps(header, ensure_ascii=False) + "\n").encode("utf-8")
+        for item in items:
+            yield (json.dumps(item, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+__all__ = ["ArrayFieldScanner", "CodeTool"]
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set
+
+from src.tools.registry import ToolRegistry, registry
+
+
+@dataclass
+class WarmupResult:
+    """ 单个工具集的预热结果 """
+
+    name: str
+    ready: bool
+    seconds: float
+    error: Optional[str] = None
+
+
+class ToolsetWarmer:
+    """
+    工具集预热器：在后台线程中创建工具集、发现工具并启动其后端。
+    speculate()在brain思考期间按用户输入猜测可能用到的工具集提前预热，
+    finish()结束一轮推测并统计命中（被实际调用）与浪费的预热。
+    """
+
+    def __init__(self, tool_registry: ToolRegistry, max_workers: int = 4):
+        self._registry = tool_registry
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="toolset-warmup")
+        self._lock = threading.Lock()
+        self._futures: Dict[str, Future] = {}
+        self._warm: Set[str] = set()
+        self._speculated: Set[str] = set()
+        self._used: Set[str] = set()
+        self._stats: Dict[str, int] = {
+            "speculations": 0,
+            "speculated_toolsets": 0,
+            "speculation_hits": 0,
+            "speculation_misses": 0,
+            "speculation_wasted": 0,
+            "cancelled": 0,
+            "failures": 0,
+        }
+
+    def _warm_up(self, name: str) -> WarmupResult:
+        started = time.perf_counter()
+        try:
+            toolset = self._registry.create(name)
+            if toolset is None:
+                raise LookupError(f"toolset '{name}' could not be created")
+            ready = toolset.warm_up()
+            error = None if ready else "backend did not start"
+            if ready:
+                # 工具已发现，顺便缓存brain提示所需的工具签名
+                entry = self._registry.resolve(name)
+                if entry is not None:
+                    self._registry.render_tool_schema(entry)
+        except Exception as e:
+            ready, error = False, str(e)
+
+        with self._lock:
+            self._futures.pop(name, None)
+            if ready:
+                self._warm.add(name)
+            else:
+                self._stats["failures"] += 1
+        return WarmupResult(name=name, ready=ready, seconds=time.perf_counter() - started, error=error)
+
+    def warm(self, name: str) -> Optional[Future]:
+        """ 在后台预热工具集；已预热或正在预热时不重复提交 """
+        entry = self._registry.resolve(name)
+        if entry is None:
+            return None
+        with self._lock:
+            if entry.name in self._warm:
+                return None
+            future = self._futures.get(entry.name)
+            if future is None:
+                future = self._executor.submit(self._warm_up, entry.name)
+                self._futures[entry.name] = future
+            return future
+
+    def speculate(self, text: str, k: int = 2) -> List[str]:
+        """ 按用户输入排序出最可能用到的k个工具集并开始预热，返回其名称 """
+        names = [entry.name for entry, _ in self._registry.rank(text, k)]
+        with self._lock:
+            self._stats["speculations"] += 1
+            self._stats["speculated_toolsets"] += len(names)
+            self._speculated = set(names)
+            self._used = set()
+        for name in names:
+            self.warm(name)
+        return names
+
+    def mark_used(self, name: str) -> None:
+        entry = self._registry.resolve(name)
+        if entry is None:
+            return
+        with self._lock:
+            if entry.name not in self._used:
+                self._used.add(entry.name)
+                key = "speculation_hits" if entry.name in self._speculated else "speculation_misses"
+                self._stats[key] += 1
+
+    def finish(self) -> None:
+        """ 结束本轮推测：取消尚未开始的预热，统计未被使用的推测 """
+        with self._lock:
+            for name in self._speculated - self._used:
+                self._stats["speculation_wasted"] += 1
+                future = self._futures.get(name)
+                if future is not None and future.cancel():
+                    self._futures.pop(name, None)
+                    self._stats["cancelled"] += 1
+            self._speculated = set()
+            self._used = set()
+
+    def warm_all(self, names: Optional[List[str]] = None, timeout: Optional[float] = None) -> List[WarmupResult]:
+        """
+        同时预热给定（默认全部已注册）工具集并等待完成，返回每个工具集的就绪耗时与失败原因。
+        每个工具集一个线程，总耗时约等于最慢的那个；超过timeout仍未就绪的记为失败（后台继续启动）。
+        """
+        names = names or [entry.name for entry in self._registry.summaries()]
+        if not names:
+            return []
+        started = time.perf_counter()
+        executor = ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="toolset-warmup-all")
+        try:
+            futures = {name: executor.submit(self._warm_up, name) for name in names}
+            wait(futures.values(), timeout=timeout)
+        finally:
+            executor.shutdown(wait=False)
+
+        results = []
+        for name, future in futures.items():
+            if future.done():
+                results.append(future.result())
+            else:
+                results.append(WarmupResult(
+                    name=name, ready=False, seconds=time.perf_counter() - started, error=f"not ready after {timeout}s",
+                ))
+        return results
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            hits, wasted = self._stats["speculation_hits"], self._stats["speculation_wasted"]
+            return {
+                **self._stats,
+                "warm_toolsets": sorted(self._warm),
+                "speculation_hit_rate": hits / (hits + wasted) if hits + wasted else 0.0,
+            }
+
+
+# Global warmer instance
+toolset_warmer = ToolsetWarmer(registry, max_workers=max(1, int(os.getenv("WARMUP_CONCURRENCY", "4"))))
+
+__all__ = ["ToolsetWarmer", "WarmupResult", "toolset_warmer"]
@@ -0,0 +1,324 @@
+from __future__ import annotations
+
+import atexit
+import base64
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+_WORKER_MAIN = str(Path(__file__).resolve().parent / "_script_worker.py")
+
+
+class ScriptWorkerError(RuntimeError):
+    """ 脚本在worker中执行失败（脚本异常、超时或worker意外退出） """
+
+
+class ScriptTimeoutError(ScriptWorkerError):
+    """ 单次调用超过超时时间，worker已被强制结束 """
+
+
+class ScriptUnsupportedError(ScriptWorkerError):
+    """ 脚本没有提供run(args)入口，无法常驻执行，调用方应回退到一次性模式 """
+
+
+class _ScriptWorker:
+    """ 一个已导入脚本模块的常驻子进程，按行收发JSON """
+
+    def __init__(self, script_path: str, start_timeout: float):
+        self.script_path = script_path
+        self.jobs = 0
+        self.base_rss_kb: Optional[int] = None
+        self.rss_kb: Optional[int] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._proc = subprocess.Popen(
+            [sys.executable, _WORKER_MAIN, script_path],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+        )
+        self._reader = threading.Thread(target=self._read_lines, name="codetool-worker-reader", daemon=True)
+        self._reader.start()
+
+        hello = self._receive(start_timeout)
+        if not hello.get("ready"):
+            self.kill()
+            raise ScriptUnsupportedError(hello.get("error", "worker failed to start"))
+        self.base_rss_kb = self.rss_kb = hello.get("rss_kb")
+        # 脚本是否提供run_stream(header, items)
+        self.streaming = bool(hello.get("stream"))
+
+    def _read_lines(self) -> None:
+        for line in self._proc.stdout:
+            self._lines.put(line)
+        self._lines.put(None)
+
+    def _receive(self, timeout: Optional[float]) -> Dict[str, Any]:
+        try:
+            line = self._lines.get(timeout=timeout)
+        except queue.Empty:
+            self.kill()
+            raise ScriptTimeoutError(f"timed out after {timeout}s")
+        if line is None:
+            raise ScriptWorkerError(f"worker exited unexpectedly (code {self._proc.poll()})")
+        return json.loads(line)
+
+    @property
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def _send(self, payload: Any) -> None:
+        try:
+            self._proc.stdin.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            self._proc.stdin.flush()
+        except OSError as e:
+            self.kill()
+            raise ScriptWorkerError(f"worker pipe closed: {e}")
+
+    def _result(self, timeout: Optional[float]) -> Union[str, bytes]:
+        reply = self._receive(timeout)
+        self.jobs += 1
+        self.rss_kb = reply.get("rss_kb", self.rss_kb)
+        if not reply.get("ok"):
+            raise ScriptWorkerError(reply.get("error", "unknown error"))
+        if "output_b64" in reply:
+            return base64.b64decode(reply["output_b64"])
+        return reply.get("output", "")
+
+    def run(self, args: Dict[str, Any], timeout: Optional[float]) -> Union[str, bytes]:
+        self._send(args)
+        return self._result(timeout)
+
+    def run_stream(self, header: Dict[str, Any], items: Iterable[Any], timeout: Optional[float]) -> Union[str, bytes]:
+        """ 逐条发送items，worker边收边处理；生产方出错时通知worker中止后再抛出原异常 """
+        self._send({"__stream__": header})
+        try:
+            for item in items:
+                self._send({"item": item})
+        except ScriptWorkerError:
+            raise
+        except BaseException as e:
+            self._send({"abort": f"{type(e).__name__}: {e}"})
+            try:
+                self._result(timeout)
+            except ScriptWorkerError:
+                pass
+            raise
+        self._send({"end": True})
+        return self._result(timeout)
+
+    def rss_growth_mb(self) -> float:
+        if self.base_rss_kb is None or self.rss_kb is None:
+            return 0.0
+        return (self.rss_kb - self.base_rss_kb) / 1024
+
+    def kill(self) -> None:
+        if self._proc.poll() is None:
+            self._proc.kill()
+        try:
+            self._proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            pass
+        for stream in (self._proc.stdin, self._proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        # 关闭stdin让worker自然退出，超时再强制结束
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            pass
+        self.kill()
+
+
+class ScriptWorkerPool:
+    """
+    CodeTool脚本的常驻worker池：每个脚本最多size个预热进程，模块只导入一次。
+    worker在处理max_jobs次请求或内存增长超过max_rss_growth_mb后被回收重建。
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        max_jobs: int = 100,
+        max_rss_growth_mb: float = 512.0,
+        timeout: Optional[float] = 300.0,
+        start_timeout: float = 60.0,
+    ):
+        self._size = size
+        self._max_jobs = max_jobs
+        self._max_rss_growth_mb = max_rss_growth_mb
+        self._timeout = timeout
+        self._start_timeout = start_timeout
+        self._cond = threading.Condition()
+        self._idle: Dict[str, List[_ScriptWorker]] = {}
+        self._busy: Dict[str, int] = {}
+        self._unsupported: Dict[str, str] = {}
+        # 个别脚本（如批量生成）可使用比默认size更多的worker
+        self._sizes: Dict[str, int] = {}
+        self._stats: Dict[str, int] = {"jobs": 0, "errors": 0, "spawned": 0, "recycled": 0, "timeouts": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self._size > 0
+
+    def supports(self, script_path: str) -> bool:
+        return self.enabled and script_path not in self._unsupported
+
+    def ensure_size(self, script_path: str, size: int) -> None:
+        """ 允许该脚本最多同时使用size个worker（只增不减；池被禁用时不生效） """
+        with self._cond:
+            if self.enabled and size > self._sizes.get(script_path, self._size):
+                self._sizes[script_path] = size
+                self._cond.notify_all()
+
+    def _spawn(self, script_path: str) -> _ScriptWorker:
+        try:
+            worker = _ScriptWorker(script_path, self._start_timeout)
+        except ScriptUnsupportedError as e:
+            with self._cond:
+                self._unsupported[script_path] = str(e)
+            raise
+        with self._cond:
+            self._stats["spawned"] += 1
+        return worker
+
+    def _acquire(self, script_path: str) -> _ScriptWorker:
+        with self._cond:
+            while True:
+                idle = self._idle.setdefault(script_path, [])
+                while idle:
+                    worker = idle.pop()
+                    if worker.alive:
+                        self._busy[script_path] = self._busy.get(script_path, 0) + 1
+                        return worker
+                if self._busy.get(script_path, 0) < self._sizes.get(script_path, self._size):
+                    self._busy[script_path] = self._busy.get(script_path, 0) + 1
+                    break
+                self._cond.wait()
+
+        try:
+            return self._spawn(script_path)
+        except BaseException:
+            self._release(script_path, None)
+            raise
+
+    def _release(self, script_path: str, worker: Optional[_ScriptWorker]) -> None:
+        recycle = worker is not None and (
+            not worker.alive
+            or worker.jobs >= self._max_jobs
+            or worker.rss_growth_mb() > self._max_rss_growth_mb
+        )
+        with self._cond:
+            self._busy[script_path] -= 1
+            if worker is not None and not recycle:
+                self._idle.setdefault(script_path, []).append(worker)
+            elif recycle:
+                self._stats["recycled"] += 1
+            self._cond.notify()
+        if recycle:
+            worker.close()
+
+    def run(self, script_path: str, args: Dict[str, Any], timeout: Optional[float] = None) -> Union[str, bytes]:
+        """ 在常驻worker中执行脚本的run(args)，返回其输出文本 """
+        worker = self._acquire(script_path)
+        try:
+            output = worker.run(args, timeout if timeout is not None else self._timeout)
+            with self._cond:
+                self._stats["jobs"] += 1
+            return output
+        except ScriptWorkerError as e:
+            with self._cond:
+                self._stats["errors"] += 1
+                if isinstance(e, ScriptTimeoutError):
+                    self._stats["timeouts"] += 1
+            raise
+        finally:
+            self._release(script_path, worker)
+
+    def run_stream(
+        self,
+        script_path: str,
+        header: Dict[str, Any],
+        items: Iterable[Any],
+        timeout: Optional[float] = None,
+    ) -> Union[str, bytes]:
+        """
+        在常驻worker中执行脚本的run_stream(header, items)，items在产生的同时发给worker。
+        脚本没有run_stream时在消费items之前抛出ScriptUnsupportedError。
+        """
+        worker = self._acquire(script_path)
+        try:
+            if not worker.streaming:
+                raise ScriptUnsupportedError(f"{script_path} does not define run_stream(header, items)")
+            output = worker.run_stream(header, items, timeout if timeout is not None else self._timeout)
+            with self._cond:
+                self._stats["jobs"] += 1
+            return output
+        except ScriptUnsupportedError:
+            raise
+        except ScriptWorkerError as e:
+            with self._cond:
+                self._stats["errors"] += 1
+                if isinstance(e, ScriptTimeoutError):
+                    self._stats["timeouts"] += 1
+            raise
+        finally:
+            self._release(script_path, worker)
+
+    def warm(self, script_path: str) -> bool:
+        """ 预先启动一个worker；脚本不支持常驻模式时返回False """
+        if not self.supports(script_path):
+            return False
+        with self._cond:
+            if self._idle.get(script_path) or self._busy.get(script_path):
+                return True
+        try:
+            worker = self._acquire(script_path)
+        except ScriptWorkerError:
+            return False
+        self._release(script_path, worker)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                **self._stats,
+                "idle_workers": {path: len(workers) for path, workers in self._idle.items() if workers},
+                "unsupported": dict(self._unsupported),
+            }
+
+    def shutdown(self) -> None:
+        with self._cond:
+            workers = [worker for idle in self._idle.values() for worker in idle]
+            self._idle.clear()
+        for worker in workers:
+            worker.close()
+
+
+def _env_number(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Global worker pool instance; CODETOOL_WORKERS=0 disables pooling (one-shot subprocess mode)
+script_worker_pool = ScriptWorkerPool(
+    size=int(_env_number("CODETOOL_WORKERS", 2)),
+    max_jobs=int(_env_number("CODETOOL_WORKER_MAX_JOBS", 100)),
+    max_rss_growth_mb=_env_number("CODETOOL_WORKER_MAX_RSS_GROWTH_MB", 512.0),
+    timeout=_env_number("CODETOOL_TIMEOUT", 300.0),
+)
+atexit.register(script_worker_pool.shutdown)
+
+__all__ = ["ScriptWorkerError", "ScriptTimeoutError", "ScriptUnsupportedError", "ScriptWorkerPool", "script_worker_pool"]
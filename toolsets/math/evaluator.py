@@ -0,0 +1,213 @@
+"""
+Safe arithmetic expression evaluation for the math MCP server.
+
+Expressions are parsed with ``ast`` and only a whitelist of nodes is evaluated:
+numbers, + - * / // % **, unary +/-, parentheses, postfix ``!`` and a few
+functions. Integer arithmetic and division are exact (``fractions.Fraction``);
+results are bounded by a digit limit and the number of evaluation steps.
+"""
+
+import ast
+import math
+import operator
+from fractions import Fraction
+from typing import Callable, Dict, List, Union
+
+Number = Union[int, Fraction, float]
+
+_BINARY_OPS: Dict[type, Callable[[Number, Number], Number]] = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+}
+
+_UNARY_OPS: Dict[type, Callable[[Number], Number]] = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+}
+
+_LOG10_2 = math.log10(2)
+_LOG10_E = math.log10(math.e)
+
+
+class EvaluationError(ValueError):
+    """ 表达式不合法或超出了求值限制 """
+
+
+def _expand_factorials(expression: str) -> str:
+    """
+    把后缀 n! / (...)! / f(...)! 改写为 factorial(...)，以便交给Python解析器；
+    连续的!依次作用（5!! 即 (5!)!），!= 保持不变
+    """
+    out = []
+    for i, char in enumerate(expression):
+        if char != "!" or expression[i + 1:i + 2] == "=":
+            out.append(char)
+            continue
+        # 向前找到!所作用的操作数：数字或配对的括号
+        text = "".join(out).rstrip()
+        end = len(text)
+        if end and text[-1] == ")":
+            depth, start = 0, end - 1
+            while start >= 0:
+                depth += {")": 1, "(": -1}.get(text[start], 0)
+                if depth == 0:
+                    break
+                start -= 1
+            if start < 0:
+                raise EvaluationError("Unbalanced parentheses before '!'")
+            # 括号前紧跟的函数名属于操作数：abs(-3)! 是 factorial(abs(-3))
+            while start > 0 and (text[start - 1].isalnum() or text[start - 1] == "_"):
+                start -= 1
+        else:
+            start = end
+            while start > 0 and (text[start - 1].isdigit() or text[start - 1] in "._"):
+                start -= 1
+            if start == end:
+                raise EvaluationError("'!' must follow a number or a parenthesized expression")
+        out = list(text[:start] + f"factorial({text[start:end]})")
+    return "".join(out)
+
+
+class SafeEvaluator:
+    """ 基于AST白名单的算术求值器，不执行任何名称查找、属性访问或任意调用 """
+
+    def __init__(self, max_digits: int = 4000, max_steps: int = 1000, max_length: int = 2000):
+        self.max_digits = max_digits
+        self.max_steps = max_steps
+        self.max_length = max_length
+        self._functions: Dict[str, Callable[..., Number]] = {
+            "factorial": self._factorial,
+            "abs": abs,
+            "min": min,
+            "max": max,
+            "round": self._round,
+        }
+
+    # ---- 限制 ----
+
+    @staticmethod
+    def _digits(value: Number) -> float:
+        """ 精确数的十进制位数（分数取分子、分母中较大者），浮点数不受位数限制 """
+        if isinstance(value, float):
+            return 0.0
+        if isinstance(value, Fraction):
+            return max(abs(value.numerator).bit_length(), value.denominator.bit_length()) * _LOG10_2
+        return abs(value).bit_length() * _LOG10_2
+
+    @staticmethod
+    def _log10(value: Number) -> float:
+        if isinstance(value, Fraction):
+            return max(math.log10(abs(value.numerator)), math.log10(value.denominator))
+        return abs(math.log10(abs(value)))
+
+    def _check(self, value: Number) -> Number:
+        if self._digits(value) > self.max_digits:
+            raise EvaluationError(f"Intermediate result has more than {self.max_digits} digits")
+        if isinstance(value, float) and not math.isfinite(value):
+            raise EvaluationError("Result is not a finite number")
+        return value
+
+    def _factorial(self, n: Number) -> int:
+        if isinstance(n, Fraction) and n.denominator == 1:
+            n = n.numerator
+        if isinstance(n, float) and n.is_integer():
+            n = int(n)
+        if not isinstance(n, int) or n < 0:
+            raise EvaluationError("factorial() is only defined for integers >= 0")
+        if math.lgamma(n + 1) * _LOG10_E > self.max_digits:
+            raise EvaluationError(f"{n}! has more than {self.max_digits} digits")
+        return math.factorial(n)
+
+    def _round(self, value: Number, ndigits: int = 0) -> Number:
+        # round的耗时随|ndigits|增长（需要计算10**ndigits），不受步数与位数限制约束
+        ndigits = int(ndigits)
+        if abs(ndigits) > self.max_digits:
+            raise EvaluationError(f"round() ndigits must be between -{self.max_digits} and {self.max_digits}")
+        return round(Fraction(value) if isinstance(value, float) else value, ndigits)
+
+    def _power(self, base: Number, exponent: Number) -> Number:
+        if isinstance(exponent, Fraction) and exponent.denominator == 1:
+            exponent = exponent.numerator
+        if isinstance(exponent, int):
+            # 先按 |指数| * log10|底数| 估算结果位数，避免真正计算巨大的幂
+            if base not in (0, 1, -1) and not isinstance(base, float) and abs(exponent) * self._log10(base) > self.max_digits:
+                raise EvaluationError(f"Power result has more than {self.max_digits} digits")
+            if exponent < 0:
+                if base == 0:
+                    raise EvaluationError("Division by zero")
+                return Fraction(1) / Fraction(base) ** -exponent if not isinstance(base, float) else base ** exponent
+            return base ** exponent
+        try:
+            result = float(base) ** float(exponent)
+        except (OverflowError, ZeroDivisionError) as e:
+            raise EvaluationError(str(e))
+        if isinstance(result, complex):
+            raise EvaluationError("Result is not a real number")
+        return result
+
+    # ---- 求值 ----
+
+    def evaluate(self, expression: str) -> Number:
+        if len(expression) > self.max_length:
+            raise EvaluationError(f"Expression is longer than {self.max_length} characters")
+        source = _expand_factorials(expression.replace("^", "**").replace("×", "*").replace("÷", "/"))
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except (SyntaxError, RecursionError) as e:
+            raise EvaluationError(f"Invalid expression: {e.msg if isinstance(e, SyntaxError) else 'too deeply nested'}")
+        try:
+            # 步数计数器随每次求值新建，同一个求值器可被并发调用
+            result = self._eval(tree.body, [0])
+        except ZeroDivisionError:
+            raise EvaluationError("Division by zero")
+        except OverflowError:
+            raise EvaluationError("Result is too large")
+        except TypeError as e:
+            raise EvaluationError(f"Invalid arguments: {e}")
+        except RecursionError:
+            raise EvaluationError("Expression is too deeply nested")
+        if isinstance(result, Fraction) and result.denominator == 1:
+            return result.numerator
+        return result
+
+    def _eval(self, node: ast.AST, steps: List[int]) -> Number:
+        steps[0] += 1
+        if steps[0] > self.max_steps:
+            raise EvaluationError(f"Expression needs more than {self.max_steps} evaluation steps")
+
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return self._check(node.value)
+        if isinstance(node, ast.UnaryOp) and type(node.op) in _UNARY_OPS:
+            return _UNARY_OPS[type(node.op)](self._eval(node.operand, steps))
+        if isinstance(node, ast.BinOp):
+            left, right = self._eval(node.left, steps), self._eval(node.right, steps)
+            if isinstance(node.op, ast.Pow):
+                return self._check(self._power(left, right))
+            op = _BINARY_OPS.get(type(node.op))
+            if op is None:
+                raise EvaluationError(f"Operator '{type(node.op).__name__}' is not allowed")
+            if isinstance(node.op, ast.Div) and not isinstance(left, float) and not isinstance(right, float):
+                left = Fraction(left)
+            return self._check(op(left, right))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            function = self._functions.get(node.func.id)
+            if function is None:
+                raise EvaluationError(f"Function '{node.func.id}' is not allowed")
+            return self._check(function(*[self._eval(arg, steps) for arg in node.args]))
+        raise EvaluationError(f"'{type(node).__name__}' is not allowed in expressions")
+
+
+def format_number(value: Number) -> str:
+    """ 整数原样输出，非整数的分数按浮点数输出 """
+    if isinstance(value, Fraction):
+        value = value.numerator / value.denominator
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e16:
+        return str(int(value))
+    return str(value)
+
+
+__all__ = ["EvaluationError", "SafeEvaluator", "format_number"]
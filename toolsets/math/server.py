@@ -1,34 +1,115 @@
+import math
+import os
+import sys
+from typing import List
+
 from mcp.server.fastmcp import FastMCP
+from mcp.types import ToolAnnotations
+
+try:  # imported as toolsets.math.server (in-process transport)
+    from .evaluator import SafeEvaluator, format_number
+except ImportError:  # run as a script (stdio transport)
+    from evaluator import SafeEvaluator, format_number
 
 # Create an MCP server
 mcp = FastMCP("Math")
 
-@mcp.tool()
+# Deterministic, side-effect free: clients may cache results by arguments
+PURE = ToolAnnotations(readOnlyHint=True, idempotentHint=True, openWorldHint=False)
+
+# Results are sent back as decimal text; refuse anything that would take long to build or print.
+# Python also refuses to convert ints above sys.get_int_max_str_digits() to str.
+_STR_DIGITS_LIMIT = getattr(sys, "get_int_max_str_digits", lambda: 0)() or 1_000_000
+MAX_RESULT_DIGITS = min(int(os.getenv("MATH_MAX_RESULT_DIGITS", "4000")), _STR_DIGITS_LIMIT)
+MAX_BATCH_SIZE = int(os.getenv("MATH_MAX_BATCH_SIZE", "10000"))
+
+_evaluator = SafeEvaluator(
+    max_digits=MAX_RESULT_DIGITS,
+    max_steps=int(os.getenv("MATH_MAX_EVAL_STEPS", "1000")),
+)
+
+_LOG10_E = math.log10(math.e)
+
+
+def _factorial_digits(n: int) -> int:
+    """Number of decimal digits of n!, estimated with lgamma without computing it"""
+    return int(math.lgamma(n + 1) * _LOG10_E) + 1
+
+
+def _check_digits(value: int) -> int:
+    # Estimate the decimal digits from bit_length instead of converting to str
+    if value.bit_length() * 0.30103 > MAX_RESULT_DIGITS:
+        raise ValueError(f"Result has more than {MAX_RESULT_DIGITS} digits")
+    return value
+
+
+def _check_batch(*columns: List[int]) -> None:
+    if len({len(column) for column in columns}) > 1:
+        raise ValueError("Input lists must have the same length")
+    if columns and len(columns[0]) > MAX_BATCH_SIZE:
+        raise ValueError(f"At most {MAX_BATCH_SIZE} items per call")
+
+
+def _factorial(n: int) -> int:
+    if n < 0:
+        raise ValueError("Factorial is only defined for n >= 0")
+    if _factorial_digits(n) > MAX_RESULT_DIGITS:
+        raise ValueError(f"{n}! has more than {MAX_RESULT_DIGITS} digits")
+    return math.factorial(n)
+
+
+@mcp.tool(annotations=PURE)
 def add(a: int, b: int) -> int:
     """Add two numbers"""
-    return a + b
+    return _check_digits(a + b)
 
-@mcp.tool()
+@mcp.tool(annotations=PURE)
 def subtract(a: int, b: int) -> int:
     """Subtract b from a"""
-    return a - b
+    return _check_digits(a - b)
 
-@mcp.tool()
+@mcp.tool(annotations=PURE)
 def multiply(a: int, b: int) -> int:
     """Multiply two numbers"""
-    return a * b
+    return _check_digits(a * b)
 
-@mcp.tool()
+@mcp.tool(annotations=PURE)
 def factorial(n: int) -> int:
-    if n < 0:
-        raise ValueError("ERROR")
-    if n == 0 or n == 1:
-        return 1
-    
-    result = 1
-    for i in range(2, n + 1):
-        result *= i
-    return result
+    """Compute n! for n >= 0"""
+    return _factorial(n)
+
+@mcp.tool(annotations=PURE)
+def add_many(a: List[int], b: List[int]) -> List[int]:
+    """Element-wise a[i] + b[i] for two equally long lists. Use instead of repeated add calls."""
+    _check_batch(a, b)
+    return [_check_digits(x) for x in map(int.__add__, a, b)]
+
+@mcp.tool(annotations=PURE)
+def subtract_many(a: List[int], b: List[int]) -> List[int]:
+    """Element-wise a[i] - b[i] for two equally long lists. Use instead of repeated subtract calls."""
+    _check_batch(a, b)
+    return [_check_digits(x) for x in map(int.__sub__, a, b)]
+
+@mcp.tool(annotations=PURE)
+def multiply_many(a: List[int], b: List[int]) -> List[int]:
+    """Element-wise a[i] * b[i] for two equally long lists. Use instead of repeated multiply calls."""
+    _check_batch(a, b)
+    return [_check_digits(x) for x in map(int.__mul__, a, b)]
+
+@mcp.tool(annotations=PURE)
+def factorial_many(n: List[int]) -> List[int]:
+    """Compute n[i]! for every item of a list. Use instead of repeated factorial calls."""
+    _check_batch(n)
+    # Compute each distinct n once
+    results = {value: _factorial(value) for value in set(n)}
+    return [results[value] for value in n]
+
+@mcp.tool(annotations=PURE)
+def evaluate(expression: str) -> str:
+    """Evaluate a whole arithmetic expression in one call, e.g. "(12+15)*3 - 4!" or "2^10 / 3".
+    Supports + - * / // % ** (or ^), parentheses, postfix ! and factorial/abs/min/max/round.
+    Division is exact; prefer this over chaining single-operation tools."""
+    return format_number(_evaluator.evaluate(expression))
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')
@@ -1,10 +1,110 @@
 import json
+import os
+import time
 from pathlib import Path
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 from src.tools.protocol import Tool, ToolSet
 from src.tools.script_utils import CodeTool
 
+from .scripts.deck_files import output_path
+
+# Decks rendered in parallel by generate_pptx_batch, each in its own warm worker process
+PPTX_BATCH_WORKERS = int(os.getenv("PPTX_BATCH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PPTX_BATCH_MAX_DECKS = int(os.getenv("PPTX_BATCH_MAX_DECKS", "50"))
+
+SLIDES_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "title": {"type": "string"},
+            "bullet_points": {"type": "array", "items": {"type": "string"}},
+        },
+        "required": ["title", "bullet_points"],
+    },
+    "description": "A list of slide objects, each with a title and bullet points.",
+}
+
+
+class PptxBatchTool(Tool):
+    """Renders several decks at once by fanning them out over generate_pptx workers.
+    Each worker keeps its parsed template in memory, so only the first deck per
+    worker pays for loading it."""
+
+    def __init__(self, deck_tool: CodeTool, max_workers: int, max_decks: int):
+        self._deck_tool = deck_tool
+        self._max_workers = max_workers
+        self._max_decks = max_decks
+
+    @property
+    def name(self) -> str:
+        return "generate_pptx_batch"
+
+    def get_definition(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "description": "Generates several .pptx files in parallel, e.g. one deck per city or region. Each deck has the same shape as a generate_pptx_file call; prefer this over calling generate_pptx_file in a loop. Reports the time taken for every deck.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "decks": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "title": {"type": "string"},
+                                "slides": SLIDES_SCHEMA,
+                                "output_file": {"type": "string", "description": "Optional file name (no directories; decks are written to the working directory). Defaults to the title as a file name."},
+                            },
+                            "required": ["title", "slides"],
+                        },
+                    },
+                    "template": {
+                        "type": "string",
+                        "description": "Optional path to a .pptx template whose masters and layouts every deck uses.",
+                    },
+                },
+                "required": ["decks"],
+            },
+        }
+
+    def warm_up(self) -> bool:
+        return self._deck_tool.warm_up()
+
+    def execute(self, decks: List[Dict[str, Any]], template: Optional[str] = None, **kwargs) -> str:
+        if not decks:
+            return "Error: no decks given"
+        if len(decks) > self._max_decks:
+            return f"Error: at most {self._max_decks} decks per call"
+        if template and not os.path.isfile(template):
+            return f"Error: template not found: {template}"
+
+        # Compare the files the script will actually write (titles are sanitized into
+        # file names), so two decks can never overwrite each other
+        seen = set()
+        for deck in decks:
+            try:
+                target = output_path(deck)
+            except ValueError as e:
+                return f"Error: {e}"
+            key = os.path.normcase(target)
+            if key in seen:
+                return f"Error: two decks would be written to the same file ('{target}'); give them distinct titles or output_file values"
+            seen.add(key)
+
+        calls = [{**deck, "template": template} if template else deck for deck in decks]
+        workers = min(self._max_workers, len(calls))
+        start = time.perf_counter()
+        results = self._deck_tool.execute_many(calls, max_workers=workers)
+        elapsed = time.perf_counter() - start
+
+        succeeded = sum(1 for output, _ in results if output.startswith("Successfully"))
+        lines = [f"Generated {succeeded} of {len(results)} decks in {elapsed:.2f}s using {workers} worker(s):"]
+        for deck, (output, seconds) in zip(decks, results):
+            lines.append(f"- {deck.get('title', 'Presentation')}: {output} ({seconds:.2f}s)")
+        return "\n".join(lines)
+
 
 class PptxToolSet(ToolSet):
     """Toolset for creating PowerPoint presentations."""
@@ -13,41 +113,31 @@ class PptxToolSet(ToolSet):
         self._toolset_dir = Path(__file__).resolve().parent
         self._load_metadata()
         
-        # Load guidelines to enhance the tool description
+        # Guidelines are attached once as a reference instead of being embedded in the description
         guidelines_path = self._toolset_dir / "outline_guidelines.md"
-        guidelines = ""
+        self._references: Dict[str, str] = {}
         if guidelines_path.exists():
-            guidelines = f"\n\nGuidelines:\n{guidelines_path.read_text(encoding='utf-8')}"
-
-        self._tools = [
-            CodeTool(
-                name="generate_pptx_file",
-                description=f"Generates a .pptx file from a structured JSON outline of slides. IMPORTANT: The input 'slides' must be a JSON array where each object has 'title' and 'bullet_points'. If the user provides raw text content, YOU (the LLM) MUST parse it into this JSON structure before calling this tool.{guidelines}",
-                script_path=str(self._toolset_dir / "scripts" / "generate_pptx.py"),
-                parameters={
-                    "type": "object",
-                    "properties": {
-                        "title": {
-                            "type": "string",
-                            "description": "The main title of the presentation.",
-                        },
-                        "slides": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "title": {"type": "string"},
-                                    "bullet_points": {"type": "array", "items": {"type": "string"}},
-                                },
-                                "required": ["title", "bullet_points"],
-                            },
-                            "description": "A list of slide objects, each with a title and bullet points.",
-                        },
+            self._references["outline_guidelines"] = guidelines_path.read_text(encoding="utf-8")
+        guidelines = " Follow the [outline_guidelines] reference when structuring slides." if self._references else ""
+
+        deck_tool = CodeTool(
+            name="generate_pptx_file",
+            description=f"Generates a .pptx file from a structured JSON outline of slides. IMPORTANT: The input 'slides' must be a JSON array where each object has 'title' and 'bullet_points'. If the user provides raw text content, YOU (the LLM) MUST parse it into this JSON structure before calling this tool.{guidelines}",
+            script_path=str(self._toolset_dir / "scripts" / "generate_pptx.py"),
+            parameters={
+                "type": "object",
+                "properties": {
+                    "title": {
+                        "type": "string",
+                        "description": "The main title of the presentation.",
                     },
-                    "required": ["title", "slides"],
-                }
-            )
-        ]
+                    "slides": SLIDES_SCHEMA,
+                },
+                "required": ["title", "slides"],
+            },
+            stream_field="slides",
+        )
+        self._tools = [deck_tool, PptxBatchTool(deck_tool, PPTX_BATCH_WORKERS, PPTX_BATCH_MAX_DECKS)]
 
     def _load_metadata(self):
         # This would typically parse TOOL.md front matter
@@ -70,3 +160,6 @@ class PptxToolSet(ToolSet):
     def get_tools(self) -> List[Tool]:
         return self._tools
 
+    def references(self) -> Dict[str, str]:
+        return self._references
+
@@ -0,0 +1,29 @@
+"""Output file names for generated decks.
+
+Shared by generate_pptx.py, which writes the deck, and the generate_pptx_batch
+tool, which checks that no two decks of a batch are written to the same file.
+Kept free of python-pptx so the agent process can import it.
+"""
+import os
+import re
+
+
+def safe_filename(text: str) -> str:
+    sanitized = re.sub(r"[^0-9A-Za-z\u4e00-\u9fa5]+", "_", text)
+    return sanitized.strip("_") or "presentation"
+
+
+def output_path(args) -> str:
+    """The file a deck is written to. Decks always go to the working directory:
+    `output_file` must be a plain file name, and defaults to the sanitized title."""
+    output_file = args.get("output_file")
+    if not output_file:
+        return f"{safe_filename(args.get('title', 'Presentation'))}.pptx"
+    output_file = str(output_file)
+    if (
+        output_file in (".", "..")
+        or os.path.basename(output_file) != output_file
+        or (os.altsep and os.altsep in output_file)
+    ):
+        raise ValueError(f"output_file must be a file name without directories, got {output_file!r}")
+    return output_file
@@ -1,4 +1,7 @@
+import copy
+import io
 import json
+import os
 import sys
 
 try:
@@ -8,6 +11,23 @@ except ModuleNotFoundError as exc:  # pragma: no cover
         "python-pptx 未安装。请先运行 `pip install python-pptx` 后再重试。"
     ) from exc
 
+from deck_files import output_path
+
+
+# Parsed templates, kept for the life of the (warm worker) process:
+# (path, mtime_ns) -> Presentation. None is python-pptx's built-in default template.
+_templates = {}
+
+
+def _new_presentation(template=None):
+    """Return a fresh deck based on `template`: the template is parsed once per
+    process and each deck is a deep copy of the cached one."""
+    key = (os.path.abspath(template), os.stat(template).st_mtime_ns) if template else None
+    prs = _templates.get(key)
+    if prs is None:
+        prs = _templates[key] = Presentation(template)
+    return copy.deepcopy(prs)
+
 
 def _format_bullets(slide_data):
     bullets = slide_data.get("bullet_points")
@@ -19,28 +39,84 @@ def _format_bullets(slide_data):
     return ""
 
 
-def generate_pptx(title, slides, output_file):
-    prs = Presentation()
-    slide_layout = prs.slide_layouts[0]
-    slide = prs.slides.add_slide(slide_layout)
+def _add_title_slide(prs, title):
+    slide = prs.slides.add_slide(prs.slide_layouts[0])
     slide.shapes.title.text = title
     subtitle = slide.placeholders[1]
     subtitle.text = "Auto-generated by Agent PPTX pipeline"
 
-    for slide_data in slides:
-        layout = prs.slide_layouts[1]
-        slide = prs.slides.add_slide(layout)
-        slide.shapes.title.text = slide_data.get("title", "Untitled Slide")
-        slide.placeholders[1].text = _format_bullets(slide_data)
 
+def _add_content_slide(prs, slide_data):
+    slide = prs.slides.add_slide(prs.slide_layouts[1])
+    slide.shapes.title.text = slide_data.get("title", "Untitled Slide")
+    slide.placeholders[1].text = _format_bullets(slide_data)
+
+
+def generate_pptx(title, slides, output_file, template=None):
+    """Build the deck slide by slide; `slides` may be any iterable (e.g. a stream)
+    and `output_file` a path or a binary file object."""
+    prs = _new_presentation(template)
+    _add_title_slide(prs, title)
+    for slide_data in slides:
+        _add_content_slide(prs, slide_data)
     prs.save(output_file)
 
 
+def run(args):
+    """CodeTool entry point, also used by the warm worker pool."""
+    title = args.get("title", "Presentation")
+    slides = args.get("slides", [])
+
+    try:
+        output_file = output_path(args)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    generate_pptx(title, slides, output_file, args.get("template"))
+    return f"Successfully generated PPTX file: {output_file}"
+
+
+def run_stream(header, slides):
+    """Streaming entry point: `slides` yields one slide object at a time and each one
+    is added as soon as it arrives. With header["return_bytes"] the deck is returned
+    as bytes instead of being written to disk."""
+    title = header.get("title", "Presentation")
+    if header.get("return_bytes"):
+        buffer = io.BytesIO()
+        generate_pptx(title, slides, buffer, header.get("template"))
+        return buffer.getvalue()
+
+    try:
+        output_file = output_path(header)
+    except ValueError as e:
+        return f"Error: {e}"
+    generate_pptx(title, slides, output_file, header.get("template"))
+    return f"Successfully generated PPTX file: {output_file}"
+
+
+def _read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
 if __name__ == "__main__":
-    import re
-    
+    # python generate_pptx.py --ndjson < header line, then one slide object per line
+    if len(sys.argv) == 2 and sys.argv[1] == "--ndjson":
+        try:
+            header = json.loads(sys.stdin.readline() or "{}")
+            result = run_stream(header, _read_ndjson(sys.stdin))
+        except json.JSONDecodeError:
+            print("Error: Invalid NDJSON input")
+            sys.exit(1)
+        if isinstance(result, bytes):
+            sys.stdout.buffer.write(result)
+        else:
+            print(result)
+        sys.exit(0)
+
     if len(sys.argv) != 2:
-        print("Usage: python generate_pptx.py <json_args>")
+        print("Usage: python generate_pptx.py <json_args> | --ndjson")
         sys.exit(1)
 
     try:
@@ -49,17 +125,4 @@ if __name__ == "__main__":
         print("Error: Invalid JSON argument")
         sys.exit(1)
 
-    title = args.get("title", "Presentation")
-    slides = args.get("slides", [])
-    
-    # Generate output filename
-    def _safe_filename(text: str) -> str:
-        sanitized = re.sub(r"[^0-9A-Za-z\u4e00-\u9fa5]+", "_", text)
-        return sanitized.strip("_") or "presentation"
-
-    output_name = _safe_filename(title)
-    output_file = f"{output_name}.pptx"
-    
-    generate_pptx(title, slides, output_file)
-    print(f"Successfully generated PPTX file: {output_file}")
-
+    print(run(args))
@@ -1,13 +1,9 @@
-import asyncio
-import sys
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
-from mcp import ClientSession
-from mcp.client.stdio import stdio_client, StdioServerParameters
-
-from src.tools.mcp_utils import MCPTool
+from src.tools.mcp_utils import TRANSPORTS, build_server_params, load_mcp_tools
 from src.tools.protocol import Tool, ToolSet
+from src.tools.result_cache import CachePolicy, apply_cache_policies, parse_cache_option
 
 
 class WeatherToolSet(ToolSet):
@@ -16,11 +12,13 @@ class WeatherToolSet(ToolSet):
     def __init__(self):
         self._toolset_dir = Path(__file__).resolve().parent
         self._load_metadata()
+        self._transport = "stdio"
+        self._cache_policies: Dict[str, Optional[CachePolicy]] = {}
         self._tools: List[Tool] = []
 
     def _load_metadata(self):
         self._name = "weather"
-        self._description = "Get current weather information for a city."
+        self._description = "Get current weather information for one city or several cities at once."
         self._keywords = ["weather", "temperature", "forecast", "天气", "温度", "气温"]
 
     @property
@@ -35,34 +33,30 @@ class WeatherToolSet(ToolSet):
     def keywords(self) -> List[str]:
         return self._keywords
 
+    def configure(self, options: Dict[str, Any]) -> None:
+        transport = options.get("transport", "stdio")
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Unknown transport '{transport}' for toolset '{self._name}'")
+        cache_policies = parse_cache_option(options.get("cache"))
+        if transport != self._transport or cache_policies != self._cache_policies:
+            self._transport = transport
+            self._cache_policies = cache_policies
+            self._tools = []
+
     def get_tools(self) -> List[Tool]:
         if not self._tools:
-            self._tools = self._load_mcp_tools()
+            self._tools = apply_cache_policies(
+                self._load_mcp_tools(),
+                self._cache_policies,
+                namespace=self._name,
+                version=str((self._toolset_dir / "server.py").stat().st_mtime_ns),
+            )
         return self._tools
 
     def _load_mcp_tools(self) -> List[Tool]:
         server_script = self._toolset_dir / "server.py"
-        server_params = StdioServerParameters(
-            command=sys.executable,
-            args=[str(server_script)],
-            env=None
+        server_params = build_server_params(
+            server_script, f"{__name__}.server", self._transport, env_prefixes=("WEATHER_",)
         )
 
-        async def _fetch_tools():
-            async with stdio_client(server_params) as (read, write):
-                async with ClientSession(read, write) as session:
-                    await session.initialize()
-                    tools_result = await session.list_tools()
-                    return [
-                        MCPTool(t.name, t.description, t.inputSchema, server_params)
-                        for t in tools_result.tools
-                    ]
-        
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-        return loop.run_until_complete(_fetch_tools())
-
+        return load_mcp_tools(server_params, server_script)
@@ -1,43 +1,150 @@
+import asyncio
+import importlib.util
+import os
+import time
+import weakref
+from typing import Dict, List, Tuple
+
 import httpx
 from mcp.server.fastmcp import FastMCP
+from mcp.server.fastmcp.exceptions import ToolError
+from mcp.types import ToolAnnotations
 
 # Create an MCP server
 mcp = FastMCP("Weather")
 
-@mcp.tool()
-async def get_weather(city: str) -> str:
+# Upstream endpoint (OpenWeatherMap current weather by default). Point WEATHER_API_URL
+# at a local stub server for tests; the key is only sent when configured.
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://api.openweathermap.org/data/2.5/weather")
+WEATHER_API_KEY = os.getenv("WEATHER_API_KEY", "")
+WEATHER_UNITS = os.getenv("WEATHER_UNITS", "metric")
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "10"))
+WEATHER_MAX_CONCURRENCY = max(1, int(os.getenv("WEATHER_MAX_CONCURRENCY", "8")))
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "120"))
+WEATHER_MAX_CITIES = int(os.getenv("WEATHER_MAX_CITIES", "50"))
+
+# HTTP/2 needs the optional h2 package
+_HTTP2 = importlib.util.find_spec("h2") is not None
+
+LOOKUP = ToolAnnotations(readOnlyHint=True, idempotentHint=True, openWorldHint=True)
+
+
+class _WeatherClient:
     """
-    Get the current weather for a given city using OpenWeatherMap.请在下方填入您的API Key。
+    Keep-alive HTTP client shared by all lookups on one event loop, with bounded
+    concurrency, a short per-city cache and coalescing of identical in-flight lookups.
     """
-    
-    api_key = "" 
-    url = f""
-    
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
-            # print(f"OpenWeatherMap Response Status: {response.status_code}")
-            
+
+    def __init__(self):
+        self.client = httpx.AsyncClient(
+            http2=_HTTP2,
+            timeout=WEATHER_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=WEATHER_MAX_CONCURRENCY,
+                max_keepalive_connections=WEATHER_MAX_CONCURRENCY,
+            ),
+        )
+        self.semaphore = asyncio.Semaphore(WEATHER_MAX_CONCURRENCY)
+        self.cache: Dict[str, Tuple[float, str]] = {}
+        self.in_flight: Dict[str, "asyncio.Future[Tuple[str, bool]]"] = {}
+
+    async def lookup(self, city: str) -> Tuple[str, bool]:
+        """Returns (text, ok); only successful lookups are cached."""
+        key = " ".join(city.split()).casefold()
+        cached = self.cache.get(key)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1], True
+
+        future = self.in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._resolve(key, city))
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # shield: a caller that gives up must not cancel the lookup other callers share
+        return await asyncio.shield(future)
+
+    async def _resolve(self, key: str, city: str) -> Tuple[str, bool]:
+        text, ok = await self._fetch(city)
+        if ok and WEATHER_CACHE_TTL > 0:
+            now = time.monotonic()
+            if len(self.cache) >= 1024:
+                self.cache = {k: v for k, v in self.cache.items() if v[0] > now}
+            self.cache[key] = (now + WEATHER_CACHE_TTL, text)
+        return text, ok
+
+    async def _fetch(self, city: str) -> Tuple[str, bool]:
+        """Returns (text, ok)."""
+        params = {"q": city, "units": WEATHER_UNITS}
+        if WEATHER_API_KEY:
+            params["appid"] = WEATHER_API_KEY
+        try:
+            async with self.semaphore:
+                response = await self.client.get(WEATHER_API_URL, params=params)
+
             if response.status_code == 404:
-                return f"未找到城市 '{city}'，请检查拼写。"
+                return f"未找到城市 '{city}'，请检查拼写。", False
             response.raise_for_status()
             data = response.json()
-            
+
             city_name = data.get("name", city)
             temp = data.get("main", {}).get("temp", "N/A")
             weather_desc = "N/A"
             if data.get("weather"):
                 weather_desc = data["weather"][0].get("description", "N/A")
-            
+
             return (
                 f"城市: {city_name}\n"
                 f"天气: {weather_desc}\n"
                 f"温度: {temp}°C"
-            )
-    except httpx.HTTPStatusError as e:
-        return f"API 请求失败，状态码: {e.response.status_code}"
-    except Exception as e:
-        return f"获取天气时发生错误: {str(e)}"
+            ), True
+        except httpx.HTTPStatusError as e:
+            return f"API 请求失败，状态码: {e.response.status_code}", False
+        except Exception as e:
+            return f"获取天气时发生错误: {str(e)}", False
+
+
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _WeatherClient]" = weakref.WeakKeyDictionary()
+
+
+def _client() -> _WeatherClient:
+    # httpx connections and asyncio primitives belong to the loop that created them:
+    # one client per running loop (stdio runs one loop, the in-process pool another)
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.client.is_closed:
+        client = _clients[loop] = _WeatherClient()
+    return client
+
+
+@mcp.tool(annotations=LOOKUP)
+async def get_weather(city: str) -> str:
+    """
+    Get the current weather for a given city using OpenWeatherMap.
+    Set WEATHER_API_KEY (and optionally WEATHER_API_URL) in the environment.
+    """
+    text, ok = await _client().lookup(city)
+    if not ok:
+        # reported as an MCP error (isError) so clients do not cache it
+        raise ToolError(text)
+    return text
+
+
+@mcp.tool(annotations=LOOKUP)
+async def get_weather_many(cities: List[str]) -> str:
+    """
+    Get the current weather for several cities at once; lookups run concurrently.
+    Prefer this over calling get_weather once per city.
+    """
+    if len(cities) > WEATHER_MAX_CITIES:
+        raise ValueError(f"At most {WEATHER_MAX_CITIES} cities per call")
+    client = _client()
+    results = await asyncio.gather(*(client.lookup(city) for city in cities))
+    text = "\n\n".join(result for result, _ in results)
+    if not all(ok for _, ok in results):
+        # a partial failure is an error too; the text still carries the cities that succeeded
+        raise ToolError(text)
+    return text
+
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')